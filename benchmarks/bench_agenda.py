@@ -0,0 +1,106 @@
+"""
+Recurring schedule expansion for the briefing and agenda views: the old per-day string
+matching ('mon' in 'mon,wed' + re-parsing 'HH:MM' to sort) vs recurrence.expand() on
+days_mask / minute_of_day, with the plain loop and (if installed) NumPy.
+
+Usage: python benchmarks/bench_agenda.py [--users 20000] [--schedules 5] [--days 7]
+Runs against a throwaway database in a temp directory.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database
+import recurrence
+
+# --- Old expansion: day codes as strings, time parsed on every sort ---
+
+def legacy_expand(start, days, schedules):
+    by_day = []
+    schedule_days = [(r, {d.strip() for d in r['days_of_week'].split(',') if d.strip()}) for r in schedules]
+    for offset in range(days):
+        current = start + timedelta(days=offset)
+        date_str = current.isoformat()
+        day_code = recurrence.DAY_CODES[current.weekday()]
+        todays = [r for r, codes in schedule_days if day_code in codes and (not r['end_date'] or r['end_date'] >= date_str)]
+        by_day.append(sorted(todays, key=lambda r: _legacy_time_key(r['time'])))
+    return by_day
+
+def _legacy_time_key(time_str):
+    try:
+        h, m = map(int, time_str.split(':'))
+        return (h, m)
+    except (AttributeError, ValueError):
+        return (24, 0)
+
+def new_expand(start, days, schedules):
+    by_day = database._recurring_by_day(start, days, schedules)
+    return [[schedules[i] for i in indexes] for indexes in by_day]
+
+def _seed(users, per_user, rng):
+    today = date.today()
+    rows = []
+    for user_id in range(users):
+        for k in range(per_user):
+            days = ",".join(code for code in recurrence.DAY_CODES if rng.random() < 0.4) or "mon"
+            minute = rng.randrange(6 * 60, 23 * 60)
+            end = (today + timedelta(days=rng.randrange(1, 60))).isoformat() if rng.random() < 0.2 else None
+            time_text = f"{minute // 60:02d}:{minute % 60:02d}"
+            rows.append((user_id, f"việc {k}", days, time_text, end, f"viec {k}",
+                         recurrence.days_to_mask(days), minute))
+    conn = database.get_connection()
+    with conn:
+        conn.executemany('''INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, description_key,
+                                                             days_mask, minute_of_day)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+def _timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--schedules", type=int, default=5, help="recurring schedules per user")
+    parser.add_argument("--days", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.init_db()
+        _seed(args.users, args.schedules, random.Random(1))
+        schedules = [database._schedule_from_row(*row) for row in database.get_connection().execute(
+            f"SELECT {database._SCHEDULE_COLUMNS} FROM recurring_schedules")]
+        start = date.today()
+        numpy = recurrence.np
+        print(f"{len(schedules)} recurring schedules ({args.users} users), NumPy {'installed' if numpy else 'not installed'}")
+
+        for days in (1, args.days):
+            legacy_time, expected = _timed(lambda: legacy_expand(start, days, schedules))
+            recurrence.np = None
+            loop_time, result = _timed(lambda: new_expand(start, days, schedules))
+            assert result == expected
+            line = f"{days} day(s): string match {legacy_time * 1000:.1f} ms, bitmask loop {loop_time * 1000:.1f} ms"
+            if numpy is not None:
+                recurrence.np = numpy
+                array_time, result = _timed(lambda: new_expand(start, days, schedules))
+                assert result == expected
+                line += f", NumPy {array_time * 1000:.1f} ms"
+            print(line)
+
+        recurrence.np = numpy
+        briefing_time, agendas = _timed(lambda: database.get_all_agendas(start.isoformat(), (start + timedelta(days=1)).isoformat()))
+        print(f"get_all_agendas (briefing, {len(agendas)} users): {briefing_time * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Micro-benchmark for database.py: connect-per-call (old) vs pooled WAL connection (new).
+
+Usage: python benchmarks/bench_database.py [--ops 5000]
+Runs against a throwaway database in a temp directory.
+"""
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database
+
+
+# --- Old access pattern: open, run one statement, close ---
+
+def legacy_add_task(db_path, user_id, description, schedule_time):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("INSERT INTO tasks (user_id, description, schedule_time, status, created_at) VALUES (?, ?, ?, ?, ?)",
+              (user_id, description, schedule_time, 'pending', datetime.now().isoformat()))
+    conn.commit()
+    conn.close()
+
+def legacy_get_tasks_for_date(db_path, user_id, target_date_str):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT description, schedule_time FROM tasks WHERE user_id = ? AND schedule_time LIKE ?",
+              (user_id, f"{target_date_str}%"))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def legacy_get_all_schedules(db_path, user_id):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT description, frequency, time, end_date FROM recurring_schedules WHERE user_id = ?", (user_id,))
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def legacy_check_duplicate_task(db_path, user_id, description, schedule_time):
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT id FROM tasks WHERE user_id = ? AND schedule_time = ? AND description LIKE ?",
+              (user_id, schedule_time, f"%{description}%"))
+    result = c.fetchone()
+    conn.close()
+    return result is not None
+
+
+def _seed(users=50):
+    for uid in range(users):
+        database.add_recurring_schedule(uid, f"học toeic {uid}", "mon,wed,fri", "20:00")
+        for day in range(1, 8):
+            database.add_task(uid, f"họp nhóm {day}", f"2025-12-{day:02d}T09:00:00")
+
+def _run(label, ops, read_fn, write_fn, check_fn, sched_fn):
+    # Writes go last so both runs read from a table of the same size
+    timings = {}
+    for name, fn in [("read", read_fn), ("check", check_fn), ("schedules", sched_fn), ("write", write_fn)]:
+        start = time.perf_counter()
+        for i in range(ops):
+            fn(i)
+        elapsed = time.perf_counter() - start
+        timings[name] = ops / elapsed
+    print(f"{label:<8}" + "".join(f"{name:>12}: {rate:>9.0f} ops/s" for name, rate in timings.items()))
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, "bench.db")
+        database.init_db()
+        _seed()
+        db_path = database.DB_PATH
+
+        # Start "before" from a rollback journal, like the old defaults
+        database.close_connection()
+        conn = sqlite3.connect(db_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+
+        before = _run(
+            "before", args.ops,
+            read_fn=lambda i: legacy_get_tasks_for_date(db_path, i % 50, "2025-12-03"),
+            write_fn=lambda i: legacy_add_task(db_path, i % 50, f"bench {i}", f"2026-01-01T{i % 24:02d}:00:00"),
+            check_fn=lambda i: legacy_check_duplicate_task(db_path, i % 50, "họp", "2025-12-03T09:00:00"),
+            sched_fn=lambda i: legacy_get_all_schedules(db_path, i % 50),
+        )
+        after = _run(
+            "after", args.ops,
+            read_fn=lambda i: database.get_tasks_for_date(i % 50, "2025-12-03"),
+            write_fn=lambda i: database.add_task(i % 50, f"bench {i}", f"2026-01-01T{i % 24:02d}:00:00"),
+            check_fn=lambda i: database.check_duplicate_task(i % 50, "họp", "2025-12-03T09:00:00"),
+            sched_fn=lambda i: database.get_all_schedules(i % 50),
+        )
+        print("speedup " + "".join(f"{name:>12}: {after[name] / before[name]:>9.1f}x      " for name in before))
+
+        # Schedule creation: duplicate check + insert (two statements) vs one INSERT ... ON CONFLICT.
+        # The second pass repeats every request, so all of its attempts are duplicates.
+        def check_then_add(i):
+            when = f"2026-02-01T{i % 24:02d}:00:00"
+            if not database.check_duplicate_task(i % 50, f"create {i}", when):
+                database.add_task(i % 50, f"create {i}", when)
+        def insert_if_absent(i):
+            database.add_task_if_absent(i % 50, f"create {i}", f"2026-03-01T{i % 24:02d}:00:00")
+        for label in ("new", "dup"):
+            rates = {}
+            for name, fn in [("check+add", check_then_add), ("if_absent", insert_if_absent)]:
+                start = time.perf_counter()
+                for i in range(args.ops):
+                    fn(i)
+                rates[name] = args.ops / (time.perf_counter() - start)
+            print(f"create/{label}" + "".join(f"{name:>12}: {rate:>9.0f} ops/s" for name, rate in rates.items()))
+        database.close_connection()
+
+if __name__ == "__main__":
+    main()
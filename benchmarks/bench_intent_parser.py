@@ -0,0 +1,80 @@
+"""
+Benchmark for the rule-based intent fast path (intent_parser.py).
+
+Replays the labelled corpus in intent_corpus.jsonl and reports how many messages
+skip Gemini, how many of those are parsed correctly, how long the parser takes,
+and the LLM latency saved. "expected" is null for messages that must go to the LLM;
+a fast-path answer on those counts as a false hit.
+
+Usage: python benchmarks/bench_intent_parser.py [--threshold 0.85] [--llm-latency 1.5]
+"""
+import os
+import sys
+import json
+import argparse
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from intent_parser import parse_intent
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.jsonl")
+# The corpus labels are written relative to this moment (a Monday evening)
+CORPUS_NOW = datetime(2025, 11, 24, 19, 0)
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _matches(intent, expected):
+    return all(intent.get(key) == value for key, value in expected.items())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--llm-latency", type=float, default=1.5,
+                        help="Assumed seconds per Gemini intent call")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    hits = correct = wrong = false_hits = 0
+    for example in corpus:
+        result = parse_intent(example["text"], CORPUS_NOW)
+        hit = result is not None and result[1] >= args.threshold
+        expected = example["expected"]
+        if not hit:
+            if expected is not None and args.verbose:
+                print(f"miss       {example['text']!r}")
+            continue
+        hits += 1
+        intent = result[0]["intents"][0]
+        if expected is None:
+            false_hits += 1
+            print(f"false hit  {example['text']!r} -> {intent}")
+        elif _matches(intent, expected):
+            correct += 1
+        else:
+            wrong += 1
+            print(f"wrong      {example['text']!r} -> {intent}")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for example in corpus:
+            parse_intent(example["text"], CORPUS_NOW)
+    per_message = (time.perf_counter() - start) / (args.repeat * len(corpus))
+
+    labelled = sum(1 for example in corpus if example["expected"] is not None)
+    print(f"corpus:         {len(corpus)} messages ({labelled} fast-path candidates, {len(corpus) - labelled} LLM-only)")
+    print(f"hit rate:       {hits}/{len(corpus)} = {hits / len(corpus):.0%} (threshold {args.threshold})")
+    print(f"accuracy:       {correct}/{hits} correct, {wrong} wrong, {false_hits} false hits")
+    print(f"recall:         {correct}/{labelled} = {correct / labelled:.0%} of candidates")
+    print(f"parser latency: {per_message * 1e6:.0f} us/message")
+    saved = hits * args.llm_latency - len(corpus) * per_message
+    print(f"latency saved:  {saved:.1f}s over the corpus, "
+          f"{saved / len(corpus) * 1000:.0f} ms/message on average (assuming {args.llm_latency}s per LLM call)")
+
+if __name__ == "__main__":
+    main()
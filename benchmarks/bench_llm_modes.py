@@ -0,0 +1,126 @@
+"""
+Compares the two ways handle_message talks to Gemini on the recorded conversations
+in conversations.jsonl:
+
+  two-step  extract_schedule_intent_async, then get_secretary_response_async for chat
+  combined  analyze_message_async (intents + chat reply in one call)
+
+With GEMINI_API_KEY set, every turn is sent to Gemini in both modes and the script
+reports calls, wall-clock latency and the token counts from usage_metadata.
+Without a key (or with --offline) it only builds the prompts and reports calls and
+estimated prompt tokens (~4 characters per token).
+
+Usage: python benchmarks/bench_llm_modes.py [--offline] [--limit N]
+"""
+import os
+import sys
+import json
+import argparse
+import asyncio
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from dotenv import load_dotenv
+
+import llm_engine
+
+CONVERSATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.jsonl")
+SCHEDULE_CONTEXT = "- Học TOEIC (mon,wed,fri 20:00)\n- Chạy bộ (mon,tue,wed,thu,fri,sat,sun 06:00)"
+CHARS_PER_TOKEN = 4
+
+class ModeStats:
+    def __init__(self, name):
+        self.name = name
+        self.turns = 0
+        self.calls = 0
+        self.prompt_chars = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latencies = []
+
+    def row(self, live):
+        total = sum(self.latencies)
+        tokens = (f"{self.prompt_tokens:>9} {self.output_tokens:>9}" if live
+                  else f"{self.prompt_chars // CHARS_PER_TOKEN:>8}~ {'-':>9}")
+        avg = f"{total / self.turns * 1000:>8.0f}" if live else f"{'-':>8}"
+        return f"{self.name:<10}{self.turns:>6}{self.calls:>7} {tokens} {avg}"
+
+def _is_chat(intent_data):
+    intents = intent_data.get("intents", [])
+    return not intents or (len(intents) == 1 and intents[0].get("intent") == "chat")
+
+async def _call(stats, kind, prompt, live):
+    stats.calls += 1
+    stats.prompt_chars += len(llm_engine.SYSTEM_INSTRUCTIONS[kind]) + len(prompt)
+    if not live:
+        return None
+    response = await llm_engine._generate_content_async(kind, prompt)
+    usage = response.usage_metadata
+    stats.prompt_tokens += usage.prompt_token_count
+    stats.output_tokens += usage.candidates_token_count
+    return response.text
+
+async def two_step_turn(stats, history, user_input, live):
+    if llm_engine._fast_path_intent(user_input):
+        return "Dạ vâng ạ."
+    text = await _call(stats, "intent", llm_engine._build_intent_prompt(user_input, history), live)
+    intent_data = llm_engine._parse_intent_response(text) if live else {"intents": [{"intent": "chat"}]}
+    if not _is_chat(intent_data):
+        return intent_data["intents"][0].get("conversational_response", "")
+    prompt = llm_engine._build_secretary_prompt(history, user_input, SCHEDULE_CONTEXT)
+    return await _call(stats, "secretary", prompt, live) or "Dạ vâng anh."
+
+async def combined_turn(stats, history, user_input, live):
+    if llm_engine._fast_path_intent(user_input):
+        return "Dạ vâng ạ."
+    prompt = llm_engine._build_combined_prompt(history, user_input, SCHEDULE_CONTEXT)
+    text = await _call(stats, "combined", prompt, live)
+    if not live:
+        return "Dạ vâng anh."
+    intent_data = llm_engine._parse_intent_response(text)
+    return intent_data.get("reply") or intent_data["intents"][0].get("conversational_response", "")
+
+async def replay(conversations, turn_fn, stats, live):
+    for conversation in conversations:
+        history = []
+        for user_input in conversation["turns"]:
+            start = time.perf_counter()
+            try:
+                reply = await turn_fn(stats, history[-10:], user_input, live)
+            except Exception as e:
+                print(f"{stats.name}: error on {user_input!r}: {e}")
+                reply = ""
+            stats.latencies.append(time.perf_counter() - start)
+            stats.turns += 1
+            history.append({'role': 'user', 'content': user_input})
+            history.append({'role': 'assistant', 'content': reply})
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--offline", action="store_true", help="Only build prompts, no Gemini calls")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N conversations")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    live = bool(api_key) and not args.offline
+    if live:
+        llm_engine.configure_genai(api_key)
+
+    with open(CONVERSATIONS_PATH, encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f if line.strip()][:args.limit]
+
+    two_step = ModeStats("two-step")
+    combined = ModeStats("combined")
+    await replay(conversations, two_step_turn, two_step, live)
+    await replay(conversations, combined_turn, combined, live)
+
+    print(f"{'mode':<10}{'turns':>6}{'calls':>7} {'prompt_tok':>9} {'output_tok':>9} {'ms/turn':>8}")
+    print(two_step.row(live))
+    print(combined.row(live))
+    if not live:
+        print("(offline: every non-fast-path turn is treated as chat, the worst case for two-step)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,506 @@
+"""
+Offline end-to-end load test: the real handlers in main.py, update processor,
+MessageDispatcher, history and database, against local stand-ins for Telegram and Gemini.
+
+FakeBotApi     local HTTP server speaking enough of the Bot API (getUpdates long polling,
+               sendMessage, editMessageText, sendChatAction, ...); the Application talks to
+               it over HTTP through base_url, with an optional flood limit (--bot-rate)
+FakeModel      stands in for the Gemini models behind llm_engine (_models), so prompts,
+               parsing, streaming and the concurrency limit are the real code:
+                 synthetic  answers built from intent_parser, --llm-latency-ms each
+                 --record   real Gemini calls (GEMINI_API_KEY), responses saved to a file
+                 --replay   answers from a recorded file with their recorded latency
+driver         --users users, each sends /start then --messages Vietnamese scheduling and
+               chat messages (intent_corpus.jsonl, conversations.jsonl), waits for the
+               handler to finish, thinks --think-ms and sends the next one. With
+               --mode webhook the update JSON is POSTed to webhook.WebhookServer instead
+               of being served through getUpdates.
+
+Reports handler latency p50/p95/p99 (update posted to the fake server until the handler
+returns), throughput, Gemini calls and SQL statements per message, then runs the daily
+briefing for every user and reports its duration. Everything runs on a temporary database.
+
+Usage: python benchmarks/bench_load.py [--users 50] [--messages 20] [--llm-latency-ms 800] [--mode webhook]
+       python benchmarks/bench_load.py --record benchmarks/llm_recording.jsonl   (needs GEMINI_API_KEY)
+       python benchmarks/bench_load.py --replay benchmarks/llm_recording.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+from collections import Counter
+from urllib.parse import parse_qs
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+import database
+
+TOKEN = "123456:LOADTEST"
+TASK_WORDS = ["học TOEIC", "chạy bộ", "họp nhóm", "gọi điện cho mẹ", "đi bơi", "đọc sách", "tập gym", "uống thuốc"]
+EXTRA_MESSAGES = [
+    "nhắc anh {task} lúc {hour}h tối nay",
+    "{hour}h sáng mai anh {task} nhé",
+    "thứ 2 4 6 hàng tuần {hour}h tối nhắc anh {task}",
+    "mỗi sáng {hour}h nhắc anh {task}",
+    "xóa lịch {task}",
+    "lịch hôm nay của anh",
+    "tuần này anh có lịch gì",
+    "em ơi anh mệt quá",
+    "cảm ơn em nhé",
+]
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+# --- Fake Telegram ---
+
+class FakeBotApi:
+    """Just enough of the Bot API for the bot to run; every request is answered after `latency` seconds."""
+    def __init__(self, latency=0.03, rate=0):
+        self.latency = latency
+        self.rate = rate
+        self.calls = Counter()
+        self.rejected = 0
+        self._pending = []  # update dicts not confirmed through getUpdates offset yet
+        self._new_update = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._window = []  # send times in the last second (flood limit)
+        self.posted_at = {}  # update_id -> time it was posted
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+
+    def make_update(self, user_id, text, first_name="Anh"):
+        """Update JSON for a private text message from user_id, as Telegram sends it."""
+        update_id = self._next_update_id
+        self._next_update_id += 1
+        user = {"id": user_id, "is_bot": False, "first_name": first_name, "username": f"user{user_id}"}
+        message = {"message_id": update_id, "date": int(time.time()), "text": text,
+                   "chat": {"id": user_id, "type": "private", "first_name": first_name}, "from": user}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        self.posted_at[update_id] = time.perf_counter()
+        return {"update_id": update_id, "message": message}
+
+    def post_message(self, user_id, text):
+        """Queues a message for getUpdates. Returns its update_id."""
+        update = self.make_update(user_id, text)
+        self._pending.append(update)
+        self._new_update.set()
+        return update["update_id"]
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                method = request_line.split()[1].decode().rsplit("/", 1)[-1]
+                status, result = await self._call(method, self._params(headers, body))
+                payload = json.dumps(result).encode()
+                writer.write(b"HTTP/1.1 %d OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n"
+                             % (status, len(payload)) + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # Client went away, or a long poll was still open at shutdown
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _params(headers, body):
+        if not body:
+            return {}
+        if headers.get("content-type", "").startswith("application/json"):
+            return json.loads(body)
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    def _message(self, chat_id, text):
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        return {"message_id": message_id, "date": int(time.time()), "text": text,
+                "chat": {"id": int(chat_id), "type": "private"}}
+
+    def _flood_limited(self):
+        if not self.rate:
+            return False
+        now = time.monotonic()
+        self._window = [t for t in self._window if now - t < 1.0]
+        if len(self._window) >= self.rate:
+            self.rejected += 1
+            return True
+        self._window.append(now)
+        return False
+
+    async def _call(self, method, params):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": await self._get_updates(params)}
+        await asyncio.sleep(self.latency)
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 123456, "is_bot": True, "first_name": "Trang",
+                                                "username": "trang_load_bot"}}
+        if method in ("sendMessage", "editMessageText"):
+            if method == "sendMessage" and self._flood_limited():
+                return 429, {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                             "parameters": {"retry_after": 1}}
+            return 200, {"ok": True, "result": self._message(params["chat_id"], params.get("text", ""))}
+        return 200, {"ok": True, "result": True}
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        self._pending = [u for u in self._pending if u["update_id"] >= offset]
+        if not self._pending:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout=min(float(params.get("timeout", 0) or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self._pending[:int(params.get("limit", 100) or 100)]
+
+# --- Fake Gemini ---
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens=0):
+        self.text = text
+        self.usage_metadata = type("Usage", (), {"prompt_token_count": prompt_tokens,
+                                                 "candidates_token_count": len(text) // 4})()
+
+class FakeStream:
+    def __init__(self, text, first_delay, chunk_delay, chunk_chars=40):
+        self.chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.first_delay)
+        for i, chunk in enumerate(self.chunks):
+            if i:
+                await asyncio.sleep(self.chunk_delay)
+            yield FakeResponse(chunk)
+
+def user_input_of(kind, prompt):
+    """The user's message inside an llm_engine prompt (the key for recorded responses)."""
+    m = re.search(r'User message: "(.*)"\s*$', prompt, re.S) or re.search(r"User: (.*)\nTrang:\s*$", prompt, re.S)
+    return m.group(1) if m else prompt[-200:]
+
+class LlmBackend:
+    """Answers for FakeModel: synthetic, or replayed from a --record file."""
+    def __init__(self, latency, rng, replay_path=None):
+        self.latency = latency
+        self.rng = rng
+        self.recorded = {}
+        self.calls = Counter()
+        self.replay_misses = 0
+        if replay_path:
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.recorded[(entry["kind"], entry["input"])] = (entry["text"], entry["latency"])
+
+    def respond(self, kind, prompt):
+        """Returns (text, latency in seconds)."""
+        self.calls[kind] += 1
+        user_input = user_input_of(kind, prompt)
+        if self.recorded:
+            if (kind, user_input) in self.recorded:
+                return self.recorded[(kind, user_input)]
+            self.replay_misses += 1
+        return self._synthetic(kind, user_input), self.latency * self.rng.uniform(0.5, 1.5)
+
+    def _synthetic(self, kind, user_input):
+        from intent_parser import parse_intent
+        reply = "Dạ anh, em hiểu rồi ạ. Anh cứ yên tâm, em sẽ theo dõi lịch giúp anh và nhắc anh đúng giờ nhé."
+        if kind == "secretary":
+            return reply
+        if kind == "summary":
+            return "Anh đang học TOEIC và muốn được nhắc lịch đều đặn."
+        parsed = parse_intent(user_input)
+        data = parsed[0] if parsed else {"intents": [{"intent": "chat"}]}
+        if any(i["intent"] == "schedule_reminder" and not i.get("description") for i in data["intents"]):
+            # Gemini asks what to remind about instead of scheduling an unnamed reminder
+            data = {"intents": [{"intent": "clarify_schedule", "message": "Dạ anh muốn em nhắc việc gì ạ?"}]}
+        if kind == "combined":
+            data["reply"] = reply
+        return json.dumps(data, ensure_ascii=False)
+
+class FakeModel:
+    """Same calls llm_engine makes on a GenerativeModel."""
+    def __init__(self, kind, backend):
+        self.kind = kind
+        self.backend = backend
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        text, latency = self.backend.respond(self.kind, prompt)
+        if stream:
+            chunks = max(1, len(text) // 40)
+            return FakeStream(text, latency * 0.4, latency * 0.6 / chunks)
+        await asyncio.sleep(latency)
+        return FakeResponse(text, len(prompt) // 4)
+
+class RecordingModel:
+    """Wraps a real GenerativeModel and appends every response to the --record file."""
+    def __init__(self, kind, model, out):
+        self.kind = kind
+        self.model = model
+        self.out = out
+
+    def _save(self, prompt, text, started):
+        entry = {"kind": self.kind, "input": user_input_of(self.kind, prompt), "text": text,
+                 "latency": round(time.perf_counter() - started, 3)}
+        self.out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        started = time.perf_counter()
+        response = await self.model.generate_content_async(prompt, stream=stream, **kwargs)
+        if not stream:
+            self._save(prompt, response.text, started)
+            return response
+
+        async def chunks():
+            text = ""
+            async for chunk in response:
+                try:
+                    text += chunk.text
+                except ValueError:
+                    pass
+                yield chunk
+            self._save(prompt, text, started)
+        return chunks()
+
+# --- Driver ---
+
+def load_messages():
+    messages = []
+    with open(os.path.join(BENCH_DIR, "intent_corpus.jsonl"), encoding="utf-8") as f:
+        messages += [json.loads(line)["text"] for line in f if line.strip()]
+    with open(os.path.join(BENCH_DIR, "conversations.jsonl"), encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                messages += json.loads(line)["turns"]
+    return messages
+
+def make_message(rng, corpus):
+    if rng.random() < 0.6:
+        return rng.choice(corpus)
+    return rng.choice(EXTRA_MESSAGES).format(task=rng.choice(TASK_WORDS), hour=rng.randint(5, 10))
+
+class SqlCounter:
+    """Counts SQL statements by verb on a database connection (sqlite3 trace callback)."""
+    NOT_COUNTED = ("BEGIN", "COMMIT", "ROLLBACK", "internal")
+
+    def __init__(self):
+        self.counts = Counter()
+        self.enabled = False
+
+    def install(self, conn):
+        conn.set_trace_callback(self._trace)
+
+    def _trace(self, sql):
+        if not self.enabled:
+            return
+        sql = sql.strip()
+        # SQLite reports statements it runs itself (FTS5 shadow tables, triggers) as "-- ..."
+        self.counts["internal" if sql.startswith("--") else sql.split(None, 1)[0].upper()] += 1
+
+    def statements(self, counts=None):
+        return sum(n for verb, n in (counts or self.counts).items() if verb not in self.NOT_COUNTED)
+
+async def run(args):
+    import main
+    from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters
+    from telegram.request import HTTPXRequest
+    import llm_engine
+    import webhook
+    import httpx
+
+    logging.getLogger().setLevel(logging.WARNING)
+    main.STREAM_REPLIES = not args.no_stream
+    main.init_modules()
+    rng = random.Random(args.seed)
+
+    api = FakeBotApi(args.bot_latency_ms / 1000, args.bot_rate)
+    await api.start()
+
+    backend = LlmBackend(args.llm_latency_ms / 1000, rng, args.replay)
+    record_file = None
+    if args.record:
+        record_file = open(args.record, "a", encoding="utf-8")
+        for kind in llm_engine.SYSTEM_INSTRUCTIONS:
+            llm_engine._models[kind] = (RecordingModel(kind, llm_engine._get_model(kind), record_file), None)
+    else:
+        for kind in llm_engine.SYSTEM_INSTRUCTIONS:
+            llm_engine._models[kind] = (FakeModel(kind, backend), None)
+
+    builder = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{api.port}/bot")
+        .request(HTTPXRequest(connection_pool_size=512))
+        .get_updates_request(HTTPXRequest())
+        .concurrent_updates(main.update_processor)
+    )
+    if args.mode == "webhook":
+        builder = builder.updater(None)
+    application = builder.build()
+    webhook_server = webhook.WebhookServer(application, main.update_processor, secret_token="load-test")
+    main.application = application
+    main.scheduler.db_url = f"sqlite:///{os.path.join(os.path.dirname(database.DB_PATH), 'jobs.db')}"
+
+    latencies = []
+    errors = []
+    done = {}  # update_id -> Future set when its handler returns
+
+    def timed(handler):
+        async def wrapper(update, context):
+            try:
+                await handler(update, context)
+            finally:
+                latencies.append(time.perf_counter() - api.posted_at[update.update_id])
+                future = done.pop(update.update_id, None)
+                if future is not None and not future.done():
+                    future.set_result(None)
+        return wrapper
+
+    async def on_error(update, context):
+        errors.append(repr(context.error))
+        if args.verbose:
+            logging.getLogger("bench_load").error("Handler error", exc_info=context.error)
+
+    application.add_handler(CommandHandler('start', timed(main.start)))
+    application.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), timed(main.handle_message)))
+    application.add_error_handler(on_error)
+
+    async def actual_callback(chat_id, text):
+        await application.bot.send_message(chat_id=chat_id, text=text)
+
+    corpus = load_messages()
+
+    client = httpx.AsyncClient(headers={"X-Telegram-Bot-Api-Secret-Token": "load-test"})
+
+    async def send(user_id, text):
+        if args.mode == "polling":
+            return api.post_message(user_id, text)
+        update = api.make_update(user_id, text)
+        response = await client.post(f"http://127.0.0.1:{webhook_server.port}/telegram", json=update)
+        response.raise_for_status()
+        return update["update_id"]
+
+    async def user(user_id):
+        await asyncio.sleep(rng.uniform(0, args.ramp_s))
+        for i in range(args.messages + 1):
+            text = "/start" if i == 0 else make_message(rng, corpus)
+            future = asyncio.get_running_loop().create_future()
+            update_id = api._next_update_id
+            done[update_id] = future
+            assert await send(user_id, text) == update_id
+            await asyncio.wait_for(future, timeout=120)
+            await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+
+    # Handlers, reminders and the briefing all use the event loop thread's connection
+    sql = SqlCounter()
+    sql.install(database.get_connection())
+    async with application:
+        await application.start()
+        main.scheduler.set_callback(actual_callback)
+        main.scheduler.set_dispatcher(main.MessageDispatcher(application.bot, global_rate=main.REMINDER_SEND_RATE))
+        await main.scheduler.start_async()
+        if args.mode == "webhook":
+            await webhook_server.start("127.0.0.1", 0)
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=1)
+
+        sql.enabled = True
+        started = time.perf_counter()
+        await asyncio.gather(*(user(100000 + i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        sql.enabled = False
+        traffic_sql = Counter(sql.counts)
+        traffic_calls = Counter(api.calls)
+
+        sql.counts.clear()
+        sql.enabled = True
+        briefing_started = time.perf_counter()
+        stats = await main.send_daily_briefing_internal(application)
+        briefing = time.perf_counter() - briefing_started
+        sql.enabled = False
+
+        if args.mode == "webhook":
+            await webhook_server.stop()
+        else:
+            await application.updater.stop()
+        await client.aclose()
+        await application.stop()
+        main.scheduler.scheduler.shutdown(wait=False)
+        if main.scheduler.reminders is not None:
+            main.scheduler.reminders.shutdown()
+    await api.stop()
+    if record_file:
+        record_file.close()
+
+    messages = args.users * (args.messages + 1)
+    statements = sql.statements(traffic_sql)
+    print(f"traffic   [{args.mode}] {args.users} users x {args.messages + 1} messages = {messages} in {elapsed:.1f}s "
+          f"({messages / elapsed:.1f} msg/s), handler errors {len(errors)}")
+    print(f"latency   p50={_percentile(latencies, 0.5) * 1000:.0f} ms  p95={_percentile(latencies, 0.95) * 1000:.0f} ms  "
+          f"p99={_percentile(latencies, 0.99) * 1000:.0f} ms  max={max(latencies, default=0) * 1000:.0f} ms")
+    llm_calls = sum(backend.calls.values())
+    print(f"gemini    {llm_calls} calls ({llm_calls / messages:.2f}/message: "
+          f"{', '.join(f'{k}={v}' for k, v in backend.calls.most_common())})"
+          + (f", replay misses {backend.replay_misses}" if args.replay else ""))
+    print(f"database  {statements / messages:.1f} SQL statements/message "
+          f"({', '.join(f'{k}={v}' for k, v in traffic_sql.most_common())})")
+    print(f"bot api   {', '.join(f'{k}={v}' for k, v in traffic_calls.most_common())}; flood-limit rejections {api.rejected}")
+    print(f"briefing  {stats.sent} messages in {briefing:.1f}s, {sql.statements()} SQL statements; {stats.summary()}")
+    import metrics
+    top = sorted(metrics.DB_SECONDS.values.items(), key=lambda item: -item[1][1])[:5]
+    print("db time   " + ", ".join(f"{key[0]} {total * 1000:.0f} ms/{count}" for key, (_, total, count) in top))
+    for error in Counter(errors).most_common(5):
+        print(f"error     {error[1]}x {error[0]}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=20, help="Messages per user after /start")
+    parser.add_argument("--think-ms", type=float, default=1000, help="Mean pause between a reply and the next message")
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="Users start at random times within this many seconds")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="Mean synthetic Gemini latency")
+    parser.add_argument("--bot-latency-ms", type=float, default=30, help="Fake Bot API response time")
+    parser.add_argument("--bot-rate", type=int, default=0, help="Fake flood limit, sendMessage/second (0 = none)")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling", help="How updates reach the bot")
+    parser.add_argument("--no-stream", action="store_true", help="Send replies in one message (STREAM_REPLIES=0)")
+    parser.add_argument("--record", help="Use Gemini for real and append the responses to this file")
+    parser.add_argument("--replay", help="Answer from a file written by --record")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Log handler tracebacks")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, "load.db")
+        asyncio.run(run(args))
+        database.close_connection()
+
+if __name__ == "__main__":
+    main()
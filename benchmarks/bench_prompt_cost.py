@@ -0,0 +1,110 @@
+"""
+Per-message prompt cost of llm_engine after the static/dynamic split.
+
+For each prompt kind (secretary, intent, combined) over the turns in conversations.jsonl:
+  - size of the fixed system instruction vs the per-message dynamic part
+  - client-side cost of building a GenerativeModel per call (old) vs reusing one (new)
+With GEMINI_API_KEY set it also sends --live-turns turns per kind with the context
+cache off and on, and reports prompt / cached tokens from usage_metadata and latency.
+
+Usage: python benchmarks/bench_prompt_cost.py [--live-turns 5]
+"""
+import os
+import sys
+import json
+import argparse
+import asyncio
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from dotenv import load_dotenv
+import google.generativeai as genai
+
+import llm_engine
+
+CONVERSATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conversations.jsonl")
+SCHEDULE_CONTEXT = "- Học TOEIC (mon,wed,fri 20:00)\n- Chạy bộ (mon,tue,wed,thu,fri,sat,sun 06:00)"
+CHARS_PER_TOKEN = 4
+PROMPT_KINDS = ("secretary", "intent", "combined")
+
+def _turns():
+    with open(CONVERSATIONS_PATH, encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f if line.strip()]
+    for conversation in conversations:
+        history = []
+        for user_input in conversation["turns"]:
+            yield history[-10:], user_input
+            history.append({'role': 'user', 'content': user_input})
+            history.append({'role': 'assistant', 'content': "Dạ vâng anh."})
+
+def _dynamic_prompt(kind, history, user_input):
+    if kind == "secretary":
+        return llm_engine._build_secretary_prompt(history, user_input, SCHEDULE_CONTEXT)
+    if kind == "intent":
+        return llm_engine._build_intent_prompt(user_input, history)
+    return llm_engine._build_combined_prompt(history, user_input, SCHEDULE_CONTEXT)
+
+def offline_report():
+    turns = list(_turns())
+    print(f"{'kind':<10}{'static':>9}{'dynamic/msg':>13}{'static share':>14}")
+    for kind in PROMPT_KINDS:
+        instruction = llm_engine.SYSTEM_INSTRUCTIONS[kind]
+        dynamic = sum(len(_dynamic_prompt(kind, h, u)) for h, u in turns) / len(turns)
+        static_tokens = len(instruction) // CHARS_PER_TOKEN
+        dynamic_tokens = dynamic / CHARS_PER_TOKEN
+        share = static_tokens / (static_tokens + dynamic_tokens)
+        print(f"{kind:<10}{static_tokens:>8}~{dynamic_tokens:>12.0f}~{share:>13.0%}")
+    print("(~ = estimated at 4 characters per token; with context caching the static part is billed as cached input)")
+
+    repeat = 2000
+    start = time.perf_counter()
+    for _ in range(repeat):
+        genai.GenerativeModel(llm_engine.MODEL_NAME)
+    per_new = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        llm_engine._get_model("intent")
+    per_reuse = (time.perf_counter() - start) / repeat
+    print(f"model per call: {per_new * 1e6:.1f} us   reused model: {per_reuse * 1e6:.2f} us")
+
+async def _live_run(kind, turns, context_cache):
+    llm_engine.LLM_CONTEXT_CACHE = context_cache
+    llm_engine._models.clear()
+    prompt_tokens = cached_tokens = 0
+    latencies = []
+    for history, user_input in turns:
+        start = time.perf_counter()
+        response = await llm_engine._generate_content_async(kind, _dynamic_prompt(kind, history, user_input))
+        latencies.append(time.perf_counter() - start)
+        usage = response.usage_metadata
+        prompt_tokens += usage.prompt_token_count
+        cached_tokens += getattr(usage, "cached_content_token_count", 0) or 0
+    n = len(turns)
+    label = "cache on" if context_cache else "cache off"
+    print(f"{kind:<10}{label:<10}{prompt_tokens / n:>10.0f}{cached_tokens / n:>10.0f}"
+          f"{(prompt_tokens - cached_tokens) / n:>10.0f}{sum(latencies) / n * 1000:>9.0f}")
+
+async def live_report(live_turns):
+    turns = list(_turns())[:live_turns]
+    print(f"{'kind':<10}{'mode':<10}{'prompt':>10}{'cached':>10}{'uncached':>10}{'ms/msg':>9}  (per message)")
+    for kind in PROMPT_KINDS:
+        for context_cache in (False, True):
+            await _live_run(kind, turns, context_cache)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--live-turns", type=int, default=5)
+    args = parser.parse_args()
+
+    offline_report()
+    load_dotenv()
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key:
+        llm_engine.configure_genai(api_key)
+        asyncio.run(live_report(args.live_turns))
+    else:
+        print("GEMINI_API_KEY not set: skipping live token/latency comparison")
+
+if __name__ == "__main__":
+    main()
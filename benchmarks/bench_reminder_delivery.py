@@ -0,0 +1,120 @@
+"""
+Peak-minute reminder burst: --count reminders due in the same tick, sent to a fake
+Bot API that enforces a global flood limit (--bot-rate messages/second, RetryAfter
+above it) and answers after --latency-ms.
+
+naive    one independent send per reminder, like one APScheduler job each: every
+         RetryAfter is an error and that reminder is lost
+batched  ReminderTimer._deliver: the tick is claimed in reminder_deliveries and sent
+         through MessageDispatcher paced at --send-rate, RetryAfter retried
+
+Reports sent / lost, burst duration, lateness percentiles and, for batched, that
+claiming the same tick twice (overlapping ticks, restart) sends nothing twice.
+Rates default to 10x Telegram's (~30/s) so a run takes seconds; the ratios hold.
+
+Usage: python benchmarks/bench_reminder_delivery.py [--count 3000] [--bot-rate 300] [--send-rate 250]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import deque, Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from telegram.error import RetryAfter
+
+import database
+from dispatcher import MessageDispatcher
+from reminder_backend import ReminderTimer
+
+class FakeBot:
+    """Accepts at most `rate` messages in any one-second window, like Telegram's global limit."""
+    def __init__(self, rate, latency):
+        self.rate = rate
+        self.latency = latency
+        self.accepted = deque()
+        self.delivered = Counter()
+        self.rejected = 0
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.accepted and now - self.accepted[0] > 1.0:
+            self.accepted.popleft()
+        if len(self.accepted) >= self.rate:
+            self.rejected += 1
+            raise RetryAfter(1)
+        self.accepted.append(now)
+        self.delivered[(chat_id, text)] += 1
+
+def _percentiles(values):
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+    return f"p50={pick(0.5):.2f}s p95={pick(0.95):.2f}s max={max(values, default=0.0):.2f}s"
+
+def _burst(count, fire):
+    return [(100000 + i, f"Thưa anh, đã đến giờ việc {i} rồi ạ.", fire, f"task:{i}:main:{int(fire)}") for i in range(count)]
+
+async def naive(args):
+    bot = FakeBot(args.bot_rate, args.latency_ms / 1000)
+    fire = time.time()
+    lateness = []
+
+    async def job(chat_id, text):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            lateness.append(time.time() - fire)
+        except RetryAfter:
+            pass  # The job has run; APScheduler does not run it again
+
+    started = time.monotonic()
+    await asyncio.gather(*(job(chat_id, text) for chat_id, text, _, _ in _burst(args.count, fire)))
+    duration = time.monotonic() - started
+    print(f"naive    sent={len(lateness):>6} lost={args.count - len(lateness):>6} duration={duration:6.1f}s  "
+          f"lateness {_percentiles(lateness)}")
+
+async def batched(args):
+    bot = FakeBot(args.bot_rate, args.latency_ms / 1000)
+    timer = ReminderTimer()
+    timer.dispatcher = MessageDispatcher(bot, global_rate=args.send_rate, concurrency=args.concurrency)
+    fire = time.time()
+    burst = _burst(args.count, fire)
+
+    started = time.monotonic()
+    await timer._deliver(timer._claim(burst))
+    duration = time.monotonic() - started
+    # The same tick handed over again must not send anything
+    await timer._deliver(timer._claim(burst))
+    repeated = sum(1 for n in bot.delivered.values() if n > 1)
+
+    stats = timer.stats
+    recorded = [row[0] for row in database.get_connection().execute(
+        "SELECT lateness FROM reminder_deliveries WHERE status = 'sent'")]
+    print(f"batched  sent={stats.sent:>6} lost={stats.failed:>6} duration={duration:6.1f}s  "
+          f"lateness {_percentiles(recorded)} (from reminder_deliveries)")
+    print(f"         flood-limit rejections={bot.rejected}, second claim skipped {stats.duplicates}, "
+          f"delivered twice: {repeated}")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=3000)
+    parser.add_argument("--bot-rate", type=int, default=300, help="Fake Bot API limit, messages/second")
+    parser.add_argument("--send-rate", type=float, default=250, help="Dispatcher pace, messages/second")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--latency-ms", type=float, default=40)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, "bench.db")
+        database.init_db()
+        asyncio.run(naive(args))
+        asyncio.run(batched(args))
+        burst_time = args.count / args.send_rate
+        print(f"(at Telegram's real limit the same burst takes ~{args.count / 25:.0f}s at 25 msg/s; "
+              f"here {burst_time:.0f}s)")
+
+if __name__ == "__main__":
+    main()
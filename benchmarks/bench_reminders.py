@@ -0,0 +1,206 @@
+"""
+Reminder backends at scale: TableReminderBackend (reads tasks / recurring_schedules),
+LightReminderBackend (compact rows + in-memory heap) and APScheduler's
+SQLAlchemyJobStore (one pickled job per reminder).
+
+light        inserts --count reminders (default 1,000,000; 70% recurring, 30% one-off
+             over the next 30 days), then measures startup (first window load), memory
+             held by the backend, add/remove latency and how fast due reminders are
+             popped while a simulated clock walks through the next hours.
+tables       inserts --count schedule rows with the same mix (a third with an early
+             reminder) and measures startup, refresh and the same simulated 6 hours.
+apscheduler  adds --apscheduler-count jobs (default 10,000; adding 1M takes hours) and
+             measures scheduler start + get_jobs() and its memory, then extrapolates
+             linearly to --count.
+
+Usage: python benchmarks/bench_reminders.py [--count 1000000] [--apscheduler-count 10000]
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database
+from reminder_backend import LightReminderBackend, TableReminderBackend, next_occurrence, DAY_CODES, days_to_mask
+
+TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+TEXT = "Thưa anh, đã đến giờ Học TOEIC rồi ạ."
+POPULAR_MINUTES = [6 * 60 + 30, 20 * 60, 21 * 60, 7 * 60]
+
+async def noop_callback(chat_id, text):
+    pass
+
+def _random_minute(rng):
+    # Half of the reminders land on a few popular slots, like real schedules
+    return rng.choice(POPULAR_MINUTES) if rng.random() < 0.5 else rng.randrange(24 * 60)
+
+def fill_light(count, now, rng):
+    rows = []
+    for i in range(count):
+        chat_id = 100000 + i // 5
+        if rng.random() < 0.7:
+            days_mask = rng.randrange(1, 128)
+            minute = _random_minute(rng)
+            fire = next_occurrence(now, days_mask, minute, TZ)
+            rows.append((chat_id, "recurring", i, "main", fire, days_mask, minute, None, TEXT))
+        else:
+            day = datetime.fromtimestamp(now, TZ).date() + timedelta(days=rng.randrange(30))
+            minute = _random_minute(rng)
+            fire = int(datetime(day.year, day.month, day.day, minute // 60, minute % 60, tzinfo=TZ).timestamp())
+            if fire <= now:
+                fire += 86400
+            rows.append((chat_id, "task", i, "main", fire, None, None, None, TEXT))
+    conn = database.get_connection()
+    with conn:
+        conn.executemany('''INSERT INTO reminders (chat_id, kind, schedule_id, slot, next_fire, days_mask, minute_of_day, end_fire, text)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+def bench_light(count, rng):
+    now = int(time.time())
+    start = time.perf_counter()
+    fill_light(count, now, rng)
+    print(f"light: inserted {count} rows in {time.perf_counter() - start:.1f}s "
+          f"(db {os.path.getsize(database.DB_PATH) / 1e6:.0f} MB)")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    backend = LightReminderBackend(TZ)
+    backend.next_fire()
+    startup = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"light: startup {startup * 1000:.1f} ms, {len(backend._loaded)} reminders in memory, {memory / 1e6:.2f} MB")
+
+    n = 1000
+    start = time.perf_counter()
+    for i in range(n):
+        backend.add_once(1, TEXT, datetime.fromtimestamp(now + 3600 + i, TZ), schedule_id=count + i)
+    add = (time.perf_counter() - start) / n
+    start = time.perf_counter()
+    for i in range(n):
+        backend.remove(1, "task", count + i)
+    remove = (time.perf_counter() - start) / n
+    print(f"light: add {add * 1e6:.0f} us, remove {remove * 1e6:.0f} us")
+
+    _walk_clock("light", backend, now)
+
+def _walk_clock(name, backend, now):
+    # Walk a simulated clock minute by minute through the next 6 hours
+    fired = 0
+    busiest = (0, 0.0)
+    start = time.perf_counter()
+    for minute in range(6 * 60 + 1):
+        tick = time.perf_counter()
+        batch = backend.pop_due(now + minute * 60)
+        fired += len(batch)
+        busiest = max(busiest, (len(batch), time.perf_counter() - tick))
+    elapsed = time.perf_counter() - start
+    print(f"{name}: fired {fired} reminders over 6 simulated hours in {elapsed:.2f}s "
+          f"({fired / elapsed:.0f}/s); busiest minute {busiest[0]} reminders in {busiest[1] * 1000:.0f} ms; "
+          f"misfired {backend.misfired}")
+
+def fill_tables(count, now, rng):
+    tasks, recurring = [], []
+    today = datetime.fromtimestamp(now, TZ).date()
+    for i in range(count):
+        user_id = 100000 + i // 5
+        minute = _random_minute(rng)
+        before = 15 if rng.random() < 0.33 else 0
+        if rng.random() < 0.7:
+            days = ",".join(code for code in DAY_CODES if rng.random() < 0.5) or "mon"
+            recurring.append((user_id, f"bench {i}", days, f"{minute // 60:02d}:{minute % 60:02d}", f"bench {i}", before, TEXT,
+                              days_to_mask(days), minute))
+        else:
+            day = today + timedelta(days=rng.randrange(30))
+            schedule_time = f"{day.isoformat()}T{minute // 60:02d}:{minute % 60:02d}:00"
+            tasks.append((user_id, f"bench {i}", schedule_time, day.isoformat(), f"bench {i}", before, TEXT))
+    conn = database.get_connection()
+    with conn:
+        conn.executemany('''INSERT INTO recurring_schedules (user_id, description, frequency, time, description_key, remind_before_minutes, reminder_message,
+                                                         days_mask, minute_of_day)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', recurring)
+        conn.executemany('''INSERT INTO tasks (user_id, description, schedule_time, schedule_date, description_key, remind_before_minutes, reminder_message)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''', tasks)
+
+def bench_tables(count, rng):
+    now = int(time.time())
+    start = time.perf_counter()
+    fill_tables(count, now, rng)
+    print(f"tables: inserted {count} schedule rows in {time.perf_counter() - start:.1f}s")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    backend = TableReminderBackend(TZ)
+    backend.next_fire()
+    startup = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"tables: startup {startup * 1000:.1f} ms, {len(backend._heap)} occurrences in memory, {memory / 1e6:.2f} MB")
+    start = time.perf_counter()
+    for _ in range(100):
+        backend.refresh()
+        backend.next_fire()
+    print(f"tables: full reload of the window {(time.perf_counter() - start) * 10:.1f} ms "
+          f"(only when a new schedule fires within it)")
+    _walk_clock("tables", backend, now)
+
+async def _bench_apscheduler(count, db_url):
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+
+    rng = random.Random(2)
+    scheduler = AsyncIOScheduler(jobstores={'default': SQLAlchemyJobStore(url=db_url)}, timezone=TZ)
+    scheduler.start(paused=True)
+    start = time.perf_counter()
+    for i in range(count):
+        minute = _random_minute(rng)
+        scheduler.add_job(noop_callback, 'cron', day_of_week="mon,wed,fri", hour=minute // 60, minute=minute % 60,
+                          args=[100000 + i // 5, TEXT], id=f"{i}:recurring:{i}:main", misfire_grace_time=60)
+    added = time.perf_counter() - start
+    scheduler.shutdown(wait=False)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    scheduler = AsyncIOScheduler(jobstores={'default': SQLAlchemyJobStore(url=db_url)}, timezone=TZ)
+    scheduler.start(paused=True)
+    jobs = scheduler.get_jobs()
+    startup = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    scheduler.shutdown(wait=False)
+    return added, startup, memory, len(jobs)
+
+def bench_apscheduler(count, target, directory):
+    db_url = f"sqlite:///{os.path.join(directory, 'jobs.db')}"
+    added, startup, memory, jobs = asyncio.run(_bench_apscheduler(count, db_url))
+    scale = target / count
+    print(f"apscheduler: added {count} jobs in {added:.1f}s; start + get_jobs() {startup * 1000:.0f} ms, "
+          f"{memory / 1e6:.1f} MB for {jobs} jobs")
+    print(f"apscheduler: extrapolated to {target}: add {added * scale / 60:.0f} min, "
+          f"start + get_jobs() {startup * scale:.0f} s, {memory * scale / 1e9:.1f} GB")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--apscheduler-count", type=int, default=10_000, help="0 to skip")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DB_PATH = os.path.join(directory, "bench.db")
+        database.init_db()
+        bench_tables(args.count, random.Random(1))
+        bench_light(args.count, random.Random(1))
+        database.close_connection()
+        if args.apscheduler_count:
+            bench_apscheduler(args.apscheduler_count, args.count, directory)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,76 @@
 import os
+import re
 import sqlite3
 import json
-from datetime import datetime
+import logging
+import threading
+import time
+from datetime import datetime, date, timedelta
+
+from cache import LRUCache
+import metrics
+from text_utils import normalize_text, fold_diacritics
+import recurrence
+
+logger = logging.getLogger(__name__)
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DB_PATH = os.path.join(BASE_DIR, "data", "bot_data.db")
 
+# Connection tuning (see get_connection)
+SQLITE_CACHE_SIZE_KB = 8192          # Page cache per connection
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024  # Memory-mapped I/O window
+SQLITE_CACHED_STATEMENTS = 256       # Prepared statements kept per connection
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+
+# Per-user read cache: ("schedules", user_id) -> recurring schedules,
+# ("tasks", user_id) -> (window_start, window_end, tasks_by_date) for upcoming days.
+# Write functions below invalidate the affected user's entries.
+AGENDA_CACHE_SIZE = 8192        # Entries (two per active user)
+AGENDA_CACHE_TTL = 600          # Seconds; bounds staleness if another process writes
+UPCOMING_TASK_DAYS = 14         # Days of tasks loaded per cache fill
+_agenda_cache = LRUCache(maxsize=AGENDA_CACHE_SIZE, ttl=AGENDA_CACHE_TTL)
+
+def get_connection():
+    """
+    Returns the calling thread's long-lived connection to DB_PATH, opening it on first use.
+    The database runs in WAL mode so readers never block the writer.
+    Wrap writes in `with conn:` to commit (or roll back) them.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+    if conn is not None:
+        # DB_PATH was changed (e.g. tests/benchmarks), reopen
+        conn.close()
+
+    db_dir = os.path.dirname(DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, cached_statements=SQLITE_CACHED_STATEMENTS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+    _local.conn = conn
+    _local.path = DB_PATH
+    return conn
+
+def close_connection():
+    """Closes the calling thread's connection (it is reopened on next use)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     c = conn.cursor()
     
     # Table for user preferences/profile
@@ -38,66 +100,431 @@ def init_db():
                   created_at TEXT)''')
                   
     conn.commit()
-    conn.close()
+    migrate(conn)
 
-# ... (existing functions) ...
+# --- Schema migrations ---
+# Each step upgrades the schema by one version. PRAGMA user_version records the
+# last applied step, so existing bot_data.db files are upgraded in place by init_db().
 
-def add_recurring_schedule(user_id, description, frequency, time, end_date=None):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-              (user_id, description, frequency, time, end_date, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+def _migrate_v1_task_dates(conn):
+    """Adds a typed schedule_date column (YYYY-MM-DD) and indexes for per-user date lookups."""
+    conn.execute("ALTER TABLE tasks ADD COLUMN schedule_date TEXT")
+    conn.execute("UPDATE tasks SET schedule_date = substr(schedule_time, 1, 10) WHERE schedule_time IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_user_date ON tasks (user_id, schedule_date, schedule_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring_schedules (user_id)")
+
+def _migrate_v2_task_date_index(conn):
+    """Index for loading one day's tasks across all users (daily briefing)."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_date ON tasks (schedule_date)")
+
+def _migrate_v3_intent_cache(conn):
+    """Persistent tier of the intent cache (see intent_cache.py)."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS intent_cache
+                 (cache_key TEXT PRIMARY KEY, response TEXT, created_at REAL, last_used REAL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_intent_cache_last_used ON intent_cache (last_used)")
+
+def _migrate_v4_conversation_history(conn):
+    """Persistent chat history (see history.py) with one rolling summary per user."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS conversation_turns
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, role TEXT, content TEXT, created_at TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_user ON conversation_turns (user_id, id)")
+    conn.execute('''CREATE TABLE IF NOT EXISTS conversation_summaries
+                 (user_id INTEGER PRIMARY KEY, summary TEXT, updated_at TEXT)''')
+
+def _migrate_v5_unique_schedules(conn):
+    """
+    Adds description_key (see description_key()) and unique indexes so duplicates are
+    rejected by SQLite itself. Existing duplicates are removed first, keeping the oldest row;
+    the removed rows are copied to <table>_removed_duplicates (with kept_id, the row they
+    duplicated) and logged.
+    """
+    conn.create_function("description_key", 1, description_key, deterministic=True)
+    for table, columns in (("tasks", "user_id, schedule_time, description_key"),
+                           ("recurring_schedules", "user_id, frequency, time, description_key")):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN description_key TEXT")
+        conn.execute(f"UPDATE {table} SET description_key = description_key(description)")
+        kept = f"SELECT MIN(id) AS kept_id, {columns} FROM {table} GROUP BY {columns}"
+        conn.execute(f'''CREATE TABLE IF NOT EXISTS {table}_removed_duplicates AS
+                         SELECT t.*, k.kept_id FROM {table} t JOIN ({kept}) k USING ({columns})
+                         WHERE t.id != k.kept_id''')
+        removed = conn.execute(f"SELECT id, kept_id, description FROM {table}_removed_duplicates").fetchall()
+        for row_id, kept_id, description in removed:
+            logger.warning(f"Migration v5: {table} row {row_id} ({description!r}) duplicates row {kept_id}, removed")
+        if removed:
+            logger.warning(f"Migration v5: {len(removed)} duplicate {table} rows copied to {table}_removed_duplicates")
+        conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table}_removed_duplicates)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_unique ON tasks (user_id, schedule_time, description_key)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_recurring_unique ON recurring_schedules (user_id, frequency, time, description_key)")
+
+def _migrate_v6_schedule_search(conn):
+    """
+    FTS5 index over task and recurring schedule descriptions (see search_schedules).
+    rowid = id * 2 for tasks, id * 2 + 1 for recurring schedules.
+    """
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS schedule_search USING fts5
+                    (description, folded, tokenize = "unicode61 remove_diacritics 0 tokenchars '_'")''')
+    for kind, table in (("task", "tasks"), ("recurring", "recurring_schedules")):
+        rows = conn.execute(f"SELECT id, user_id, description FROM {table}").fetchall()
+        conn.executemany("INSERT INTO schedule_search (rowid, description, folded) VALUES (?, ?, ?)",
+                         [_search_row(kind, *row) for row in rows])
+
+def _migrate_v7_reminders(conn):
+    """
+    Compact reminder rows for the lightweight reminder backend (see reminder_backend.py).
+    next_fire is a Unix timestamp; recurring rows also carry a weekday bitmask (bit 0 = Monday),
+    the minute of the day and an optional last-fire timestamp.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS reminders
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  chat_id INTEGER NOT NULL,
+                  kind TEXT,
+                  schedule_id INTEGER,
+                  slot TEXT,
+                  next_fire INTEGER NOT NULL,
+                  days_mask INTEGER,
+                  minute_of_day INTEGER,
+                  end_fire INTEGER,
+                  text TEXT)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_next_fire ON reminders (next_fire, id)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_reminders_schedule ON reminders (chat_id, kind, schedule_id, slot)")
+
+def _migrate_v8_schedule_reminders(conn):
+    """
+    Reminder settings on the schedule rows themselves, so reminders can be derived from
+    tasks / recurring_schedules (see TableReminderBackend). Rows with a reminder_message
+    get reminders; remind_at / remind_time are the early reminder's local time, kept by
+    SQLite itself as indexed generated columns.
+    """
+    for table in ("tasks", "recurring_schedules"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN chat_id INTEGER")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN remind_before_minutes INTEGER NOT NULL DEFAULT 0")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN reminder_message TEXT")
+    conn.execute('''ALTER TABLE tasks ADD COLUMN remind_at TEXT GENERATED ALWAYS AS
+                    (CASE WHEN remind_before_minutes > 0
+                     THEN strftime('%Y-%m-%dT%H:%M:%S', schedule_time, '-' || remind_before_minutes || ' minutes') END) VIRTUAL''')
+    conn.execute('''ALTER TABLE recurring_schedules ADD COLUMN remind_time TEXT GENERATED ALWAYS AS
+                    (CASE WHEN remind_before_minutes > 0
+                     THEN strftime('%H:%M', time, '-' || remind_before_minutes || ' minutes') END) VIRTUAL''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_reminder_time ON tasks (schedule_time) WHERE reminder_message IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_remind_at ON tasks (remind_at) WHERE reminder_message IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_reminder_time ON recurring_schedules (time) WHERE reminder_message IS NOT NULL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_remind_time ON recurring_schedules (remind_time) WHERE reminder_message IS NOT NULL")
+    conn.execute("CREATE TABLE IF NOT EXISTS scheduler_state (name TEXT PRIMARY KEY, value TEXT)")
+
+def _migrate_v9_reminder_deliveries(conn):
+    """
+    One row per reminder occurrence handed to the sender (see ReminderTimer._deliver).
+    The primary key makes delivery idempotent; text is kept only until the send finishes.
+    """
+    conn.execute('''CREATE TABLE IF NOT EXISTS reminder_deliveries
+                 (reminder_key TEXT PRIMARY KEY,
+                  chat_id INTEGER,
+                  fire_time INTEGER,
+                  text TEXT,
+                  status TEXT,
+                  sent_at REAL,
+                  lateness REAL)''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_fire ON reminder_deliveries (fire_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_pending ON reminder_deliveries (status) WHERE status = 'pending'")
+
+def _migrate_v10_leases(conn):
+    """Named leases held by one process at a time (WORKERS > 1: the scheduler leader, see leader.py)."""
+    conn.execute('''CREATE TABLE IF NOT EXISTS leases
+                 (name TEXT PRIMARY KEY,
+                  holder TEXT,
+                  expires_at REAL)''')
+
+def _migrate_v11_recurring_masks(conn):
+    """
+    days_mask (bit 0 = Monday) and minute_of_day for recurring_schedules, parsed once
+    from the frequency / time text (see recurrence.py) instead of on every read.
+    """
+    conn.execute("ALTER TABLE recurring_schedules ADD COLUMN days_mask INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE recurring_schedules ADD COLUMN minute_of_day INTEGER")
+    rows = conn.execute("SELECT id, frequency, time FROM recurring_schedules").fetchall()
+    conn.executemany("UPDATE recurring_schedules SET days_mask = ?, minute_of_day = ? WHERE id = ?",
+                     [(recurrence.days_to_mask(frequency or ""), recurrence.parse_minute_of_day(time_value), schedule_id)
+                      for schedule_id, frequency, time_value in rows])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_reminder_minute ON recurring_schedules (minute_of_day) WHERE reminder_message IS NOT NULL")
+
+def _migrate_v12_recurring_remind_minute(conn):
+    """
+    remind_minute: minute of the day of a recurring schedule's early reminder, derived from
+    minute_of_day like the main slot. The text remind_time of v8 is NULL for times such as
+    '8:05', so those schedules never got their early reminder.
+    """
+    conn.execute('''ALTER TABLE recurring_schedules ADD COLUMN remind_minute INTEGER GENERATED ALWAYS AS
+                    (CASE WHEN remind_before_minutes > 0 AND minute_of_day IS NOT NULL
+                     THEN ((minute_of_day - remind_before_minutes) % 1440 + 1440) % 1440 END) VIRTUAL''')
+    conn.execute("DROP INDEX IF EXISTS idx_recurring_remind_time")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_remind_minute ON recurring_schedules (remind_minute) WHERE reminder_message IS NOT NULL")
+
+MIGRATIONS = [
+    _migrate_v1_task_dates,
+    _migrate_v2_task_date_index,
+    _migrate_v3_intent_cache,
+    _migrate_v4_conversation_history,
+    _migrate_v5_unique_schedules,
+    _migrate_v6_schedule_search,
+    _migrate_v7_reminders,
+    _migrate_v8_schedule_reminders,
+    _migrate_v9_reminder_deliveries,
+    _migrate_v10_leases,
+    _migrate_v11_recurring_masks,
+    _migrate_v12_recurring_remind_minute,
+]
+
+def get_schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(conn=None):
+    """Applies pending migrations, each in its own transaction. Returns the new schema version."""
+    conn = conn or get_connection()
+    version = get_schema_version(conn)
+    for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute("BEGIN")
+        try:
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = target
+    return version
+
+_KEY_PUNCTUATION = re.compile(r"[.,:/-]+")
+
+def description_key(description):
+    """
+    Normalised description used for duplicate detection:
+    'Lịch  Học TOEIC!' -> 'học toeic' (case, punctuation, spacing and a leading "lịch" ignored).
+    """
+    key = _KEY_PUNCTUATION.sub(" ", normalize_text(description or "")).strip()
+    key = " ".join(key.split())
+    if key.startswith("lịch "):
+        key = key[5:]
+    return key
+
+# --- Full-text search over schedule descriptions ---
+# schedule_search is written by the same transactions that insert or delete tasks and
+# recurring schedules. "description" keeps the accents, "folded" is fold_diacritics() of it
+# ("Học TOEIC" -> "hoc toeic"), so both accent-sensitive and accent-insensitive matching work.
+
+SEARCH_KINDS = {"task": 0, "recurring": 1}
+
+def _search_rowid(kind, schedule_id):
+    return schedule_id * 2 + SEARCH_KINDS[kind]
+
+def _owner_terms(user_id, text):
+    # Every indexed word carries its owner ("7_toeic"), so a lookup only walks that
+    # user's postings instead of every user's rows containing the word
+    owner = str(user_id).replace("-", "n")
+    return [f"{owner}_{word}" for word in re.findall(r"\w+", text.lower())]
+
+def _search_row(kind, schedule_id, user_id, description):
+    description = description or ""
+    return (_search_rowid(kind, schedule_id),
+            " ".join(_owner_terms(user_id, description)),
+            " ".join(_owner_terms(user_id, fold_diacritics(description))))
+
+def _index_schedule(conn, kind, schedule_id, user_id, description):
+    conn.execute("INSERT INTO schedule_search (rowid, description, folded) VALUES (?, ?, ?)",
+                 _search_row(kind, schedule_id, user_id, description))
+
+def _unindex_schedules(conn, kind, schedule_ids):
+    conn.executemany("DELETE FROM schedule_search WHERE rowid = ?",
+                     [(_search_rowid(kind, schedule_id),) for schedule_id in schedule_ids])
+
+def _search_query(user_id, keyword, accent_insensitive):
+    """FTS5 MATCH expression: every keyword word as a prefix of one of the user's words."""
+    text = normalize_text(keyword or "")
+    if accent_insensitive:
+        text = fold_diacritics(text)
+    terms = _owner_terms(user_id, text)
+    if not terms:
+        return None
+    column = "folded" if accent_insensitive else "description"
+    return f"{column} : (" + " ".join(f'"{term}"*' for term in terms) + ")"
+
+def _search_ids(conn, user_id, keyword, kind, accent_insensitive=None, limit=None):
+    """Matching ids of one kind, best match first."""
+    if accent_insensitive is None:
+        # Auto mode: a keyword typed without accents matches with or without them
+        accent_insensitive = fold_diacritics(keyword or "") == (keyword or "").lower()
+    query = _search_query(user_id, keyword, accent_insensitive)
+    if query is None:
+        return []
+    rows = conn.execute("SELECT rowid FROM schedule_search WHERE schedule_search MATCH ? AND rowid % 2 = ? ORDER BY rank LIMIT ?",
+                        (query, SEARCH_KINDS[kind], limit or -1)).fetchall()
+    return [rowid // 2 for (rowid,) in rows]
+
+def search_schedules(user_id, keyword, kinds=("recurring", "task"), accent_insensitive=None, limit=50):
+    """
+    Ranked (bm25) search over the user's task and recurring schedule descriptions.
+    Every word of `keyword` must match the start of a word ("toe" finds "Học TOEIC").
+    accent_insensitive: True = "hoc" and "học" match each other; False = accents must match;
+                        None = insensitive only when the keyword itself has no accents.
+    Returns {"recurring": [schedule dicts], "task": [task dicts]} in rank order.
+    """
+    conn = get_connection()
+    results = {}
+    for kind in kinds:
+        ids = _search_ids(conn, user_id, keyword, kind, accent_insensitive, limit)
+        if not ids:
+            results[kind] = []
+            continue
+        marks = ",".join("?" * len(ids))
+        if kind == "recurring":
+            rows = conn.execute(f"SELECT {_SCHEDULE_COLUMNS} FROM recurring_schedules WHERE id IN ({marks})", ids)
+            by_id = {row[0]: _schedule_from_row(*row) for row in rows}
+        else:
+            rows = conn.execute(f"SELECT id, description, schedule_time FROM tasks WHERE id IN ({marks})", ids)
+            by_id = {row[0]: {"id": row[0], "description": row[1], "schedule_time": row[2]} for row in rows}
+        results[kind] = [by_id[i] for i in ids if i in by_id]
+    return results
+
+def _date_part(schedule_time):
+    """'2025-11-24T20:00:00' -> '2025-11-24' (value stored in tasks.schedule_date)."""
+    return schedule_time[:10] if schedule_time else None
+
+def _invalidate_schedules(user_id):
+    _agenda_cache.pop(("schedules", user_id))
+
+def _invalidate_tasks(user_id):
+    _agenda_cache.pop(("tasks", user_id))
+
+def get_cache_stats():
+    """Hit/miss counters of the per-user agenda cache."""
+    return _agenda_cache.stats()
+
+def add_recurring_schedule(user_id, description, frequency, time, end_date=None,
+                           chat_id=None, remind_before_minutes=0, reminder_message=None):
+    """
+    Returns the new recurring_schedules.id. Raises sqlite3.IntegrityError for a duplicate.
+    reminder_message: text sent at `time`; None = no reminders for this schedule.
+    """
+    conn = get_connection()
+    with conn:
+        schedule_id = conn.execute('''INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, created_at, description_key,
+                                                                       chat_id, remind_before_minutes, reminder_message, days_mask, minute_of_day)
+                                      VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                                   (user_id, description, frequency, time, end_date, datetime.now().isoformat(), description_key(description),
+                                    chat_id, remind_before_minutes or 0, reminder_message,
+                                    recurrence.days_to_mask(frequency or ""), recurrence.parse_minute_of_day(time))).lastrowid
+        _index_schedule(conn, "recurring", schedule_id, user_id, description)
+    _invalidate_schedules(user_id)
+    return schedule_id
+
+def add_recurring_schedule_if_absent(user_id, description, frequency, time, end_date=None,
+                                     chat_id=None, remind_before_minutes=0, reminder_message=None):
+    """
+    Inserts the schedule unless the user already has one with the same days, time and
+    description_key. Single statement, safe under concurrent handlers.
+    Returns (schedule_id, created); on a duplicate schedule_id is the existing row's id.
+    """
+    key = description_key(description)
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, created_at, description_key,
+                                                               chat_id, remind_before_minutes, reminder_message, days_mask, minute_of_day)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (user_id, frequency, time, description_key) DO NOTHING RETURNING id''',
+                           (user_id, description, frequency, time, end_date, datetime.now().isoformat(), key,
+                            chat_id, remind_before_minutes or 0, reminder_message,
+                            recurrence.days_to_mask(frequency or ""), recurrence.parse_minute_of_day(time))).fetchone()
+        if row:
+            _index_schedule(conn, "recurring", row[0], user_id, description)
+    if row:
+        _invalidate_schedules(user_id)
+        return row[0], True
+    existing = conn.execute("SELECT id FROM recurring_schedules WHERE user_id = ? AND frequency = ? AND time = ? AND description_key = ?",
+                            (user_id, frequency, time, key)).fetchone()
+    return (existing[0] if existing else None), False
+
+_SCHEDULE_COLUMNS = "id, description, frequency, time, end_date, days_mask, minute_of_day"
+
+def _schedule_from_row(schedule_id, description, frequency, time_value, end_date, days_mask, minute_of_day):
+    return {
+        "id": schedule_id,
+        "description": description,
+        "days_of_week": frequency if frequency else "", # frequency column stores days (e.g., "mon,wed")
+        "time": time_value,
+        "end_date": end_date,
+        "days_mask": days_mask or 0,        # Bit 0 = Monday
+        "minute_of_day": minute_of_day,     # None when `time` is not a valid HH:MM
+    }
 
 def get_all_schedules(user_id):
     """
     Returns a list of recurring schedules as dictionaries.
+    Served from the per-user cache when possible; treat the result as read-only.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT description, frequency, time, end_date FROM recurring_schedules WHERE user_id = ?", (user_id,))
-    rows = c.fetchall()
-    conn.close()
-    
-    schedules = []
-    for row in rows:
-        schedules.append({
-            "description": row[0],
-            "days_of_week": row[1] if row[1] else "", # frequency column stores days (e.g., "mon,wed")
-            "time": row[2],
-            "end_date": row[3]
-        })
+    schedules = _agenda_cache.get(("schedules", user_id))
+    if schedules is not None:
+        return schedules
+
+    conn = get_connection()
+    rows = conn.execute(f"SELECT {_SCHEDULE_COLUMNS} FROM recurring_schedules WHERE user_id = ?", (user_id,)).fetchall()
+    schedules = [_schedule_from_row(*row) for row in rows]
+    _agenda_cache.set(("schedules", user_id), schedules)
     return schedules
 
 def add_user(user_id, username):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO users (user_id, username, joined_at) VALUES (?, ?, ?)",
-              (user_id, username, datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO users (user_id, username, joined_at) VALUES (?, ?, ?)",
+                     (user_id, username, datetime.now().isoformat()))
 
-def add_task(user_id, description, schedule_time):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO tasks (user_id, description, schedule_time, status, created_at) VALUES (?, ?, ?, ?, ?)",
-              (user_id, description, schedule_time, 'pending', datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+def add_task(user_id, description, schedule_time, chat_id=None, remind_before_minutes=0, reminder_message=None):
+    """
+    Returns the new tasks.id. Raises sqlite3.IntegrityError for a duplicate.
+    reminder_message: text sent at schedule_time; None = no reminders for this task.
+    """
+    conn = get_connection()
+    with conn:
+        task_id = conn.execute('''INSERT INTO tasks (user_id, description, schedule_time, schedule_date, status, created_at, description_key,
+                                                   chat_id, remind_before_minutes, reminder_message)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                               (user_id, description, schedule_time, _date_part(schedule_time), 'pending', datetime.now().isoformat(),
+                                description_key(description), chat_id, remind_before_minutes or 0, reminder_message)).lastrowid
+        _index_schedule(conn, "task", task_id, user_id, description)
+    _invalidate_tasks(user_id)
+    return task_id
+
+def add_task_if_absent(user_id, description, schedule_time, chat_id=None, remind_before_minutes=0, reminder_message=None):
+    """
+    Inserts the task unless the user already has one at the same time with the same
+    description_key. Single statement, safe under concurrent handlers.
+    Returns (task_id, created); on a duplicate task_id is the existing row's id.
+    """
+    key = description_key(description)
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''INSERT INTO tasks (user_id, description, schedule_time, schedule_date, status, created_at, description_key,
+                                                 chat_id, remind_before_minutes, reminder_message)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (user_id, schedule_time, description_key) DO NOTHING RETURNING id''',
+                           (user_id, description, schedule_time, _date_part(schedule_time), 'pending',
+                            datetime.now().isoformat(), key, chat_id, remind_before_minutes or 0, reminder_message)).fetchone()
+        if row:
+            _index_schedule(conn, "task", row[0], user_id, description)
+    if row:
+        _invalidate_tasks(user_id)
+        return row[0], True
+    existing = conn.execute("SELECT id FROM tasks WHERE user_id = ? AND schedule_time = ? AND description_key = ?",
+                            (user_id, schedule_time, key)).fetchone()
+    return (existing[0] if existing else None), False
 
 def get_tasks_for_date(user_id, target_date_str):
     """
     target_date_str: YYYY-MM-DD
     Returns list of dictionaries: {'description': ..., 'schedule_time': ...}
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Simple string matching for date part of ISO string
-    c.execute("SELECT description, schedule_time FROM tasks WHERE user_id = ? AND schedule_time LIKE ?", 
-              (user_id, f"{target_date_str}%"))
-    rows = c.fetchall()
-    conn.close()
+    conn = get_connection()
+    rows = conn.execute("SELECT description, schedule_time FROM tasks WHERE user_id = ? AND schedule_date = ? ORDER BY schedule_time", 
+                        (user_id, target_date_str)).fetchall()
     
     tasks = []
     for row in rows:
@@ -107,96 +534,501 @@ def get_tasks_for_date(user_id, target_date_str):
         })
     return tasks
 
+def get_tasks_in_range(user_id, start_date_str, end_date_str):
+    """
+    Returns tasks with start_date_str <= date < end_date_str (both YYYY-MM-DD),
+    as dictionaries: {'description': ..., 'schedule_time': ..., 'schedule_date': ...}
+    Uses the (user_id, schedule_date) index, so cost depends on the range, not the table size.
+    """
+    conn = get_connection()
+    rows = conn.execute("SELECT description, schedule_time, schedule_date FROM tasks WHERE user_id = ? AND schedule_date >= ? AND schedule_date < ? ORDER BY schedule_date, schedule_time",
+                        (user_id, start_date_str, end_date_str)).fetchall()
+    return [{"description": row[0], "schedule_time": row[1], "schedule_date": row[2]} for row in rows]
+
+def get_agenda(user_id, start_date_str, end_date_str):
+    """
+    Returns the user's agenda for start_date_str <= date < end_date_str (both YYYY-MM-DD)
+    as one entry per day, in order:
+    {'date': 'YYYY-MM-DD', 'weekday': 0-6, 'tasks': [...], 'recurring': [...]}
+    'tasks' are one-off tasks of that day (same dicts as get_tasks_for_date), 'recurring'
+    are the recurring schedules falling on that weekday and not past their end_date
+    (same dicts as get_all_schedules). Both lists are sorted by time.
+    Served from the per-user cache when possible; on a cold cache, tasks for the next
+    UPCOMING_TASK_DAYS days and the recurring schedules are read in a single query.
+    """
+    recurring = _agenda_cache.get(("schedules", user_id))
+    tasks_by_date = None
+    cached_tasks = _agenda_cache.get(("tasks", user_id))
+    if cached_tasks is not None and cached_tasks[0] <= start_date_str and end_date_str <= cached_tasks[1]:
+        tasks_by_date = cached_tasks[2]
+    if recurring is not None and tasks_by_date is not None:
+        return _expand_agenda(start_date_str, end_date_str, tasks_by_date, recurring)
+
+    window_end = max(end_date_str, (date.fromisoformat(start_date_str) + timedelta(days=UPCOMING_TASK_DAYS)).isoformat())
+    conn = get_connection()
+    if tasks_by_date is None:
+        load_recurring = recurring is None
+        rows = conn.execute(
+            """SELECT 0, id, description, schedule_time, schedule_date, NULL, NULL, NULL FROM tasks
+               WHERE user_id = ? AND schedule_date >= ? AND schedule_date < ?
+               UNION ALL
+               SELECT 1, id, description, time, frequency, end_date, days_mask, minute_of_day FROM recurring_schedules
+               WHERE user_id = ? AND ?""",
+            (user_id, start_date_str, window_end, user_id, load_recurring)).fetchall()
+
+        tasks_by_date = {}
+        if load_recurring:
+            recurring = []
+        for kind, row_id, description, time_value, extra, end_date, days_mask, minute_of_day in rows:
+            if kind == 0:
+                tasks_by_date.setdefault(extra, []).append({"id": row_id, "description": description, "schedule_time": time_value})
+            else:
+                recurring.append(_schedule_from_row(row_id, description, extra, time_value, end_date, days_mask, minute_of_day))
+        _agenda_cache.set(("tasks", user_id), (start_date_str, window_end, tasks_by_date))
+        if load_recurring:
+            _agenda_cache.set(("schedules", user_id), recurring)
+    else:
+        recurring = get_all_schedules(user_id)
+    return _expand_agenda(start_date_str, end_date_str, tasks_by_date, recurring)
+
+def get_all_agendas(start_date_str, end_date_str):
+    """
+    Bulk version of get_agenda for every user, in two queries.
+    Returns {user_id: agenda} for users that have at least one task in the range
+    or at least one recurring schedule.
+    The recurring schedules of all users are expanded together, in one recurrence.expand() pass.
+    """
+    conn = get_connection()
+    tasks_by_user = {}
+    for user_id, task_id, description, schedule_time, schedule_date in conn.execute(
+            "SELECT user_id, id, description, schedule_time, schedule_date FROM tasks WHERE schedule_date >= ? AND schedule_date < ?",
+            (start_date_str, end_date_str)):
+        tasks_by_user.setdefault(user_id, {}).setdefault(schedule_date, []).append({"id": task_id, "description": description, "schedule_time": schedule_time})
+
+    owners = []
+    recurring = []
+    for user_id, *row in conn.execute(f"SELECT user_id, {_SCHEDULE_COLUMNS} FROM recurring_schedules"):
+        owners.append(user_id)
+        recurring.append(_schedule_from_row(*row))
+
+    agendas = {
+        user_id: _expand_agenda(start_date_str, end_date_str, tasks_by_user.get(user_id, {}), [])
+        for user_id in tasks_by_user.keys() | set(owners)
+    }
+    start = date.fromisoformat(start_date_str)
+    days = (date.fromisoformat(end_date_str) - start).days
+    # Occurrences come sorted by time, so each user's list stays sorted
+    for offset, indexes in enumerate(_recurring_by_day(start, days, recurring)):
+        for i in indexes:
+            agendas[owners[i]][offset]["recurring"].append(recurring[i])
+    return agendas
+
+def _recurring_by_day(start, days, recurring):
+    """recurrence.expand() for schedule dicts: per day, indexes into `recurring` sorted by time."""
+    return recurrence.expand(start, days, [r['days_mask'] for r in recurring], [r['minute_of_day'] for r in recurring],
+                             [recurrence.end_ordinal(r['end_date']) for r in recurring])
+
+def _expand_agenda(start_date_str, end_date_str, tasks_by_date, recurring):
+    start = date.fromisoformat(start_date_str)
+    days = (date.fromisoformat(end_date_str) - start).days
+    by_day = _recurring_by_day(start, days, recurring) if recurring else None
+
+    agenda = []
+    for offset in range(max(days, 0)):
+        current = start + timedelta(days=offset)
+        date_str = current.isoformat()
+        agenda.append({
+            "date": date_str,
+            "weekday": current.weekday(),
+            "tasks": sorted(tasks_by_date.get(date_str, []), key=lambda t: t['schedule_time']),
+            "recurring": [recurring[i] for i in by_day[offset]] if by_day else [],
+        })
+    return agenda
+
+def _delete_by_ids(conn, table, kind, user_id, ids):
+    if not ids:
+        return []
+    marks = ",".join("?" * len(ids))
+    deleted = [row[0] for row in conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND id IN ({marks}) RETURNING id", (user_id, *ids))]
+    _unindex_schedules(conn, kind, deleted)
+    return deleted
+
+def _phrase_ids(conn, table, kind, user_id, keyword):
+    """
+    Ids whose description contains `keyword` as a whole phrase, accents included:
+    "học toeic" matches "Học TOEIC part 5" but "hoc" or "toe" match nothing there.
+    Deletes use this instead of the prefix search so a short keyword cannot remove unrelated rows.
+    """
+    phrase = normalize_text(keyword or "")
+    if not phrase:
+        return []
+    ids = _search_ids(conn, user_id, phrase, kind, accent_insensitive=False)
+    if not ids:
+        return []
+    pattern = re.compile(r"(?<!\w)" + re.escape(phrase) + r"(?!\w)")
+    marks = ",".join("?" * len(ids))
+    rows = conn.execute(f"SELECT id, description FROM {table} WHERE id IN ({marks})", ids)
+    return [schedule_id for schedule_id, description in rows if pattern.search(normalize_text(description or ""))]
+
 def delete_task(user_id, description_keyword):
-    """Deletes a one-off task matching the keyword."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM tasks WHERE user_id = ? AND description LIKE ?", (user_id, f"%{description_keyword}%"))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows > 0
+    """
+    Deletes one-off tasks whose description contains the keyword as a whole phrase (see _phrase_ids).
+    Returns the deleted ids (empty list if none).
+    """
+    conn = get_connection()
+    with conn:
+        ids = _delete_by_ids(conn, "tasks", "task", user_id,
+                             _phrase_ids(conn, "tasks", "task", user_id, description_keyword))
+    _invalidate_tasks(user_id)
+    return ids
 
 def delete_recurring_schedule(user_id, description_keyword):
-    """Deletes a recurring schedule matching the keyword."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM recurring_schedules WHERE user_id = ? AND description LIKE ?", (user_id, f"%{description_keyword}%"))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
+    """
+    Deletes recurring schedules whose description contains the keyword as a whole phrase (see _phrase_ids).
+    Returns the deleted ids (empty list if none).
+    """
+    conn = get_connection()
+    with conn:
+        ids = _delete_by_ids(conn, "recurring_schedules", "recurring", user_id,
+                             _phrase_ids(conn, "recurring_schedules", "recurring", user_id, description_keyword))
+    _invalidate_schedules(user_id)
+    return ids
+
+def delete_recurring_schedule_by_id(user_id, schedule_id):
+    """Deletes one recurring schedule. Returns True if it existed."""
+    conn = get_connection()
+    with conn:
+        rows = conn.execute("DELETE FROM recurring_schedules WHERE user_id = ? AND id = ?", (user_id, schedule_id)).rowcount
+        if rows:
+            _unindex_schedules(conn, "recurring", [schedule_id])
+    _invalidate_schedules(user_id)
     return rows > 0
 
 def update_user_goal(user_id, goal_text):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("UPDATE users SET goals = ? WHERE user_id = ?", (goal_text, user_id))
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE users SET goals = ? WHERE user_id = ?", (goal_text, user_id))
 
 def get_user_goals(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT goals FROM users WHERE user_id = ?", (user_id,))
-    result = c.fetchone()
-    conn.close()
+    conn = get_connection()
+    result = conn.execute("SELECT goals FROM users WHERE user_id = ?", (user_id,)).fetchone()
     return result[0] if result else None
 
 def delete_all_tasks(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM tasks WHERE user_id = ?", (user_id,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows
+    conn = get_connection()
+    with conn:
+        ids = [row[0] for row in conn.execute("DELETE FROM tasks WHERE user_id = ? RETURNING id", (user_id,))]
+        _unindex_schedules(conn, "task", ids)
+    _invalidate_tasks(user_id)
+    return len(ids)
 
 def delete_all_recurring_schedules(user_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM recurring_schedules WHERE user_id = ?", (user_id,))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows
+    conn = get_connection()
+    with conn:
+        ids = [row[0] for row in conn.execute("DELETE FROM recurring_schedules WHERE user_id = ? RETURNING id", (user_id,))]
+        _unindex_schedules(conn, "recurring", ids)
+    _invalidate_schedules(user_id)
+    return len(ids)
 
 def delete_tasks_by_date(user_id, date_str):
-    """Deletes tasks for a specific date (YYYY-MM-DD)."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM tasks WHERE user_id = ? AND schedule_time LIKE ?", (user_id, f"{date_str}%"))
-    rows = c.rowcount
-    conn.commit()
-    conn.close()
-    return rows
+    """Deletes tasks for a specific date (YYYY-MM-DD). Returns the deleted ids."""
+    conn = get_connection()
+    with conn:
+        ids = [row[0] for row in conn.execute("DELETE FROM tasks WHERE user_id = ? AND schedule_date = ? RETURNING id", (user_id, date_str))]
+        _unindex_schedules(conn, "task", ids)
+    _invalidate_tasks(user_id)
+    return ids
 
 def get_all_users():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT user_id, username, NULL as first_name FROM users") # Schema doesn't have first_name, using NULL or just username
-    users = c.fetchall()
-    conn.close()
-    return users
-    conn.commit()
-    conn.close()
-    return rows
+    conn = get_connection()
+    # Schema doesn't have first_name, using NULL or just username
+    return conn.execute("SELECT user_id, username, NULL as first_name FROM users").fetchall()
+
 def check_duplicate_recurring(user_id, description, frequency, time):
-    """Checks if a recurring schedule already exists."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Check for exact match on time and frequency, and fuzzy match on description
-    c.execute("SELECT id FROM recurring_schedules WHERE user_id = ? AND frequency = ? AND time = ? AND description LIKE ?", 
-              (user_id, frequency, time, f"%{description}%"))
-    result = c.fetchone()
-    conn.close()
+    """Checks if a recurring schedule already exists (same days, time and description_key)."""
+    conn = get_connection()
+    result = conn.execute("SELECT id FROM recurring_schedules WHERE user_id = ? AND frequency = ? AND time = ? AND description_key = ?",
+                          (user_id, frequency, time, description_key(description))).fetchone()
     return result is not None
 
 def check_duplicate_task(user_id, description, schedule_time):
-    """Checks if a one-off task already exists."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM tasks WHERE user_id = ? AND schedule_time = ? AND description LIKE ?", 
-              (user_id, schedule_time, f"%{description}%"))
-    result = c.fetchone()
-    conn.close()
+    """Checks if a one-off task already exists (same time and description_key)."""
+    conn = get_connection()
+    result = conn.execute("SELECT id FROM tasks WHERE user_id = ? AND schedule_time = ? AND description_key = ?",
+                          (user_id, schedule_time, description_key(description))).fetchone()
     return result is not None
+
+def get_cached_intent(cache_key):
+    """Returns the stored intent-cache JSON for `cache_key` (or None) and marks it as used."""
+    conn = get_connection()
+    with conn:
+        row = conn.execute("UPDATE intent_cache SET last_used = ? WHERE cache_key = ? RETURNING response",
+                           (time.time(), cache_key)).fetchone()
+    return row[0] if row else None
+
+def save_cached_intent(cache_key, response_json):
+    conn = get_connection()
+    now = time.time()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO intent_cache (cache_key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                     (cache_key, response_json, now, now))
+
+def prune_intent_cache(max_rows):
+    """Keeps only the `max_rows` most recently used intent-cache rows. Returns the number deleted."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute('''DELETE FROM intent_cache WHERE cache_key IN
+                                 (SELECT cache_key FROM intent_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)''',
+                              (max_rows,))
+    return cursor.rowcount
+
+def add_conversation_turns(user_id, turns):
+    """turns: list of (role, content), stored in order."""
+    conn = get_connection()
+    created_at = datetime.now().isoformat()
+    with conn:
+        conn.executemany("INSERT INTO conversation_turns (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                         [(user_id, role, content, created_at) for role, content in turns])
+
+def get_recent_turns(user_id, limit):
+    """Last `limit` turns of a user, oldest first: [{'role', 'content'}]."""
+    conn = get_connection()
+    rows = conn.execute("SELECT role, content FROM conversation_turns WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                        (user_id, limit)).fetchall()
+    return [{'role': role, 'content': content} for role, content in reversed(rows)]
+
+def get_conversation_summary(user_id):
+    conn = get_connection()
+    row = conn.execute("SELECT summary FROM conversation_summaries WHERE user_id = ?", (user_id,)).fetchone()
+    return row[0] if row else None
+
+def get_users_with_turns_over(limit):
+    """User ids that have more than `limit` stored turns."""
+    conn = get_connection()
+    return [row[0] for row in conn.execute(
+        "SELECT user_id FROM conversation_turns GROUP BY user_id HAVING COUNT(*) > ?", (limit,))]
+
+def get_turns_before_newest(user_id, keep):
+    """Turns older than the newest `keep`, oldest first: [(id, role, content)]."""
+    conn = get_connection()
+    return conn.execute('''SELECT id, role, content FROM conversation_turns WHERE user_id = ?
+                           ORDER BY id DESC LIMIT -1 OFFSET ?''', (user_id, keep)).fetchall()[::-1]
+
+def compact_conversation(user_id, upto_id, summary=None):
+    """Deletes a user's turns with id <= upto_id and, if given, stores the new summary, in one transaction."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute("DELETE FROM conversation_turns WHERE user_id = ? AND id <= ?", (user_id, upto_id))
+        if summary is not None:
+            conn.execute("INSERT OR REPLACE INTO conversation_summaries (user_id, summary, updated_at) VALUES (?, ?, ?)",
+                         (user_id, summary, datetime.now().isoformat()))
+    return cursor.rowcount
+
+# --- Reminder rows (lightweight reminder backend) ---
+
+REMINDER_COLUMNS = "id, chat_id, kind, schedule_id, slot, next_fire, days_mask, minute_of_day, end_fire, text"
+
+def save_reminder(chat_id, kind, schedule_id, slot, text, next_fire, days_mask=None, minute_of_day=None, end_fire=None):
+    """
+    Inserts a reminder, or replaces the one with the same (chat_id, kind, schedule_id, slot).
+    Returns the row id.
+    """
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''INSERT INTO reminders (chat_id, kind, schedule_id, slot, next_fire, days_mask, minute_of_day, end_fire, text)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (chat_id, kind, schedule_id, slot) DO UPDATE SET
+                                  next_fire = excluded.next_fire, days_mask = excluded.days_mask,
+                                  minute_of_day = excluded.minute_of_day, end_fire = excluded.end_fire, text = excluded.text
+                              RETURNING id''',
+                           (chat_id, kind, schedule_id, slot, next_fire, days_mask, minute_of_day, end_fire, text)).fetchone()
+    return row[0]
+
+def get_reminder_slots_after(after, limit):
+    """
+    (id, next_fire) of the `limit` earliest reminders with next_fire > after, earliest first.
+    Rows sharing the last returned next_fire are all included, so a caller can treat
+    that timestamp as fully loaded.
+    """
+    conn = get_connection()
+    rows = conn.execute("SELECT id, next_fire FROM reminders WHERE next_fire > ? ORDER BY next_fire, id LIMIT ?",
+                        (after, limit)).fetchall()
+    if len(rows) == limit:
+        last_id, last_fire = rows[-1]
+        rows += conn.execute("SELECT id, next_fire FROM reminders WHERE next_fire = ? AND id > ? ORDER BY id",
+                             (last_fire, last_id)).fetchall()
+    return rows
+
+def get_reminders(ids):
+    """Full reminder rows (REMINDER_COLUMNS order) for the given ids; missing ids are skipped."""
+    conn = get_connection()
+    rows = []
+    # Stay under SQLite's bound-parameter limit
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        rows += conn.execute(f"SELECT {REMINDER_COLUMNS} FROM reminders WHERE id IN ({marks})", chunk).fetchall()
+    return rows
+
+def finish_fired_reminders(reschedule, delete_ids):
+    """reschedule: [(next_fire, id)] for recurring rows; delete_ids: finished rows. One transaction."""
+    conn = get_connection()
+    with conn:
+        conn.executemany("UPDATE reminders SET next_fire = ? WHERE id = ?", reschedule)
+        conn.executemany("DELETE FROM reminders WHERE id = ?", [(i,) for i in delete_ids])
+
+def delete_reminders(chat_id, kind=None, schedule_id=None):
+    """Deletes a chat's reminders, optionally only those of one schedule row. Returns the deleted ids."""
+    conn = get_connection()
+    with conn:
+        if kind is None:
+            rows = conn.execute("DELETE FROM reminders WHERE chat_id = ? RETURNING id", (chat_id,))
+        else:
+            rows = conn.execute("DELETE FROM reminders WHERE chat_id = ? AND kind = ? AND schedule_id = ? RETURNING id",
+                                (chat_id, kind, schedule_id))
+        return [row[0] for row in rows]
+
+def delete_reminders_matching(chat_id, keyword):
+    """Deletes a chat's reminders without a schedule row whose text contains keyword. Returns the deleted ids."""
+    conn = get_connection()
+    with conn:
+        rows = conn.execute("DELETE FROM reminders WHERE chat_id = ? AND schedule_id IS NULL AND text LIKE ? RETURNING id",
+                            (chat_id, f"%{keyword}%"))
+        return [row[0] for row in rows]
+
+def count_reminders():
+    conn = get_connection()
+    return conn.execute("SELECT COUNT(*) FROM reminders").fetchone()[0]
+
+# --- Reminders derived from the schedule tables (TableReminderBackend) ---
+# Rows: (slot, id, chat_id, description, time, remind_before_minutes, reminder_message, ...)
+
+def get_task_reminders_between(start_time, end_time):
+    """
+    One-off reminders firing in (start_time, end_time], local ISO datetimes.
+    Returns [(slot, id, chat_id, description, schedule_time, remind_before_minutes, reminder_message)];
+    slot 'main' fires at schedule_time, 'early' at remind_at.
+    """
+    conn = get_connection()
+    columns = "id, COALESCE(chat_id, user_id), description, schedule_time, remind_before_minutes, reminder_message"
+    main = conn.execute(f"""SELECT 'main', {columns} FROM tasks
+                            WHERE reminder_message IS NOT NULL AND schedule_time > ? AND schedule_time <= ?""",
+                        (start_time, end_time)).fetchall()
+    early = conn.execute(f"""SELECT 'early', {columns} FROM tasks
+                             WHERE reminder_message IS NOT NULL AND remind_at > ? AND remind_at <= ?""",
+                         (start_time, end_time)).fetchall()
+    return main + early
+
+def get_recurring_reminders_between(first_minute, last_minute):
+    """
+    Recurring reminders whose minute of the day is in [first_minute, last_minute].
+    Returns [(slot, id, chat_id, description, minute_of_day, remind_before_minutes, reminder_message, days_mask, end_date)];
+    slot 'early' rows matched on remind_minute. Weekdays and end_date are left to the caller.
+    """
+    conn = get_connection()
+    columns = "id, COALESCE(chat_id, user_id), description, minute_of_day, remind_before_minutes, reminder_message, days_mask, end_date"
+    main = conn.execute(f"""SELECT 'main', {columns} FROM recurring_schedules
+                            WHERE reminder_message IS NOT NULL AND minute_of_day >= ? AND minute_of_day <= ?""",
+                        (first_minute, last_minute)).fetchall()
+    early = conn.execute(f"""SELECT 'early', {columns} FROM recurring_schedules
+                             WHERE reminder_message IS NOT NULL AND remind_minute >= ? AND remind_minute <= ?""",
+                         (first_minute, last_minute)).fetchall()
+    return main + early
+
+def get_scheduler_state(name, default=None):
+    conn = get_connection()
+    row = conn.execute("SELECT value FROM scheduler_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else default
+
+def set_scheduler_state(name, value):
+    conn = get_connection()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO scheduler_state (name, value) VALUES (?, ?)", (name, str(value)))
+
+def bump_scheduler_state(name):
+    """Increments the counter `name` (a change notice other processes poll for). Returns the new value."""
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''INSERT INTO scheduler_state (name, value) VALUES (?, '1')
+                              ON CONFLICT (name) DO UPDATE SET value = CAST(value AS INTEGER) + 1 RETURNING value''',
+                           (name,)).fetchone()
+    return row[0]
+
+# --- Leases ---
+
+def acquire_lease(name, holder, ttl, now=None):
+    """
+    Takes lease `name` for `holder` until now + ttl if it is free, expired or already
+    held by `holder` (a renewal). Returns True when `holder` owns the lease afterwards.
+    A lease expiring after now + ttl was written before the clock went back, so it
+    counts as expired too.
+    """
+    now = time.time() if now is None else now
+    conn = get_connection()
+    with conn:
+        row = conn.execute('''INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                              ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+                              WHERE leases.holder = excluded.holder OR leases.expires_at < ? OR leases.expires_at > ?
+                              RETURNING holder''',
+                           (name, holder, now + ttl, now, now + ttl)).fetchone()
+    return row is not None
+
+def release_lease(name, holder):
+    """Gives up lease `name` if `holder` owns it, so another process can take it right away."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+def get_lease(name):
+    """(holder, expires_at) of lease `name`, or None."""
+    conn = get_connection()
+    return conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+
+# --- Reminder delivery log ---
+
+def claim_reminder_deliveries(reminders):
+    """
+    reminders: [(reminder_key, chat_id, fire_time, text)]
+    Records them as pending and returns the keys that were not claimed before, in one
+    transaction; only those should be sent.
+    """
+    conn = get_connection()
+    claimed = []
+    with conn:
+        for reminder_key, chat_id, fire_time, text in reminders:
+            row = conn.execute('''INSERT INTO reminder_deliveries (reminder_key, chat_id, fire_time, text, status)
+                                  VALUES (?, ?, ?, ?, 'pending') ON CONFLICT (reminder_key) DO NOTHING RETURNING reminder_key''',
+                               (reminder_key, chat_id, fire_time, text)).fetchone()
+            if row:
+                claimed.append(row[0])
+    return claimed
+
+def finish_reminder_delivery(reminder_key, status, sent_at, lateness):
+    """status: 'sent' or 'failed'."""
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE reminder_deliveries SET status = ?, sent_at = ?, lateness = ?, text = NULL WHERE reminder_key = ?",
+                     (status, sent_at, lateness, reminder_key))
+
+def get_pending_reminder_deliveries():
+    """[(reminder_key, chat_id, fire_time, text)] claimed but never finished (process stopped mid-send)."""
+    conn = get_connection()
+    return conn.execute("SELECT reminder_key, chat_id, fire_time, text FROM reminder_deliveries WHERE status = 'pending'").fetchall()
+
+def prune_reminder_deliveries(before):
+    """Deletes delivery rows of reminders that fired before timestamp `before`. Returns the number deleted."""
+    conn = get_connection()
+    with conn:
+        return conn.execute("DELETE FROM reminder_deliveries WHERE fire_time < ? AND status != 'pending'", (before,)).rowcount
+
+# Every public function below is timed (metrics.DB_SECONDS, one series per function)
+_NOT_TIMED = {"get_connection", "close_connection", "init_db", "migrate", "get_schema_version",
+              "description_key", "get_cache_stats"}
+
+def _instrument():
+    for name, value in list(globals().items()):
+        if (callable(value) and getattr(value, "__module__", None) == __name__ and not name.startswith("_")
+                and name not in _NOT_TIMED and not isinstance(value, type)):
+            globals()[name] = metrics.timed_function(value, metrics.DB_SECONDS, "db")
+
+_instrument()
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows ~30 messages/second per bot and ~1 message/second per chat.
+# Stay a little below both.
+GLOBAL_RATE = 25           # Messages per second across all chats
+PER_CHAT_INTERVAL = 1.0    # Seconds between two messages to the same chat
+CONCURRENCY = 16           # Requests in flight at once
+MAX_RETRIES = 3
+CHAT_SLOT_PRUNE_SECONDS = 60  # How often past per-chat slots are forgotten (long-lived dispatchers)
+
+def retry_after_seconds(error):
+    """Seconds to wait after a RetryAfter; python-telegram-bot reports int or timedelta depending on version."""
+    delay = error.retry_after
+    return delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+
+class DispatchStats:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.errors = Counter()
+        self.started_at = time.monotonic()
+        self.duration = 0.0
+
+    @property
+    def throughput(self):
+        return self.sent / self.duration if self.duration else 0.0
+
+    def summary(self):
+        errors = ", ".join(f"{name}={count}" for name, count in self.errors.most_common()) or "none"
+        return (f"sent={self.sent} failed={self.failed} retries={self.retries} "
+                f"rate_limited={self.rate_limited} duration={self.duration:.1f}s "
+                f"throughput={self.throughput:.1f} msg/s errors: {errors}")
+
+class MessageDispatcher:
+    """
+    Sends a batch of Telegram messages concurrently while staying under the flood limits:
+    at most `global_rate` messages per second overall and one message every
+    `per_chat_interval` seconds per chat. RetryAfter is honoured by pausing all sends
+    for the requested time and then retrying; network errors are retried with backoff.
+    """
+    def __init__(self, bot, global_rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 concurrency=CONCURRENCY, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.global_interval = 1.0 / global_rate
+        self.per_chat_interval = per_chat_interval
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._pace_lock = asyncio.Lock()
+        self._next_global_slot = 0.0
+        self._next_chat_slot = {}
+        self._prune_at = 0.0
+
+    async def _wait_for_slot(self, chat_id):
+        async with self._pace_lock:
+            now = time.monotonic()
+            if now >= self._prune_at:
+                # A slot in the past no longer delays anything; without this the dict keeps every chat ever messaged
+                self._next_chat_slot = {chat: at for chat, at in self._next_chat_slot.items() if at > now}
+                self._prune_at = now + CHAT_SLOT_PRUNE_SECONDS
+            slot = max(now, self._next_global_slot, self._next_chat_slot.get(chat_id, 0.0))
+            self._next_global_slot = max(self._next_global_slot, slot) + self.global_interval
+            self._next_chat_slot[chat_id] = slot + self.per_chat_interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _pause_all(self, seconds):
+        async with self._pace_lock:
+            self._next_global_slot = max(self._next_global_slot, time.monotonic() + seconds)
+
+    async def send(self, chat_id, text, stats):
+        """Sends one message with pacing and retries. Returns True if it was delivered."""
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_slot(chat_id)
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                stats.sent += 1
+                return True
+            except RetryAfter as e:
+                stats.rate_limited += 1
+                await self._pause_all(retry_after_seconds(e))
+            except (Forbidden, BadRequest) as e:
+                # User blocked the bot / chat is gone: retrying won't help
+                stats.failed += 1
+                stats.errors[type(e).__name__] += 1
+                logger.warning(f"Failed to send message to {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                stats.errors[type(e).__name__] += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                stats.failed += 1
+                stats.errors[type(e).__name__] += 1
+                logger.error(f"Failed to send message to {chat_id}: {e}")
+                return False
+            if attempt < self.max_retries:
+                stats.retries += 1
+
+        stats.failed += 1
+        stats.errors["GaveUp"] += 1
+        logger.error(f"Giving up on message to {chat_id} after {self.max_retries} retries")
+        return False
+
+    async def send_all(self, messages, on_sent=None):
+        """
+        messages: iterable of (chat_id, text, ...); extra fields are passed back to on_sent
+        on_sent: optional callable (message, delivered) run after each message
+        Returns DispatchStats for the batch.
+        """
+        stats = DispatchStats()
+        queue = asyncio.Queue()
+        for item in messages:
+            queue.put_nowait(item)
+
+        async def worker():
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                delivered = await self.send(message[0], message[1], stats)
+                if on_sent is not None:
+                    on_sent(message, delivered)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(self.concurrency, queue.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            stats.duration = time.monotonic() - stats.started_at
+        return stats
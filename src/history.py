@@ -0,0 +1,131 @@
+"""
+Conversation history per user.
+
+Turns are written to SQLite (conversation_turns) so they survive restarts. Memory is
+bounded twice: each user keeps at most HISTORY_RING_SIZE recent turns in a ring buffer,
+and only HISTORY_CACHED_USERS users are kept in memory at all (least recently active
+users are dropped and reloaded from SQLite on their next message).
+
+get_context() returns the newest turns that fit in a token budget, so prompt size stays
+flat however long the conversation gets. compact_async() trims the table to the newest
+HISTORY_KEEP_ROWS turns per user and can fold the removed turns into a rolling summary
+that is prepended to the context.
+"""
+import logging
+from collections import deque
+
+from cache import LRUCache
+import database
+
+logger = logging.getLogger(__name__)
+
+HISTORY_RING_SIZE = 24          # Turns kept in memory per user
+HISTORY_CACHED_USERS = 2048     # Users whose ring buffer stays in memory
+HISTORY_TOKEN_BUDGET = 1500     # Max estimated tokens of history put into a prompt
+HISTORY_KEEP_ROWS = 200         # Turns kept in SQLite per user after compaction
+CHARS_PER_TOKEN = 4
+SUMMARY_ROLE = 'summary'
+
+_buffers = LRUCache(maxsize=HISTORY_CACHED_USERS)
+
+def configure(token_budget=None, ring_size=None, cached_users=None):
+    global HISTORY_TOKEN_BUDGET, HISTORY_RING_SIZE, _buffers
+    if token_budget:
+        HISTORY_TOKEN_BUDGET = int(token_budget)
+    if ring_size:
+        HISTORY_RING_SIZE = int(ring_size)
+        _buffers.clear()
+    if cached_users:
+        _buffers = LRUCache(maxsize=int(cached_users))
+
+def estimate_tokens(text):
+    # Rough count, good enough for budgeting; +4 for the "User:"/"Trang:" prefix and newline
+    return len(text) // CHARS_PER_TOKEN + 4
+
+def _state(user_id):
+    state = _buffers.get(user_id)
+    if state is None:
+        state = {
+            'turns': deque(database.get_recent_turns(user_id, HISTORY_RING_SIZE), maxlen=HISTORY_RING_SIZE),
+            'summary': database.get_conversation_summary(user_id),
+        }
+        _buffers.set(user_id, state)
+    return state
+
+def add_turns(user_id, turns):
+    """turns: list of (role, content). Appends to the ring buffer and SQLite."""
+    turns = [(role, content) for role, content in turns if content]
+    if not turns:
+        return
+    state = _state(user_id)
+    database.add_conversation_turns(user_id, turns)
+    for role, content in turns:
+        state['turns'].append({'role': role, 'content': content})
+
+def get_recent(user_id, limit=None):
+    """Newest turns from the ring buffer, oldest first."""
+    turns = list(_state(user_id)['turns'])
+    return turns[-limit:] if limit else turns
+
+def get_context(user_id, token_budget=None):
+    """
+    History for a prompt: the newest turns whose estimated size fits in `token_budget`,
+    preceded by the rolling summary when there is one and it fits.
+    """
+    budget = token_budget or HISTORY_TOKEN_BUDGET
+    state = _state(user_id)
+    summary = state['summary']
+    if summary and estimate_tokens(summary) <= budget // 3:
+        budget -= estimate_tokens(summary)
+    else:
+        summary = None
+
+    selected = []
+    for turn in reversed(state['turns']):
+        cost = estimate_tokens(turn['content'])
+        if cost > budget:
+            break
+        budget -= cost
+        selected.append(turn)
+    selected.reverse()
+
+    if summary:
+        selected.insert(0, {'role': SUMMARY_ROLE, 'content': summary})
+    return selected
+
+async def compact_user_async(user_id, summarize=None, keep=HISTORY_KEEP_ROWS):
+    """
+    Deletes all but the newest `keep` stored turns of one user.
+    summarize: optional async callable (previous_summary, turns) -> new summary text
+    Returns the number of deleted turns.
+    """
+    old = database.get_turns_before_newest(user_id, keep)
+    if not old:
+        return 0
+    summary = None
+    if summarize:
+        previous = database.get_conversation_summary(user_id)
+        try:
+            summary = await summarize(previous, [{'role': role, 'content': content} for _, role, content in old])
+        except Exception as e:
+            # Keep the old turns so they can be summarised next time
+            logger.warning(f"History summary failed for {user_id}: {e}")
+            return 0
+    deleted = database.compact_conversation(user_id, old[-1][0], summary)
+    if summary:
+        state = _buffers.get(user_id)
+        if state is not None:
+            state['summary'] = summary
+    return deleted
+
+async def compact_async(summarize=None, keep=HISTORY_KEEP_ROWS):
+    """Compacts every user above `keep` stored turns. Returns (users, deleted turns)."""
+    users = database.get_users_with_turns_over(keep)
+    deleted = 0
+    for user_id in users:
+        deleted += await compact_user_async(user_id, summarize, keep)
+    logger.info(f"History compaction: {len(users)} users, {deleted} turns removed")
+    return len(users), deleted
+
+def stats():
+    return _buffers.stats()
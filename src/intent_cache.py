@@ -0,0 +1,174 @@
+"""
+Cache for extract_schedule_intent results, and for the intents of combined-mode
+(analyze_message_async) results that need no generated chat reply.
+
+Key: normalised message + the user's recent messages + a time bucket (weekday, hour).
+The bucket matters because the LLM resolves "mai", "thứ 6" or "9h tối" against the
+current time, so the same text can mean another date in another hour or weekday.
+
+Dates relative to today are stored as day offsets ("@+1T21:00:00") and re-anchored to
+the current date when served, so an entry written on one Monday 19:xx is still correct
+the next Monday 19:xx. Dates the user spelled out ("24/12") are stored as-is.
+
+Two tiers: an in-memory LRU, plus an optional SQLite table (intent_cache) that survives
+restarts and is shared by every process using the same database.
+"""
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+
+from cache import LRUCache
+from text_utils import normalize_text
+import database
+
+logger = logging.getLogger(__name__)
+
+INTENT_CACHE_SIZE = 4096        # Entries kept in memory
+INTENT_CACHE_DB_ROWS = 50000    # Rows kept in the SQLite tier
+PRUNE_EVERY = 500               # Prune the SQLite tier after this many stores
+HISTORY_MESSAGES = 3            # Same slice of history the intent prompt uses
+
+# Intent fields holding a date or datetime that may need re-anchoring
+DATE_FIELDS = ("run_date", "specific_date", "end_date", "start_time")
+_ISO_DATE = re.compile(r"^(\d{4}-\d{2}-\d{2})(.*)$")
+_OFFSET = re.compile(r"^@([+-]\d+)(.*)$")
+# "24/12", "ngày 24", "tháng 12", "2026": the user gave a calendar date, keep it absolute
+_EXPLICIT_DATE = re.compile(r"\d{1,2}\s*[/-]\s*\d{1,2}|ngày\s*\d|tháng\s*\d|\b\d{4}\b")
+
+class IntentCacheStats:
+    def __init__(self):
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.reanchored = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+
+    def as_dict(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "stores": self.stores,
+            "reanchored": self.reanchored,
+            "hit_rate": self.hit_rate,
+        }
+
+    def summary(self):
+        return (f"hits={self.memory_hits + self.db_hits} (memory={self.memory_hits}, db={self.db_hits}) "
+                f"misses={self.misses} hit_rate={self.hit_rate:.0%} stores={self.stores} reanchored={self.reanchored}")
+
+_memory = LRUCache(maxsize=INTENT_CACHE_SIZE)
+_persistent = False
+_stats = IntentCacheStats()
+
+def configure(size=None, persistent=None):
+    """
+    size: max entries in the in-memory tier
+    persistent: also store entries in the SQLite intent_cache table
+    """
+    global _memory, _persistent
+    if size:
+        _memory = LRUCache(maxsize=int(size))
+    if persistent is not None:
+        _persistent = bool(persistent)
+
+def _now():
+    # Naive Vietnam time, same clock the intent prompt uses
+    return datetime.now(ZoneInfo("Asia/Ho_Chi_Minh")).replace(tzinfo=None)
+
+def make_key(user_input, history=None, now=None):
+    now = now or _now()
+    text = normalize_text(user_input)
+    # Only the user's own recent messages: the assistant's wording varies between calls
+    recent = [normalize_text(m['content']) for m in (history or [])[-HISTORY_MESSAGES:] if m['role'] == 'user']
+    history_hash = hashlib.sha1("\n".join(recent).encode("utf-8")).hexdigest()[:12] if recent else "-"
+    return f"{now.weekday()}:{now.hour:02d}|{history_hash}|{text}"
+
+def _to_template(intent_data, today, keep_absolute):
+    """Replaces dates relative to `today` with '@+N<rest>' offsets."""
+    template = json.loads(json.dumps(intent_data))
+    if keep_absolute:
+        return template
+    for intent in template.get("intents", []):
+        for field in DATE_FIELDS:
+            value = intent.get(field)
+            m = _ISO_DATE.match(value) if isinstance(value, str) else None
+            if not m:
+                continue
+            try:
+                offset = (date.fromisoformat(m.group(1)) - today).days
+            except ValueError:
+                continue
+            intent[field] = f"@{offset:+d}{m.group(2)}"
+    return template
+
+def _from_template(template, today):
+    """Inverse of _to_template: '@+1T21:00:00' -> '<today + 1 day>T21:00:00'."""
+    intent_data = json.loads(json.dumps(template))
+    reanchored = False
+    for intent in intent_data.get("intents", []):
+        for field in DATE_FIELDS:
+            value = intent.get(field)
+            m = _OFFSET.match(value) if isinstance(value, str) else None
+            if m:
+                anchored = today + timedelta(days=int(m.group(1)))
+                intent[field] = anchored.isoformat() + m.group(2)
+                reanchored = True
+    return intent_data, reanchored
+
+def get(user_input, history=None, now=None):
+    """Cached intents for this message with dates anchored to today, or None."""
+    now = now or _now()
+    key = make_key(user_input, history, now)
+    template = _memory.get(key)
+    if template is not None:
+        _stats.memory_hits += 1
+    elif _persistent:
+        try:
+            stored = database.get_cached_intent(key)
+        except Exception as e:
+            logger.warning(f"Intent cache read failed: {e}")
+            stored = None
+        if stored is not None:
+            template = json.loads(stored)
+            _memory.set(key, template)
+            _stats.db_hits += 1
+    if template is None:
+        _stats.misses += 1
+        return None
+
+    intent_data, reanchored = _from_template(template, now.date())
+    if reanchored:
+        _stats.reanchored += 1
+    return intent_data
+
+def put(user_input, history, intent_data, now=None):
+    """Stores a successful LLM result."""
+    now = now or _now()
+    key = make_key(user_input, history, now)
+    keep_absolute = bool(_EXPLICIT_DATE.search(normalize_text(user_input)))
+    template = _to_template(intent_data, now.date(), keep_absolute)
+    _memory.set(key, template)
+    _stats.stores += 1
+    if _persistent:
+        try:
+            database.save_cached_intent(key, json.dumps(template, ensure_ascii=False))
+            if _stats.stores % PRUNE_EVERY == 0:
+                database.prune_intent_cache(INTENT_CACHE_DB_ROWS)
+        except Exception as e:
+            logger.warning(f"Intent cache write failed: {e}")
+
+def clear():
+    _memory.clear()
+
+def stats():
+    """Hit-rate metrics across both tiers."""
+    return _stats
@@ -0,0 +1,439 @@
+"""
+Rule-based fast path in front of the LLM intent extractor.
+
+parse_intent() recognises the common Vietnamese commands documented in the
+extract_schedule_intent prompt ("lịch hôm nay", "lịch tuần tới", "xóa hết lịch",
+"8h tối mai học toeic", "mỗi ngày 6h sáng chạy bộ", ...) and returns the same
+{"intents": [...]} structure, plus a confidence score. Anything it is unsure
+about (chat, goals, emotions, missing time, several requests in one message)
+gets a low score or None so the caller falls back to Gemini.
+"""
+import re
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from text_utils import fold_diacritics, normalize_text
+
+DAY_CODES = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+WEEKDAY_WORDS = {"hai": 0, "ba": 1, "tu": 2, "nam": 3, "sau": 4, "bay": 5}
+
+# Words that carry no meaning for the intent (politeness, pronouns, particles)
+FILLERS = {
+    "xem", "cho", "toi", "anh", "em", "minh", "cua", "co", "gi", "khong", "nao", "a", "nhe", "nha",
+    "voi", "lich", "trinh", "the", "sao", "ra", "ban", "giup", "hay", "di", "vay", "oi", "ak", "nhi",
+}
+LEADING_FILLERS = {
+    "nhac", "toi", "anh", "em", "minh", "dat", "len", "lich", "hen", "co", "phai", "se", "can",
+    "luc", "vao", "la", "nho", "giup", "hay", "tao", "them", "ghi", "nhe", "cho",
+}
+TRAILING_FILLERS = {"nhe", "nha", "a", "voi", "luc", "vao", "nhac", "nhi", "ak"}
+PRONOUNS = {"em", "anh", "toi", "minh"}
+
+# Accented forms that must not be read as their unaccented twins
+# ("tôi" = I vs "tối" = evening, "mới" = new vs "mỗi" = every)
+PERIODS = {"sáng": "sang", "trưa": "trua", "chiều": "chieu", "tối": "toi", "đêm": "dem", "khuya": "khuya"}
+EVERY_WORDS = {"mỗi", "hàng", "hằng", "các"}
+# Negations ("đừng nhắc nữa") and feelings ("mệt quá") need an answer from the LLM, not a reminder
+NEGATION_WORDS = {"đừng", "thôi", "ngừng", "dừng", "khỏi", "nữa"}
+EMOTION_WORDS = {"mệt", "buồn", "chán", "nản", "khóc", "stress", "sợ", "đuối", "áp"}
+
+TIME_PATTERNS = [
+    r"(?P<h>\d{1,2})\s?(?:h|g|gio)\s?(?P<m>\d{1,2})?\s?(?:p|phut)?(?:\s(?P<ruoi>ruoi))?",
+    r"(?P<h>\d{1,2}):(?P<m>\d{2})",
+]
+# Same as TIME_PATTERNS without named groups, for counting
+ANY_TIME_PATTERN = r"\d{1,2}\s?(?:h|g|gio)(?:\s?\d{1,2})?(?:\s?(?:p|phut))?|\d{1,2}:\d{2}"
+DATE_PATTERNS = [
+    r"(?:ngay\s)?(?P<d>\d{1,2})/(?P<mo>\d{1,2})(?:/(?P<y>\d{2,4}))?",
+    r"ngay\s(?P<d>\d{1,2})\sthang\s(?P<mo>\d{1,2})(?:\snam\s(?P<y>\d{4}))?",
+]
+WEEKDAY_PATTERN = r"thu\s?(?P<n>[2-7])|thu\s(?P<w>hai|ba|tu|nam|sau|bay)|t(?P<t>[2-7])|(?P<cn>chu\snhat|cn)"
+WEEKDAY_LIST_PATTERN = r"(?:thu\s?|t)[2-7](?:\s(?:va\s)?(?:thu\s?|t)?[2-7])+(?:\s(?:va\s)?(?:chu\snhat|cn))?"
+
+def _now():
+    return datetime.now(ZoneInfo("Asia/Ho_Chi_Minh")).replace(tzinfo=None)
+
+class _Message:
+    """Token view of a message: original tokens, accent-folded tokens and which ones are consumed."""
+    def __init__(self, user_input):
+        cased = [t.strip(".,;!-") for t in normalize_text(user_input, lower=False).replace(",", " ").split()]
+        self.cased = [t for t in cased if t]
+        self.tokens = [t.lower() for t in self.cased]
+        self.folded = [fold_diacritics(t) for t in self.tokens]
+        self.used = [False] * len(self.tokens)
+        self.uncertain = False  # Set when a word could be read two ways (see _take_day_word)
+        self.text = " ".join(self.folded)
+        self._starts = []
+        pos = 0
+        for f in self.folded:
+            self._starts.append(pos)
+            pos += len(f) + 1
+
+    def _token_range(self, start, end):
+        return [i for i, s in enumerate(self._starts) if start <= s < end]
+
+    def find(self, pattern):
+        """Finds pattern (on the folded text, whole tokens only) among unused tokens. Returns (match, token indexes)."""
+        for m in re.finditer(r"(?<!\S)(?:" + pattern + r")(?!\S)", self.text):
+            idx = self._token_range(m.start(), m.end())
+            if idx and not any(self.used[i] for i in idx):
+                return m, idx
+        return None, []
+
+    def take(self, pattern):
+        m, idx = self.find(pattern)
+        for i in idx:
+            self.used[i] = True
+        return m, idx
+
+    def count(self, pattern):
+        return len(re.findall(r"(?<!\S)(?:" + pattern + r")(?!\S)", self.text))
+
+    def has(self, word):
+        return word in self.folded
+
+    def leftover(self):
+        return [i for i in range(len(self.tokens)) if not self.used[i]]
+
+def _weekday_from_match(m):
+    if m.group("n"):
+        return int(m.group("n")) - 2
+    if m.group("w"):
+        return WEEKDAY_WORDS[m.group("w")]
+    if m.group("t"):
+        return int(m.group("t")) - 2
+    return 6
+
+def _parse_weekday_list(text):
+    """'thu 2 4 va 6 va chu nhat' -> ['mon', 'wed', 'fri', 'sun']"""
+    days = [DAY_CODES[int(n) - 2] for n in re.findall(r"[2-7]", text)]
+    if re.search(r"chu\snhat|cn", text):
+        days.append("sun")
+    return days
+
+def _next_weekday(now, weekday):
+    days_ahead = weekday - now.weekday()
+    if days_ahead <= 0:
+        days_ahead += 7
+    return now + timedelta(days=days_ahead)
+
+def _parse_date(m, now, future=True):
+    year = int(m.group("y")) if m.group("y") else now.year
+    if year < 100:
+        year += 2000
+    try:
+        value = datetime(year, int(m.group("mo")), int(m.group("d")))
+    except ValueError:
+        return None
+    if future and not m.group("y") and value.date() < now.date():
+        value = value.replace(year=year + 1)
+    return value
+
+def _apply_period(hour, period):
+    if period in ("chieu", "toi") and hour < 12:
+        return hour + 12
+    if period == "trua" and hour < 5:
+        return hour + 12
+    if period in ("dem", "khuya"):
+        if hour == 12:
+            return 0
+        if 6 <= hour < 12:
+            return hour + 12
+    return hour
+
+def _period_at(msg, i, accented_only):
+    if not (0 <= i < len(msg.tokens)) or msg.used[i]:
+        return None
+    token = msg.tokens[i]
+    if token in PERIODS:
+        return PERIODS[token]
+    if not accented_only and token == msg.folded[i] and token in PERIODS.values():
+        return token  # Typed without accents
+    return None
+
+def _take_period(msg, near):
+    """
+    Finds a time-of-day word right next to token indexes `near` ('8h tối', 'tối mai').
+    Unaccented words are only trusted after `near`: 'nhac toi 8h' is 'nhắc tôi', not 'tối'.
+    """
+    for i, accented_only in [(max(near) + 1, False), (min(near) - 1, True)]:
+        period = _period_at(msg, i, accented_only)
+        if period:
+            msg.used[i] = True
+            return period
+    return None
+
+def _every_word(msg):
+    """Index of 'mỗi'/'hàng'/'các' (or unaccented moi/hang/cac), else None. Skips 'mới', 'mời'."""
+    for i, (token, folded) in enumerate(zip(msg.tokens, msg.folded)):
+        if not msg.used[i] and folded in ("moi", "hang", "cac") and (token in EVERY_WORDS or token == folded):
+            return i
+    return None
+
+def _has_word(msg, words):
+    """True if the message contains one of `words`, with its accents or typed without any."""
+    folded_words = {fold_diacritics(w) for w in words}
+    return any(token in words or (token == folded and folded in folded_words)
+               for token, folded in zip(msg.tokens, msg.folded))
+
+def _reads_as_date(msg, i):
+    """'mai'/'nay' is a date when typed lowercase or next to a time, a period or 'ngày'/'hôm'."""
+    if msg.cased[i].islower():
+        return True
+    for j in (i - 1, i + 1):
+        if 0 <= j < len(msg.tokens) and (msg.folded[j] in ("ngay", "hom") or msg.folded[j][:1].isdigit()
+                                         or msg.tokens[j] in PERIODS
+                                         or (msg.tokens[j] == msg.folded[j] and msg.folded[j] in PERIODS.values())):
+            return True
+    return False
+
+def _take_day_word(msg, pattern):
+    """
+    msg.take() for 'ngày mai' / 'hôm nay' patterns. A bare 'Mai' or 'Nay' can be a name
+    ("gặp chị Mai"): unless it reads as a date it is left in place and the message marked uncertain.
+    """
+    m, idx = msg.find(pattern)
+    if m and len(idx) == 1 and not _reads_as_date(msg, idx[0]):
+        msg.uncertain = True
+        return None, []
+    for i in idx:
+        msg.used[i] = True
+    return m, idx
+
+def _take_day(msg, now):
+    """Day of a one-off event. Returns (datetime, token indexes), (None, indexes) for an invalid date, or (None, [])."""
+    m, idx = _take_day_word(msg, r"ngay\smai|mai")
+    if m:
+        return now + timedelta(days=1), idx
+    m, idx = msg.take(r"ngay\skia|ngay\smot")  # Bare "mot" is usually "một" (one)
+    if m:
+        return now + timedelta(days=2), idx
+    m, idx = _take_day_word(msg, r"hom\snay|nay")
+    if m:
+        return now, idx
+    for pattern in DATE_PATTERNS:
+        m, idx = msg.take(pattern)
+        if m:
+            return _parse_date(m, now), idx
+    m, idx = msg.take(WEEKDAY_PATTERN)
+    if m:
+        day = _next_weekday(now, _weekday_from_match(m))
+        m2, idx2 = msg.take(r"tuan\s(?:sau|toi)")
+        if m2 and (day - now).days < 7 and day.weekday() >= now.weekday():
+            day += timedelta(days=7)
+        return day, idx + idx2
+    return None, []
+
+def _clean_description(msg):
+    idx = msg.leftover()
+    words = [(msg.cased[i], msg.folded[i]) for i in idx]
+    while words and words[0][1] in LEADING_FILLERS:
+        words.pop(0)
+    while words:
+        if words[-1][1] in TRAILING_FILLERS:
+            words.pop()
+        elif len(words) >= 2 and words[-2][1] in ("giup", "cho") and words[-1][1] in PRONOUNS:
+            del words[-2:]  # "... giúp em"
+        else:
+            break
+    return " ".join(w for w, _ in words)
+
+def _parse_delete(msg, now):
+    m, _ = msg.take(r"(?:xoa|huy)(?:\s(?:bo|di))?")
+    if not m or msg.used.index(True) > 1:
+        return None
+    msg.take(r"lich(?:\strinh)?|cac\slich|tat\sca\scac\slich")
+    if msg.take(r"het|tat\sca|toan\sbo|sach")[0]:
+        msg.take(r"lich(?:\strinh)?")
+        if msg.count(r"hom\snay|nay|mai|tuan|thu\s?[2-7]|\d{1,2}/\d{1,2}") == 0:
+            return {"intent": "delete_schedule", "delete_all": True, "conversational_response": "Dạ vâng ạ."}, 0.95
+
+    time_range = None
+    if _take_day_word(msg, r"hom\snay|nay")[0]:
+        time_range = "today"
+    elif _take_day_word(msg, r"ngay\smai|mai")[0]:
+        time_range = "tomorrow"
+    else:
+        m, _ = msg.take(WEEKDAY_PATTERN)
+        if m:
+            time_range = DAY_CODES[_weekday_from_match(m)]
+
+    # Dates and weeks ("ngày 24/12", "tuần sau") are not a description; leave them to the LLM
+    if any(msg.find(pattern)[0] for pattern in DATE_PATTERNS) or msg.find(r"tuan")[0]:
+        return None
+
+    description = _clean_description(msg)
+    if time_range and not description:
+        return {"intent": "delete_schedule", "delete_all": False, "time_range": time_range, "conversational_response": "Dạ vâng ạ."}, 0.95
+    if description and not time_range:
+        confidence = 0.9 if len(description.split()) <= 4 else 0.6
+        return {"intent": "delete_schedule", "delete_all": False, "description": description, "conversational_response": "Dạ vâng ạ."}, confidence
+    return None
+
+def _parse_check(msg, now):
+    if not msg.has("lich") or msg.count(ANY_TIME_PATTERN) or msg.has("nhac"):
+        return None
+    if msg.has("co") and not (msg.has("gi") or msg.has("khong") or msg.has("nao")):
+        return None  # "tôi có lịch database" is telling, not asking
+    intent = {"intent": "check_schedule"}
+    if msg.take(r"(?:tuan\s(?:toi|sau|nay)|ca\stuan|trong\stuan|7\sngay\stoi)")[0]:
+        intent["time_range"] = "week"
+    elif _take_day_word(msg, r"hom\snay|nay")[0]:
+        intent["time_range"] = "today"
+    elif _take_day_word(msg, r"ngay\smai|mai")[0]:
+        intent["time_range"] = "tomorrow"
+    else:
+        for pattern in DATE_PATTERNS:
+            m, _ = msg.take(pattern)
+            if m:
+                value = _parse_date(m, now, future=False)
+                if value is None:
+                    return None
+                intent["time_range"] = "specific_date"
+                intent["specific_date"] = value.strftime("%Y-%m-%d")
+                break
+        else:
+            m, _ = msg.take(WEEKDAY_PATTERN)
+            if m:
+                intent["time_range"] = DAY_CODES[_weekday_from_match(m)]
+
+    leftover = [i for i in msg.leftover() if msg.folded[i] not in FILLERS]
+    if not leftover:
+        return (intent, 0.95) if "time_range" in intent else None
+    if "time_range" in intent:
+        return intent, 0.5  # e.g. "lịch học hôm nay" - let the LLM decide
+
+    words = [msg.cased[i] for i in leftover]
+    if len(words) > 1 and msg.folded[leftover[0]] in ("hoc", "lam"):
+        words = words[1:]
+    intent["keyword"] = " ".join(words)
+    return intent, 0.9 if len(words) <= 3 else 0.5
+
+def _parse_reminder(msg, now, user_input):
+    intent = {"intent": "schedule_reminder", "conversational_response": "Dạ vâng ạ."}
+    confidence = 1.0
+
+    m, _ = msg.take(r"(?:nhac\s)?(?:truoc|som)\s(?P<n>\d+)\s?(?P<u>p|phut|tieng|gio|h)")
+    if m:
+        unit = m.group("u")
+        intent["remind_before_minutes"] = int(m.group("n")) * (60 if unit in ("tieng", "gio", "h") else 1)
+
+    # Exactly one clock time, otherwise it's several requests or something unusual
+    if msg.count(ANY_TIME_PATTERN) != 1:
+        return None
+    for pattern in TIME_PATTERNS:
+        time_match, time_idx = msg.take(pattern)
+        if time_match:
+            break
+    hour = int(time_match.group("h"))
+    minute = int(time_match.group("m") or 0)
+    if "ruoi" in time_match.groupdict() and time_match.group("ruoi"):
+        minute = 30
+
+    # End date for recurring schedules ("đến 17/12")
+    end_match, _ = msg.take(r"(?:cho\s)?(?:den|toi)(?:\shet)?\s(?:ngay\s)?(?P<d>\d{1,2})/(?P<mo>\d{1,2})(?:/(?P<y>\d{2,4}))?")
+
+    days = None
+    period = None
+    every = _every_word(msg)
+    m, _ = msg.take(r"(?:moi|hang)\s(?P<p>ngay|sang|trua|chieu|toi|dem)|ngay\snao\scung")
+    if m and (every is not None or m.group(0).startswith("ngay")):
+        days = list(DAY_CODES)
+        if m.group("p") and m.group("p") != "ngay":
+            period = m.group("p")
+    elif msg.take(r"(?:cac\s)?ngay\strong\stuan|(?:cac\s)?ngay\sthuong")[0]:
+        days = DAY_CODES[:5]
+    elif msg.take(r"(?:moi\s|hang\s|cac\s)?cuoi\stuan")[0]:
+        if every is None:
+            return None  # "cuối tuần này" - leave it to the LLM
+        days = ["sat", "sun"]
+    else:
+        weekly = msg.take(r"(?:hang|moi)\stuan")[0]
+        m, _ = msg.take(WEEKDAY_LIST_PATTERN)
+        if m:
+            days = _parse_weekday_list(m.group(0))
+            if every is None and not weekly:
+                confidence = 0.7  # "thứ 2, thứ 4 họp" could be two one-off meetings
+        elif every is not None or weekly:
+            m, _ = msg.take(WEEKDAY_PATTERN)
+            if m:
+                days = [DAY_CODES[_weekday_from_match(m)]]
+    if days and every is not None:
+        msg.used[every] = True
+
+    period = period or _take_period(msg, time_idx)
+    if period:
+        hour = _apply_period(hour, period)
+    if hour > 23 or minute > 59:
+        return None
+    intent["hour"] = hour
+    intent["minute"] = minute
+
+    if days:
+        intent["type"] = "recurring"
+        intent["days_of_week"] = days
+        if end_match:
+            end = _parse_date(end_match, now)
+            if end:
+                intent["end_date"] = end.strftime("%Y-%m-%d")
+    else:
+        if end_match:
+            return None
+        day, day_idx = _take_day(msg, now)
+        if day is None and day_idx:
+            return None
+        if period is None and day_idx:
+            period = _take_period(msg, day_idx)
+            if period:
+                intent["hour"] = hour = _apply_period(hour, period)
+        # No explicit day: today; handle_message moves past times to tomorrow
+        day = day or now
+        intent["type"] = "one_off"
+        intent["run_date"] = day.replace(hour=hour, minute=minute, second=0, microsecond=0).isoformat()
+
+    description = _clean_description(msg)
+    if not description:
+        return intent, 0.3  # Subject probably comes from history
+    n_words = len(description.split())
+    if n_words > 6:
+        confidence = 0.5  # Probably emotion/extra clauses the LLM should answer
+    if any(word in ("khong", "chua", "sao", "neu", "ma") for word in fold_diacritics(description).split()):
+        confidence = min(confidence, 0.5)
+    if _has_word(msg, NEGATION_WORDS | EMOTION_WORDS):
+        confidence = min(confidence, 0.3)
+    intent["description"] = description
+    return intent, confidence
+
+def parse_intent(user_input, now=None):
+    """
+    Parses common scheduling commands without the LLM.
+    now: naive Vietnam-time datetime used for relative dates (defaults to current time)
+    Returns ({"intents": [intent]}, confidence 0..1) or None if the message is not recognised.
+    """
+    if not user_input or len(user_input) > 200:
+        return None
+    now = now or _now()
+    question = "?" in user_input
+
+    msg = _Message(user_input)
+    if not msg.tokens:
+        return None
+
+    for parser in (_parse_delete, _parse_check):
+        parsed = _Message(user_input)
+        result = parser(parsed, now)
+        if result:
+            intent, confidence = result
+            return {"intents": [intent]}, _cap_uncertain(parsed, confidence)
+
+    if question:
+        return None
+    result = _parse_reminder(msg, now, user_input)
+    if result:
+        intent, confidence = result
+        return {"intents": [intent]}, _cap_uncertain(msg, confidence)
+    return None
+
+def _cap_uncertain(msg, confidence):
+    # "Mai"/"Nay" may be a name: let the LLM decide
+    return min(confidence, 0.5) if msg.uncertain else confidence
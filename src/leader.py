@@ -0,0 +1,82 @@
+"""
+Scheduler leadership when the bot runs as several worker processes (WORKERS > 1, see workers.py).
+
+Every worker runs a LeaderLease with the same name against the shared database; the
+row in `leases` says which one fires reminders and the daily jobs. The holder renews it
+every ttl / 3 seconds. If it stops renewing (killed, frozen, database unreachable) the
+lease expires and the next worker to try takes it over, so reminders resume within
+about ttl + ttl / 3 seconds. A worker that shuts down cleanly releases the lease at once.
+
+Expiry uses the wall clock, so all workers must run on the machine that holds the
+SQLite file. Phones step that clock (network time sync, manual changes, waking from
+deep sleep): a jump forward makes the lease look expired, so another worker may take it
+and the old leader only notices at its next renewal, up to ttl / 3 later (the delivery
+log keeps reminders from being sent twice meanwhile). A jump back would make a dead
+leader's lease look valid for as long as the jump, so acquire_lease also takes over a
+lease that expires further ahead than a fresh one could. How long a leader keeps
+leading without a successful renewal is measured on time.monotonic(), which never jumps.
+"""
+import os
+import time
+import socket
+import asyncio
+import logging
+
+import database
+
+logger = logging.getLogger(__name__)
+
+LEASE_SECONDS = 30  # A leader that stops renewing is replaced after this long
+
+class LeaderLease:
+    """
+    name: lease row shared by the competing processes (e.g. "scheduler")
+    holder: this process's identity, hostname:pid by default
+    """
+    def __init__(self, name, ttl=LEASE_SECONDS, holder=None):
+        self.name = name
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}"
+        self.is_leader = False
+        self.elections = 0
+        self._valid_until = 0
+
+    def try_acquire(self):
+        """One acquire/renew attempt. Returns whether this process may act as leader now."""
+        started = time.monotonic()
+        try:
+            held = database.acquire_lease(self.name, self.holder, self.ttl, time.time())
+        except Exception as e:
+            logger.error(f"Lease {self.name}: renewal failed: {e}")
+            # Keep leading only while the last renewal is surely still valid
+            return self.is_leader and started < self._valid_until - self.ttl / 3
+        if held:
+            self._valid_until = started + self.ttl
+        return held
+
+    async def run(self, on_elected, on_demoted):
+        """
+        Competes for the lease until cancelled. on_elected() is called when this process
+        becomes leader and on_demoted() when it loses the lease or stops.
+        """
+        try:
+            while True:
+                held = self.try_acquire()
+                if held and not self.is_leader:
+                    self.is_leader = True
+                    self.elections += 1
+                    logger.info(f"{self.holder} holds the {self.name} lease")
+                    on_elected()
+                elif not held and self.is_leader:
+                    self.is_leader = False
+                    logger.warning(f"{self.holder} lost the {self.name} lease")
+                    on_demoted()
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            if self.is_leader:
+                self.is_leader = False
+                on_demoted()
+                try:
+                    database.release_lease(self.name, self.holder)
+                except Exception as e:
+                    logger.error(f"Lease {self.name}: release failed: {e}")
@@ -1,29 +1,251 @@
 import os
-import google.generativeai as genai
+import asyncio
 import json
-from datetime import datetime
+import logging
+import re
+import time
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
+from intent_parser import parse_intent
+import intent_cache
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'gemini-2.0-flash'
+# Context caching needs an explicit model version
+CACHE_MODEL_NAME = 'models/gemini-2.0-flash-001'
+
+# Async call limits (see configure_genai)
+LLM_MAX_CONCURRENCY = 8
+LLM_TIMEOUT_SECONDS = 30.0
+_llm_semaphore = None
+
+# Messages the rule-based parser recognises with at least this confidence skip Gemini
+# (1.01 disables the fast path)
+FAST_PATH_MIN_CONFIDENCE = 0.85
+
+# Ask Gemini for a bare JSON object (combined mode) instead of parsing it out of markdown
+JSON_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+# Optional Gemini context caching of the system instructions (see _create_cached_model)
+LLM_CONTEXT_CACHE = False
+CONTEXT_CACHE_TTL = 3600  # Seconds; the cache is recreated shortly before it expires
+
+_models = {}  # kind -> (GenerativeModel, expires_at or None)
+_model_tasks = {}  # kind -> task creating or renewing the model (see _get_model_async)
+
+# The Gemini SDK takes about a second to import (several on a phone), so it is loaded
+# on first use instead of at startup (see _sdk and warm_up)
+_genai = None
+_api_key = None
+
+def _sdk():
+    """google.generativeai, imported and configured on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=_api_key)
+        _genai = genai
+    return _genai
+
+def warm_up():
+    """Imports the SDK and creates the models ahead of the first message (blocking; run it in a thread)."""
+    for kind in SYSTEM_INSTRUCTIONS:
+        _get_model(kind)
+
 # Configure Gemini
 # Note: API Key should be set in environment variables or passed here
-def configure_genai(api_key):
-    genai.configure(api_key=api_key)
+def configure_genai(api_key, max_concurrency=None, timeout=None, fast_path_min_confidence=None,
+                    context_cache=None):
+    """
+    max_concurrency: max number of Gemini calls in flight at once (async API only)
+    timeout: seconds before an async Gemini call is cancelled
+    fast_path_min_confidence: threshold for answering intents with intent_parser instead of Gemini
+    context_cache: store the fixed system instructions with Gemini context caching
+    """
+    global LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS, FAST_PATH_MIN_CONFIDENCE, LLM_CONTEXT_CACHE, _llm_semaphore, _api_key
+    _api_key = api_key
+    if _genai is not None:
+        _genai.configure(api_key=api_key)
+    _models.clear()
+    if context_cache is not None:
+        LLM_CONTEXT_CACHE = bool(context_cache)
+    if max_concurrency:
+        LLM_MAX_CONCURRENCY = int(max_concurrency)
+        _llm_semaphore = None
+    if timeout:
+        LLM_TIMEOUT_SECONDS = float(timeout)
+    if fast_path_min_confidence:
+        FAST_PATH_MIN_CONFIDENCE = float(fast_path_min_confidence)
 
-def get_current_time_str():
-    # Use Vietnam time explicitly
-    tz = ZoneInfo("Asia/Ho_Chi_Minh")
-    return datetime.now(tz).strftime('%Y-%m-%d %H:%M')
+def _get_semaphore():
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _llm_semaphore
 
-def get_secretary_response(history, user_input, schedule_context=""):
+def _create_cached_model(kind):
     """
-    Generates a response from the 'Secretary' persona.
-    history: List of previous messages (optional, for context)
-    user_input: The current message from the user
-    schedule_context: String summary of recurring schedules
+    Stores the system instruction for `kind` as Gemini cached content, so it is not sent
+    and billed as fresh input on every call.
+    Returns (model, expires_at) or (None, None) if the API refuses, e.g. when the
+    instruction is below the minimum size for caching.
     """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    system_prompt = f"""
+    genai = _sdk()
+    try:
+        cached = genai.caching.CachedContent.create(
+            model=CACHE_MODEL_NAME,
+            display_name=f"trang-{kind}",
+            system_instruction=SYSTEM_INSTRUCTIONS[kind],
+            ttl=timedelta(seconds=CONTEXT_CACHE_TTL),
+        )
+        model = genai.GenerativeModel.from_cached_content(cached, generation_config=_GENERATION_CONFIGS.get(kind))
+        return model, time.time() + CONTEXT_CACHE_TTL - 60
+    except Exception as e:
+        logger.warning(f"Context caching unavailable for the {kind} prompt, using a plain system instruction: {e}")
+        return None, None
+
+def _get_model(kind):
+    """
+    Process-wide GenerativeModel for one prompt kind ("secretary", "intent", "combined"),
+    created once with its fixed system instruction.
+    """
+    entry = _models.get(kind)
+    if entry and (entry[1] is None or entry[1] > time.time()):
+        return entry[0]
+
+    model, expires_at = None, None
+    if LLM_CONTEXT_CACHE:
+        model, expires_at = _create_cached_model(kind)
+    if model is None:
+        model = _sdk().GenerativeModel(
+            MODEL_NAME,
+            system_instruction=SYSTEM_INSTRUCTIONS[kind],
+            generation_config=_GENERATION_CONFIGS.get(kind),
+        )
+    _models[kind] = (model, expires_at)
+    return model
+
+async def _get_model_async(kind):
+    """
+    _get_model for the async API. Creating a model can import the SDK and create a context
+    cache (blocking network calls), so that runs in a thread, once per kind however many
+    chats are waiting. An expired context-cache model is renewed in the background while
+    calls keep using it; it stays valid for another minute on Gemini's side.
+    """
+    entry = _models.get(kind)
+    if entry and (entry[1] is None or entry[1] > time.time()):
+        return entry[0]
+
+    task = _model_tasks.get(kind)
+    if task is None:
+        task = _model_tasks[kind] = asyncio.create_task(asyncio.to_thread(_get_model, kind))
+        task.add_done_callback(lambda t: _model_done(kind, t))
+    if entry:
+        return entry[0]
+    return await asyncio.shield(task)
+
+def _model_done(kind, task):
+    _model_tasks.pop(kind, None)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not create the {kind} model: {task.exception()}")
+
+def _record_usage(kind, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        metrics.LLM_TOKENS.inc(getattr(usage, "prompt_token_count", 0) or 0, kind=kind, direction="prompt")
+        metrics.LLM_TOKENS.inc(getattr(usage, "candidates_token_count", 0) or 0, kind=kind, direction="output")
+
+async def _generate_content_async(kind, prompt, timeout=None):
+    """
+    Runs one Gemini call on the SDK's async API without blocking the event loop.
+    kind: which model / system instruction to use (see _get_model)
+    Waits for a free slot (LLM_MAX_CONCURRENCY) and cancels the request after `timeout` seconds.
+    """
+    model = await _get_model_async(kind)
+    async with _get_semaphore():
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt),
+                timeout=timeout or LLM_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, error=type(e).__name__)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            metrics.LLM_SECONDS.observe(duration, kind=kind, mode="call")
+            metrics.record_span(f"llm.{kind}", start, duration)
+    _record_usage(kind, response)
+    return response
+
+_STREAM_END = object()
+
+async def _stream_content_async(kind, prompt, timeout=None):
+    """
+    Streaming version of _generate_content_async: yields text chunks as Gemini produces them.
+    `timeout` applies to the first chunk and to each gap between chunks.
+    A separate task reads the stream into a queue, so the LLM slot is given back when
+    Gemini is done rather than after the caller's (throttled) Telegram edits.
+    """
+    model = await _get_model_async(kind)
+    queue = asyncio.Queue()
+    reader = asyncio.create_task(_read_stream(kind, model, prompt, timeout or LLM_TIMEOUT_SECONDS, queue))
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Caller stopped early: stop reading and free the slot
+        reader.cancel()
+
+async def _read_stream(kind, model, prompt, timeout, queue):
+    """Puts the text chunks, then _STREAM_END or the exception, on `queue`; holds an LLM slot meanwhile."""
+    async with _get_semaphore():
+        start = time.perf_counter()
+        last = None
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt, stream=True),
+                timeout=timeout
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                last = chunk
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. only a finish reason)
+                    continue
+                if text:
+                    queue.put_nowait(text)
+        except Exception as e:
+            metrics.LLM_ERRORS.inc(kind=kind, error=type(e).__name__)
+            queue.put_nowait(e)
+            return
+        finally:
+            duration = time.perf_counter() - start
+            metrics.LLM_SECONDS.observe(duration, kind=kind, mode="stream")
+            metrics.record_span(f"llm.{kind}.stream", start, duration)
+            # The last chunk carries the usage of the whole response
+            if last is not None:
+                _record_usage(kind, last)
+    queue.put_nowait(_STREAM_END)
+
+# Fixed instructions, sent once per model as its system instruction (see _get_model).
+# Everything that changes per message is built by the _build_*_prompt functions.
+SECRETARY_INSTRUCTIONS = """
     You are Trang, a professional, gentle, and efficient personal secretary.
     You MUST address the user as "Anh" (Brother) in Vietnamese.
     You MUST start your sentences with polite particles like "Dạ anh", "Vâng anh" where appropriate to sound soft and respectful.
@@ -35,10 +257,7 @@ def get_secretary_response(history, user_input, schedule_context=""):
     2. Help the user stay organized and productive.
     3. Be conversational and proactive like a real secretary.
     
-    Current time: {get_current_time_str()}
-    
-    KNOWN SCHEDULES:
-    {schedule_context}
+    The current time and KNOWN SCHEDULES are given with each message.
     
     **CONVERSATIONAL ABILITIES:**
     - **Strict Scheduling Focus**:
@@ -56,48 +275,12 @@ def get_secretary_response(history, user_input, schedule_context=""):
     - Keep responses concise, helpful, and extremely polite
     - NOTE: Your internal clock is server time. If user says time is different, TRUST THE USER.
     """
-    
-    # Format history
-    history_text = ""
-    if history:
-        for msg in history:
-            role = "User" if msg['role'] == 'user' else "Trang"
-            history_text += f"{role}: {msg['content']}\n"
-    
-    # Simple concatenation for now - in production use ChatSession
-    full_prompt = f"{system_prompt}\n\nConversation History:\n{history_text}\nUser: {user_input}\nTrang:"
-    
-    try:
-        response = model.generate_content(full_prompt)
-        return response.text
-    except Exception as e:
-        return f"Dạ anh, em gặp chút lỗi khi xử lý ạ: {str(e)}"
 
-def extract_schedule_intent(user_input, history=None):
-    """
-    Uses LLM to extract structured schedule data from natural language.
-    Returns a JSON string or None if no schedule detected.
-    """
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    history_text = ""
-    if history:
-        # Take last 3 messages for context
-        for msg in history[-3:]:
-            role = "User" if msg['role'] == 'user' else "Trang"
-            history_text += f"{role}: {msg['content']}\n"
-
-    prompt = f"""
-    Analyze the following user message and extract scheduling information.
-    Current time: {get_current_time_str()}
-    
-    Conversation History (Use this to infer context, e.g., what subject is being studied, and DURATION of goals):
-    {history_text}
-    
-    User message: "{user_input}"
-    
+INTENT_INSTRUCTIONS = """
+    Analyze the user message and extract scheduling information.
+
     Return a JSON object with a key "intents" containing a LIST of intent objects.
-    Example: {{ "intents": [ {{ "intent": "schedule_reminder", "conversational_response": "Dạ em chia sẻ với anh...", ... }} ] }}
+    Example: { "intents": [ { "intent": "schedule_reminder", "conversational_response": "Dạ em chia sẻ với anh...", ... } ] }
     
     For EACH intent found, generate a "conversational_response":
     - This should be a NATURAL, EMPATHETIC, or POLITE Vietnamese response from "Trang" (a dedicated secretary).
@@ -118,7 +301,7 @@ def extract_schedule_intent(user_input, history=None):
     Intent Types:
     
     1. If scheduling a reminder OR recurring schedule:
-       Output: {{ "intent": "schedule_reminder", "type": "one_off"|"recurring", "description": "...", "run_date": "ISO8601", "remind_before_minutes": INTEGER (optional, e.g. 5) }}
+       Output: { "intent": "schedule_reminder", "type": "one_off"|"recurring", "description": "...", "run_date": "ISO8601", "remind_before_minutes": INTEGER (optional, e.g. 5) }
        
        **CRITICAL PARSING RULES:**
        - "mỗi ngày", "hàng ngày" → "type": "recurring", "days_of_week": ["mon","tue","wed","thu","fri","sat","sun"]
@@ -132,7 +315,7 @@ def extract_schedule_intent(user_input, history=None):
        - "2h chiều" → hour: 14 ✅
        
        **DATE LOGIC (CRITICAL):**
-       - Compare user time with Current Time ({get_current_time_str()}).
+       - Compare user time with the Current time given with the message.
        - If user says "9h tối" and it is currently 19:00 (7 PM) → Assume TODAY (21:00 Today).
        - Only assume TOMORROW if the time has already passed today OR user explicitly says "mai".
        
@@ -159,19 +342,19 @@ def extract_schedule_intent(user_input, history=None):
        
        ❌ **WRONG:**
        User: "sáng mai tôi đi gặp khách"
-       Output: {{ "intents": [{{ "intent": "schedule_reminder", "run_date": "2025-11-25T08:00:00" }}] }} (WRONG! Do not guess 8:00)
+       Output: { "intents": [{ "intent": "schedule_reminder", "run_date": "2025-11-25T08:00:00" }] } (WRONG! Do not guess 8:00)
        
        ✅ **CORRECT:**
        User: "sáng mai tôi đi gặp khách"
-       Output: {{ "intents": [{{ "intent": "clarify_schedule", "message": "Dạ anh gặp khách hàng vào lúc mấy giờ sáng mai ạ?" }}] }}
+       Output: { "intents": [{ "intent": "clarify_schedule", "message": "Dạ anh gặp khách hàng vào lúc mấy giờ sáng mai ạ?" }] }
        
        ❌ **WRONG:**
        User: "chiều nay làm báo cáo"
-       Output: {{ "intents": [{{ "intent": "schedule_reminder", "run_date": "2025-11-24T14:00:00" }}] }} (WRONG! Do not guess 14:00)
+       Output: { "intents": [{ "intent": "schedule_reminder", "run_date": "2025-11-24T14:00:00" }] } (WRONG! Do not guess 14:00)
        
        ✅ **CORRECT:**
        User: "chiều nay làm báo cáo"
-       Output: {{ "intents": [{{ "intent": "clarify_schedule", "message": "Dạ anh định làm báo cáo lúc mấy giờ chiều nay ạ?" }}] }}
+       Output: { "intents": [{ "intent": "clarify_schedule", "message": "Dạ anh định làm báo cáo lúc mấy giờ chiều nay ạ?" }] }
        
        **Clarification Strategy**: Be natural and varied. Don't always use the same phrase.
        - Example 1: "Dạ anh định học vào những ngày nào trong tuần và khung giờ nào để em note lại ạ?"
@@ -232,21 +415,291 @@ def extract_schedule_intent(user_input, history=None):
 
     CRITICAL: If the user is just answering a question OR asking general questions (weather, news), return "intent": "chat".
        
-    If no specific intent, return {{ "intents": [ {{ "intent": "chat" }} ] }}.
+    If no specific intent, return { "intents": [ { "intent": "chat" } ] }.
     
     Return ONLY the JSON string.
+    """
+
+COMBINED_INSTRUCTIONS = f"""
+    You are the assistant behind a Telegram secretary bot. For each user message,
+    produce ONE JSON object that both classifies the message and, for plain chat, answers it.
+
+    PART A - INTENTS:
+    Fill "intents" exactly as described in the INTENT RULES.
+
+    PART B - REPLY:
+    If the ONLY intent is "chat", also fill "reply" with Trang's answer to the user, written
+    as described in the PERSONA section (pure Vietnamese, polite, concise).
+    For every other intent set "reply" to "" (the bot builds the confirmation itself).
+
+    PERSONA:
+    {SECRETARY_INSTRUCTIONS}
+
+    INTENT RULES:
+    {INTENT_INSTRUCTIONS}
+
+    Output format (write "intents" first, then "reply"): {{ "intents": [ ... ], "reply": "..." }}
+    """
+
+SUMMARY_INSTRUCTIONS = """
+    You maintain a short memory of a chat between a user ("User") and Trang, their secretary.
+    Merge the previous summary and the new turns into ONE updated summary in Vietnamese,
+    at most 120 words. Keep goals (score, deadline, daily study time), preferences,
+    recurring commitments and open questions. Drop greetings and small talk.
+    Return only the summary text.
+    """
+
+SYSTEM_INSTRUCTIONS = {
+    "secretary": SECRETARY_INSTRUCTIONS,
+    "intent": INTENT_INSTRUCTIONS,
+    "combined": COMBINED_INSTRUCTIONS,
+    "summary": SUMMARY_INSTRUCTIONS,
+}
+_GENERATION_CONFIGS = {"combined": JSON_GENERATION_CONFIG}
+
+def get_current_time_str():
+    # Use Vietnam time explicitly
+    tz = ZoneInfo("Asia/Ho_Chi_Minh")
+    return datetime.now(tz).strftime('%Y-%m-%d %H:%M')
+
+def _build_secretary_prompt(history, user_input, schedule_context=""):
+    # Only the per-message part; the persona is the model's system instruction
+    history_text = _format_history(history)
     
+    return (f"Current time: {get_current_time_str()}\n\nKNOWN SCHEDULES:\n{schedule_context}\n\n"
+            f"Conversation History:\n{history_text}\nUser: {user_input}\nTrang:")
+
+def get_secretary_response(history, user_input, schedule_context=""):
+    """
+    Generates a response from the 'Secretary' persona.
+    history: List of previous messages (optional, for context)
+    user_input: The current message from the user
+    schedule_context: String summary of recurring schedules
     """
+    full_prompt = _build_secretary_prompt(history, user_input, schedule_context)
     
     try:
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        # Clean up potential markdown code blocks
-        if text.startswith("```json"):
-            text = text[7:-3]
-        elif text.startswith("```"):
-            text = text[3:-3]
-        return json.loads(text)
+        response = _get_model("secretary").generate_content(full_prompt)
+        return response.text
     except Exception as e:
-        print(f"Error extracting intent: {e}")
+        return f"Dạ anh, em gặp chút lỗi khi xử lý ạ: {str(e)}"
+
+async def get_secretary_response_async(history, user_input, schedule_context="", timeout=None):
+    """Awaitable version of get_secretary_response. Does not block the event loop."""
+    full_prompt = _build_secretary_prompt(history, user_input, schedule_context)
+    
+    try:
+        response = await _generate_content_async("secretary", full_prompt, timeout)
+        return response.text
+    except asyncio.TimeoutError:
+        return "Dạ anh, em xử lý hơi lâu quá, anh thử lại giúp em nhé."
+    except Exception as e:
+        return f"Dạ anh, em gặp chút lỗi khi xử lý ạ: {str(e)}"
+
+def _format_history(history):
+    history_text = ""
+    for msg in history or []:
+        if msg['role'] == 'summary':
+            history_text += f"(Summary of the earlier conversation: {msg['content']})\n"
+            continue
+        role = "User" if msg['role'] == 'user' else "Trang"
+        history_text += f"{role}: {msg['content']}\n"
+    return history_text
+
+async def stream_secretary_response_async(history, user_input, schedule_context="", timeout=None):
+    """
+    Streaming version of get_secretary_response_async: yields the reply piece by piece
+    so the bot can show it while Gemini is still generating.
+    Errors and timeouts are yielded as an apology instead of raised.
+    """
+    full_prompt = _build_secretary_prompt(history, user_input, schedule_context)
+    
+    try:
+        async for chunk in _stream_content_async("secretary", full_prompt, timeout):
+            yield chunk
+    except asyncio.TimeoutError:
+        yield "Dạ anh, em xử lý hơi lâu quá, anh thử lại giúp em nhé."
+    except Exception as e:
+        yield f"Dạ anh, em gặp chút lỗi khi xử lý ạ: {str(e)}"
+
+def _build_intent_prompt(user_input, history=None):
+    # Take last 3 messages for context
+    history_text = _format_history((history or [])[-3:])
+
+    return f"""
+    Current time: {get_current_time_str()}
+    
+    Conversation History (Use this to infer context, e.g., what subject is being studied, and DURATION of goals):
+    {history_text}
+    
+    User message: "{user_input}"
+    """
+
+def _parse_intent_response(text):
+    text = text.strip()
+    # Clean up potential markdown code blocks
+    if text.startswith("```json"):
+        text = text[7:-3]
+    elif text.startswith("```"):
+        text = text[3:-3]
+    return json.loads(text)
+
+def _fast_path_intent(user_input):
+    # Common commands are parsed locally; returns None when Gemini is needed
+    result = parse_intent(user_input)
+    if result and result[1] >= FAST_PATH_MIN_CONFIDENCE:
+        return result[0]
+    return None
+
+def extract_schedule_intent(user_input, history=None):
+    """
+    Uses LLM to extract structured schedule data from natural language.
+    Returns a JSON string or None if no schedule detected.
+    """
+    fast = _fast_path_intent(user_input) or intent_cache.get(user_input, history)
+    if fast:
+        return fast
+
+    prompt = _build_intent_prompt(user_input, history)
+    
+    try:
+        response = _get_model("intent").generate_content(prompt)
+        intent_data = _parse_intent_response(response.text)
+        intent_cache.put(user_input, history, intent_data)
+        return intent_data
+    except Exception as e:
+        logger.exception(f"Error extracting intent: {e}")
+        return {"intents": [{"intent": "chat"}]}
+
+async def extract_schedule_intent_async(user_input, history=None, timeout=None):
+    """
+    Awaitable version of extract_schedule_intent. Does not block the event loop.
+    Falls back to a plain 'chat' intent on errors or timeout.
+    """
+    fast = _fast_path_intent(user_input) or intent_cache.get(user_input, history)
+    if fast:
+        return fast
+
+    prompt = _build_intent_prompt(user_input, history)
+    
+    try:
+        response = await _generate_content_async("intent", prompt, timeout)
+        intent_data = _parse_intent_response(response.text)
+        intent_cache.put(user_input, history, intent_data)
+        return intent_data
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out extracting intent after {timeout or LLM_TIMEOUT_SECONDS}s")
+        return {"intents": [{"intent": "chat"}]}
+    except Exception as e:
+        logger.exception(f"Error extracting intent: {e}")
+        return {"intents": [{"intent": "chat"}]}
+
+def _build_combined_prompt(history, user_input, schedule_context="", user_goal=None):
+    history_text = _format_history(history)
+    goal_text = f"User goal: {user_goal}\n" if user_goal else ""
+
+    return f"""
+    Current time: {get_current_time_str()}
+
+    KNOWN SCHEDULES:
+    {schedule_context}
+    {goal_text}
+    Conversation History (use it for context, e.g. the subject being studied and goal duration):
+    {history_text}
+
+    User message: "{user_input}"
+    """
+
+_JSON_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+
+def _partial_json_string(text, key):
+    """
+    Decoded value of the string field `key` in a JSON document that may still be
+    incomplete, e.g. '{"intents": [...], "reply": "Dạ an' -> 'Dạ an'. "" if not started yet.
+    """
+    m = re.search(rf'"{key}"\s*:\s*"', text)
+    if not m:
+        return ""
+    raw = text[m.end():]
+    out = []
+    i = 0
+    while i < len(raw):
+        ch = raw[i]
+        if ch == '"':
+            break
+        if ch == '\\':
+            if i + 1 >= len(raw):
+                break
+            esc = raw[i + 1]
+            if esc == 'u':
+                if i + 6 > len(raw):
+                    break
+                out.append(chr(int(raw[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            out.append(_JSON_ESCAPES.get(esc, esc))
+            i += 2
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+def _has_chat_intent(intent_data):
+    intents = intent_data.get("intents") or []
+    return not intents or any(i.get("intent") == "chat" for i in intents)
+
+def _cache_combined(user_input, history, result):
+    # Only the intents are cached: a chat reply is generated for this conversation and is not reused
+    if not _has_chat_intent(result):
+        intent_cache.put(user_input, history, {"intents": result["intents"]})
+    return result
+
+async def analyze_message_async(user_input, history=None, schedule_context="", user_goal=None,
+                                timeout=None, on_reply=None):
+    """
+    Combined mode: one Gemini call returns both the intents and, for plain chat,
+    the secretary reply, instead of extract_schedule_intent_async + get_secretary_response_async.
+    Returns {"intents": [...], "reply": "..."}. "reply" is missing when the call failed,
+    so the caller can fall back to get_secretary_response_async.
+    on_reply: optional async callback; the response is then streamed and on_reply(text_so_far)
+    is awaited each time the "reply" field grows, before the full JSON has arrived.
+    Results without a "chat" intent are served from intent_cache on repeats.
+    """
+    fast = _fast_path_intent(user_input)
+    if fast:
+        return fast
+    cached = intent_cache.get(user_input, history)
+    if cached and not _has_chat_intent(cached):
+        return {"intents": cached["intents"], "reply": ""}
+
+    prompt = _build_combined_prompt(history, user_input, schedule_context, user_goal)
+
+    try:
+        if on_reply is None:
+            response = await _generate_content_async("combined", prompt, timeout)
+            return _cache_combined(user_input, history, _parse_intent_response(response.text))
+
+        text = ""
+        shown = ""
+        async for chunk in _stream_content_async("combined", prompt, timeout):
+            text += chunk
+            reply = _partial_json_string(text, "reply")
+            if len(reply) > len(shown):
+                shown = reply
+                await on_reply(reply)
+        return _cache_combined(user_input, history, _parse_intent_response(text))
+    except asyncio.TimeoutError:
+        logger.warning(f"Timed out analysing message after {timeout or LLM_TIMEOUT_SECONDS}s")
+        return {"intents": [{"intent": "chat"}], "reply": "Dạ anh, em xử lý hơi lâu quá, anh thử lại giúp em nhé."}
+    except Exception as e:
+        logger.exception(f"Error analysing message: {e}")
         return {"intents": [{"intent": "chat"}]}
+
+async def summarize_history_async(previous_summary, turns, timeout=None):
+    """
+    Folds old conversation turns into the user's rolling summary (used by history compaction).
+    Raises on errors so the caller keeps the turns.
+    """
+    prompt = f"Previous summary:\n{previous_summary or '(none)'}\n\nNew turns:\n{_format_history(turns)}"
+    response = await _generate_content_async("summary", prompt, timeout)
+    return response.text.strip()
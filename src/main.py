@@ -1,128 +1,204 @@
 import os
+import time
+import asyncio
+import functools
 import logging
 import sqlite3
-from dotenv import load_dotenv
-from telegram import Update
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
+
+import startup
+with startup.phase("import telegram"):
+    from dotenv import load_dotenv
+    from telegram import Update
+    from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, TypeHandler, filters
 from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
 
-from llm_engine import configure_genai, get_secretary_response, extract_schedule_intent
-from scheduler_manager import SchedulerManager
-from database import (
-    init_db, add_user, update_user_goal, get_user_goals, add_task, get_tasks_for_date, 
-    add_recurring_schedule, get_all_schedules, delete_task, delete_recurring_schedule,
-    delete_all_tasks, delete_all_recurring_schedules, delete_tasks_by_date, DB_PATH,
-    get_all_users, check_duplicate_recurring, check_duplicate_task
-)
-
-# ... (imports remain same)
-
-# ... (rest of file)
+with startup.phase("import bot modules"):
+    from llm_engine import (
+        configure_genai, get_secretary_response_async, stream_secretary_response_async,
+        extract_schedule_intent_async, analyze_message_async, summarize_history_async,
+        warm_up as warm_up_llm
+    )
+    import intent_cache
+    import history as conversation_history
+    import metrics
+    from update_processor import ChatOrderedUpdateProcessor
+    from streaming import StreamingReply, stream_reply, send_typing
+    from scheduler_manager import SchedulerManager
+    from leader import LeaderLease
+    from text_utils import format_description, early_reminder_text
+    from recurrence import days_to_mask, mask_to_weekdays, format_minute_of_day
+    from dispatcher import MessageDispatcher
+    from database import (
+        init_db, add_user, update_user_goal, get_user_goals, add_task_if_absent, get_agenda, 
+        add_recurring_schedule_if_absent, get_all_schedules, delete_task, delete_recurring_schedule, delete_recurring_schedule_by_id,
+        delete_all_tasks, delete_all_recurring_schedules, delete_tasks_by_date, DB_PATH,
+        get_all_users, get_all_agendas, search_schedules
+    )
 
 async def send_daily_briefing(context: ContextTypes.DEFAULT_TYPE):
     """Sends a daily schedule summary to all users."""
-    users = get_all_users()
-    tz = ZoneInfo("Asia/Ho_Chi_Minh")
-    now = datetime.now(tz)
-    date_str = now.strftime('%Y-%m-%d')
-    display_date = now.strftime('%d/%m')
-    
-    day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-    current_day_code = day_code_map[now.weekday()]
+    await send_daily_briefing_internal(context.application)
+
+_background_tasks = set()
+metrics_server = None
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    # Keep a reference so the task is not garbage-collected
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
+async def post_init(application):
+    global metrics_server
+    if METRICS_PORT:
+        # Workers use the ports after the router's
+        port = int(METRICS_PORT) + (0 if WORKER_INDEX is None else 1 + WORKER_INDEX)
+        metrics_server = await metrics.start_server(port, METRICS_HOST)
+    # Daily jobs wait in APScheduler's pending list until the job store is loaded
+    # Schedule Daily Briefing at 06:30
+    scheduler.add_daily_job(run_daily_briefing, 6, 30, job_id="daily_briefing")
+    # Trim stored conversation history at night
+    scheduler.add_daily_job(run_history_compaction, 3, 0, job_id="history_compaction")
+    # SQLAlchemy and the Gemini SDK load in the background so polling starts right away
+    run_in_background(finish_startup())
+    startup.mark("start polling")
+
+async def post_shutdown(application):
+    for task in list(_background_tasks):
+        task.cancel()
+    # Lets the scheduler lease be released right away
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+
+async def finish_startup():
+    with startup.phase("scheduler (background)"):
+        if scheduler_lease is None:
+            await scheduler.start_async()
+        else:
+            # Only the worker holding the scheduler lease fires reminders and daily jobs
+            await scheduler.start_async(paused=True)
+            run_in_background(scheduler_lease.run(scheduler.lead, scheduler.follow))
+    try:
+        with startup.phase("gemini sdk (background)"):
+            await asyncio.to_thread(warm_up_llm)
+    except Exception as e:
+        logging.error(f"Gemini warm-up failed, it will be retried on the first message: {e}")
+    startup.log_report()
+
+async def profile_startup():
+    """--profile-startup: times the work finish_startup does, without sending or consuming reminders."""
+    if scheduler.reminders is not None:
+        with startup.phase("reminder window"):
+            scheduler.reminders.next_fire()
+    with startup.phase("job store (SQLAlchemy)"):
+        await asyncio.to_thread(scheduler.create_jobstore)
+    with startup.phase("gemini sdk"):
+        await asyncio.to_thread(warm_up_llm)
+
+async def run_daily_briefing():
+    # Module-level so the persistent job store can reference it; uses the global `application`
+    await send_daily_briefing_internal(application)
+
+async def run_history_compaction():
+    await conversation_history.compact_async(summarize_history_async if HISTORY_SUMMARIZE else None)
+
+def render_briefings(users, agendas, display_date):
+    """Builds the morning message for every user with something scheduled today. Returns [(chat_id, text)]."""
+    messages = []
     for user in users:
         user_id = user[0]
         first_name = user[2] if user[2] else "Anh"
-        
-        # Get tasks
-        tasks = get_tasks_for_date(user_id, date_str)
-        
-        # Get recurring
-        recurring = get_all_schedules(user_id)
-        todays_recurring = []
-        for r in recurring:
-            if current_day_code in r['days_of_week']:
-                todays_recurring.append(r)
-        
-        if tasks or todays_recurring:
+        agenda = agendas.get(user_id)
+        if not agenda:
+            continue
+        day = agenda[0]
+        if day['tasks'] or day['recurring']:
             msg = f"🌞 Chào buổi sáng {first_name}! Lịch trình hôm nay ({display_date}) của anh:\n"
-            for t in tasks:
-                t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
-                fmt_desc = format_description(t['description'])
-                msg += f"- {t_time}: {fmt_desc}\n"
-            for r in todays_recurring:
-                # Format time
-                r_time = r['time']
-                if ":" in r_time:
-                    h, m = map(int, r_time.split(':'))
-                    r_time = f"{h:02d}:{m:02d}"
-                fmt_desc = format_description(r['description'])
-                msg += f"- {r_time}: {fmt_desc} (Định kỳ)\n"
-            
+            msg += "\n".join(format_agenda_lines(day)) + "\n"
             msg += "\nChúc anh một ngày làm việc hiệu quả! 💪"
-            try:
-                await context.bot.send_message(chat_id=user_id, text=msg)
-            except Exception as e:
-                logging.error(f"Failed to send briefing to {user_id}: {e}")
-
-async def post_init(application):
-    scheduler.start()
-    # Schedule Daily Briefing at 06:30
-    scheduler.add_daily_job(lambda: application.create_task(send_daily_briefing(ContextTypes.DEFAULT_TYPE(application=application))), 6, 30)
-    # Note: APScheduler async callback needs to be handled carefully. 
-    # Better: Use application.job_queue if available, but we are using custom scheduler.
-    # Let's use a wrapper that puts it on the event loop.
-    # Actually, AsyncIOScheduler can run async functions directly.
-    # But we need 'context'. 
-    # Simpler: Just pass the callback that takes no args, and inside it use 'application.bot'.
-    
-    # Redefine for scheduler compatibility
-    async def briefing_wrapper():
-        await send_daily_briefing_internal(application)
-        
-    scheduler.add_daily_job(briefing_wrapper, 6, 30)
+            messages.append((user_id, msg))
+    return messages
 
 async def send_daily_briefing_internal(app):
-    users = get_all_users()
+    """
+    Briefing pipeline: bulk-load today's agenda for every user, render all messages,
+    then send them through the rate-limited MessageDispatcher.
+    """
+    started = time.monotonic()
     tz = ZoneInfo("Asia/Ho_Chi_Minh")
     now = datetime.now(tz)
     date_str = now.strftime('%Y-%m-%d')
+    next_date_str = (now + timedelta(days=1)).strftime('%Y-%m-%d')
     display_date = now.strftime('%d/%m')
-    day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-    current_day_code = day_code_map[now.weekday()]
 
-    for user in users:
-        user_id = user[0]
-        first_name = user[2] if user[2] else "Anh"
-        tasks = get_tasks_for_date(user_id, date_str)
-        recurring = get_all_schedules(user_id)
-        todays_recurring = [r for r in recurring if current_day_code in r['days_of_week']]
-        
-        if tasks or todays_recurring:
-            msg = f"🌞 Chào buổi sáng {first_name}! Lịch trình hôm nay ({display_date}) của anh:\n"
-            for t in tasks:
-                t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
-                fmt_desc = format_description(t['description'])
-                msg += f"- {t_time}: {fmt_desc}\n"
-            for r in todays_recurring:
-                r_time = r['time']
-                if ":" in r_time:
-                    h, m = map(int, r_time.split(':'))
-                    r_time = f"{h:02d}:{m:02d}"
-                fmt_desc = format_description(r['description'])
-                msg += f"- {r_time}: {fmt_desc} (Định kỳ)\n"
-            msg += "\nChúc anh một ngày làm việc hiệu quả! 💪"
-            try:
-                await app.bot.send_message(chat_id=user_id, text=msg)
-            except Exception as e:
-                logging.error(f"Failed to send briefing to {user_id}: {e}")
+    with metrics.trace("briefing") as trace:
+        users = get_all_users()
+        agendas = get_all_agendas(date_str, next_date_str)
+        with metrics.span("briefing.render"):
+            messages = render_briefings(users, agendas, display_date)
+        load_time = time.monotonic() - started
+
+        with metrics.span("briefing.send"):
+            stats = await MessageDispatcher(app.bot).send_all(messages)
+        trace.attrs.update(users=len(users), messages=len(messages))
+    metrics.BRIEFING_SECONDS.observe(time.monotonic() - started)
+    logging.info(f"Daily briefing: {len(users)} users, {len(messages)} messages, "
+                 f"prepared in {load_time:.2f}s; {stats.summary()}")
+    logging.info(f"Intent cache: {intent_cache.stats().summary()}")
+    logging.info(f"Update processor: {update_processor.stats()}")
+    if scheduler.delivery_stats() is not None:
+        logging.info(f"Reminder delivery: {scheduler.delivery_stats().summary()}")
+    return stats
 
 # Load environment variables
 load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+LLM_MAX_CONCURRENCY = os.getenv("LLM_MAX_CONCURRENCY")  # Max Gemini calls in flight (default 8)
+LLM_TIMEOUT_SECONDS = os.getenv("LLM_TIMEOUT_SECONDS")  # Per-call timeout (default 30s)
+# One Gemini call per message for intents + chat reply; set to 0 for the old two-step flow
+LLM_COMBINED_MODE = os.getenv("LLM_COMBINED_MODE", "1").lower() not in ("0", "false", "no")
+# Show chat replies while Gemini is still generating them (progressive message edits)
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1").lower() not in ("0", "false", "no")
+INTENT_FAST_PATH_MIN_CONFIDENCE = os.getenv("INTENT_FAST_PATH_MIN_CONFIDENCE")  # Rule-based parser threshold (default 0.85)
+INTENT_CACHE_SIZE = os.getenv("INTENT_CACHE_SIZE")  # In-memory intent cache entries (default 4096)
+# Also keep cached intents in SQLite so they survive restarts
+INTENT_CACHE_PERSIST = os.getenv("INTENT_CACHE_PERSIST", "0").lower() in ("1", "true", "yes")
+# Where reminders live: "tables" derives them from tasks / recurring_schedules,
+# "light" keeps compact rows in a reminders table, "apscheduler" pickles one job per reminder
+REMINDER_BACKEND = os.getenv("REMINDER_BACKEND", "tables")
+REMINDER_SEND_RATE = float(os.getenv("REMINDER_SEND_RATE", "25"))  # Reminder messages per second at peak minutes
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))  # Chats handled in parallel
+HISTORY_TOKEN_BUDGET = os.getenv("HISTORY_TOKEN_BUDGET")  # Max history tokens per prompt (default 1500)
+# Fold compacted history into a per-user summary with Gemini (one call per compacted user per day)
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "0").lower() in ("1", "true", "yes")
+# Keep the fixed system prompts in Gemini's context cache (needs a paid-tier key)
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "0").lower() in ("1", "true", "yes")
+# Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics (off when unset)
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Log one line per update with where its time went (only updates slower than TRACE_MIN_MS)
+TRACE_UPDATES = os.getenv("TRACE_UPDATES", "0").lower() in ("1", "true", "yes")
+TRACE_MIN_MS = os.getenv("TRACE_MIN_MS")
+# How updates arrive: "polling" (getUpdates) or "webhook" (Telegram POSTs them, see webhook.py)
+UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public HTTPS URL for setWebhook; unset = only local POSTs
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Generated per start when unset and WEBHOOK_URL is set
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_MAX_PENDING = int(os.getenv("WEBHOOK_MAX_PENDING", "1000"))  # Unfinished updates before answering 503
+# Several processes (see workers.py): a router takes the updates from Telegram and
+# forwards each chat's updates to one of WORKERS worker processes
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_BASE_PORT = int(os.getenv("WORKER_BASE_PORT", "8700"))  # Worker i listens on 127.0.0.1:WORKER_BASE_PORT+i
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "30"))  # A dead scheduler leader is replaced after this long
+# Set by the router for the worker processes it starts
+WORKER_INDEX = int(os.getenv("WORKER_INDEX")) if os.getenv("WORKER_INDEX") else None
+WORKER_PORT = int(os.getenv("WORKER_PORT", "0"))
+WORKER_SECRET = os.getenv("WORKER_SECRET")
 
 # Logging
 logging.basicConfig(
@@ -130,11 +206,58 @@ logging.basicConfig(
     level=logging.INFO
 )
 
-# Initialize modules
-init_db()
-configure_genai(GEMINI_API_KEY)
-scheduler = SchedulerManager()
-
+# Set by init_modules()
+scheduler = None
+scheduler_lease = None
+# Messages of one chat run in order, different chats run in parallel
+update_processor = ChatOrderedUpdateProcessor(UPDATE_CONCURRENCY)
+metrics.configure(trace=TRACE_UPDATES, trace_min_ms=TRACE_MIN_MS)
+metrics.Gauge("bot_update_queue_depth", "Updates waiting for their chat or a free slot", lambda: update_processor.waiting)
+metrics.Gauge("bot_updates_running", "Updates being handled", lambda: update_processor.running)
+metrics.Gauge("bot_intent_cache_hit_rate", "Intent cache hits / lookups", lambda: intent_cache.stats().hit_rate)
+
+def init_modules():
+    """
+    Opens the database and sets up Gemini, the caches and the scheduler. Called when the
+    bot or a worker starts, not on import, so the router process (WORKERS > 1) skips it
+    and importers (benchmarks) can point DB_PATH elsewhere first.
+    """
+    global scheduler, scheduler_lease
+    with startup.phase("init database"):
+        init_db()
+    configure_genai(GEMINI_API_KEY, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT_SECONDS,
+                    fast_path_min_confidence=INTENT_FAST_PATH_MIN_CONFIDENCE, context_cache=LLM_CONTEXT_CACHE)
+    with startup.phase("init caches"):
+        intent_cache.configure(size=INTENT_CACHE_SIZE, persistent=INTENT_CACHE_PERSIST)
+        conversation_history.configure(token_budget=HISTORY_TOKEN_BUDGET)
+    with startup.phase("init scheduler"):
+        scheduler = SchedulerManager(reminder_backend=REMINDER_BACKEND, shared=WORKER_INDEX is not None)
+        scheduler_lease = LeaderLease("scheduler", ttl=LEASE_SECONDS) if WORKER_INDEX is not None else None
+    if scheduler_lease is not None:
+        metrics.Gauge("bot_scheduler_leader", "1 if this worker fires reminders and daily jobs",
+                      lambda: int(scheduler_lease.is_leader))
+
+def traced(intent):
+    """
+    Handler decorator: one metrics trace per update, and its duration in
+    bot_handler_seconds labelled with the intent (handlers refine it with metrics.annotate).
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            chat = update.effective_chat.id if update.effective_chat else None
+            with metrics.trace(f"update {update.update_id}", chat=chat, intent=intent) as trace:
+                try:
+                    await handler(update, context)
+                except Exception as e:
+                    trace.attrs["error"] = type(e).__name__
+                    raise
+                finally:
+                    metrics.HANDLER_SECONDS.observe(time.perf_counter() - trace.started, intent=trace.attrs["intent"])
+        return wrapper
+    return decorator
+
+@traced("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     add_user(user.id, user.username)
@@ -143,56 +266,100 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         text=f"Dạ em chào anh {user.first_name} ạ! Em là Trang, thư ký riêng của anh. Em có thể giúp anh quản lý lịch trình, kế hoạch học tập và tài chính. Anh cần em giúp gì không ạ?"
     )
 
-def format_description(text):
-    """Capitalizes the first letter of the description."""
-    if not text: return ""
-    # Remove "lịch" prefix if it exists to be concise
-    cleaned = text.strip()
-    if cleaned.lower().startswith("lịch "):
-        cleaned = cleaned[5:].strip()
-    return cleaned[0].upper() + cleaned[1:] if cleaned else ""
+WEEKDAY_NAMES = {0: "Thứ 2", 1: "Thứ 3", 2: "Thứ 4", 3: "Thứ 5", 4: "Thứ 6", 5: "Thứ 7", 6: "Chủ Nhật"}
 
+def format_time_display(time_str):
+    """'8:5' -> '08:05'"""
+    try:
+        h, m = map(int, time_str.split(':'))
+        return f"{h:02d}:{m:02d}"
+    except (ValueError, AttributeError):
+        # Not 'H:M', or no time at all (None)
+        return time_str
+
+def format_agenda_lines(day, bullet="-"):
+    """Renders one get_agenda() day as '<bullet> HH:MM: Description' lines, one-off tasks first."""
+    lines = []
+    for t in day['tasks']:
+        t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
+        lines.append(f"{bullet} {t_time}: {format_description(t['description'])}")
+    for r in day['recurring']:
+        r_time = format_time_display(r['time']) if r['minute_of_day'] is None else format_minute_of_day(r['minute_of_day'])
+        lines.append(f"{bullet} {r_time}: {format_description(r['description'])} (Định kỳ)")
+    return lines
+
+@traced("unknown")
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_input = update.message.text
     chat_id = update.effective_chat.id
     
-    # 1. Get Intent from LLM
+    user_id = update.effective_user.id
+    # Recent turns that fit in the history token budget (plus the rolling summary)
+    history = conversation_history.get_context(user_id)
+    user_turn_recorded = False
+
+    def remember(reply):
+        # Stores the user message once per update and every reply sent for it
+        nonlocal user_turn_recorded
+        turns = [] if user_turn_recorded else [('user', user_input)]
+        user_turn_recorded = True
+        conversation_history.add_turns(user_id, turns + [('assistant', reply)])
+
+    def chat_context():
+        # Recurring schedules + user goal, used by the chat persona
+        schedules = get_all_schedules(update.effective_user.id)
+        schedule_context = "\n".join([f"- {s['description']} ({s['days_of_week']} {s['time']})" for s in schedules])
+        return schedule_context, get_user_goals(chat_id)
+
+    # Show "typing..." right away, without waiting for Telegram to answer
+    run_in_background(send_typing(context.bot, chat_id))
+    streamed = StreamingReply(context.bot, chat_id)
+
+    # 1. Get Intent from LLM (combined mode also returns the chat reply in the same call)
     try:
-        history = context.user_data.get('history', [])
-        intent_data = extract_schedule_intent(user_input, history)
+        if LLM_COMBINED_MODE:
+            schedule_context, user_goals = chat_context()
+            intent_data = await analyze_message_async(user_input, history, schedule_context, user_goals,
+                                                      on_reply=streamed.update if STREAM_REPLIES else None)
+        else:
+            intent_data = await extract_schedule_intent_async(user_input, history)
     except Exception as e:
         logging.error(f"LLM Error: {e}")
+        metrics.annotate(intent="llm_error")
         await context.bot.send_message(chat_id=chat_id, text="Dạ em đang gặp chút trục trặc, anh thử lại sau nhé.")
         return
 
     intents = intent_data.get("intents", [])
+    metrics.annotate(intent="+".join(sorted({i.get("intent") or "unknown" for i in intents})) or "chat")
     
     # If no specific intent found (or just 'chat'), use the Chat Persona
     if not intents or (len(intents) == 1 and intents[0].get("intent") == "chat"):
-        # Get context (recurring schedules)
-        schedules = get_all_schedules(update.effective_user.id)
-        schedule_context = "\n".join([f"- {s['description']} ({s['days_of_week']} {s['time']})" for s in schedules])
-        
-        # Get history (last 10 messages)
-        if 'history' not in context.user_data:
-            context.user_data['history'] = []
-        history = context.user_data['history'][-10:]
-        
-        # Get user goals
-        user_goals = get_user_goals(chat_id)
-        context_input = user_input
-        if user_goals:
-            context_input = f"[User Goal: {user_goals}] {user_input}"
-            
-        response = get_secretary_response(history, context_input, schedule_context)
-        
-        # Update history
-        context.user_data['history'].append({'role': 'user', 'content': user_input})
-        context.user_data['history'].append({'role': 'assistant', 'content': response})
+        response = intent_data.get("reply")
+        if response:
+            if STREAM_REPLIES:
+                await streamed.finish(response)
+            else:
+                await context.bot.send_message(chat_id=chat_id, text=response)
+        else:
+            # Two-step mode (or the combined call failed): second call for the persona reply
+            schedule_context, user_goals = chat_context()
+            context_input = user_input
+            if user_goals:
+                context_input = f"[User Goal: {user_goals}] {user_input}"
+            if STREAM_REPLIES:
+                response = await stream_reply(context.bot, chat_id,
+                                              stream_secretary_response_async(history, context_input, schedule_context))
+            else:
+                response = await get_secretary_response_async(history, context_input, schedule_context)
+                await context.bot.send_message(chat_id=chat_id, text=response)
         
-        await context.bot.send_message(chat_id=chat_id, text=response)
+        remember(response)
         return
 
+    if streamed.started:
+        # The model wrote a reply for a non-chat message; close it instead of leaving it "…"
+        await streamed.finish(intent_data.get("reply") or streamed.text)
+
     # Process each intent
     for intent_obj in intents:
         intent_type = intent_obj.get("intent")
@@ -209,11 +376,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if final_msg.strip():
                 await context.bot.send_message(chat_id=chat_id, text=final_msg.strip())
             
-            # Update history with the full response
-            if 'history' not in context.user_data:
-                context.user_data['history'] = []
-            context.user_data['history'].append({'role': 'user', 'content': user_input})
-            context.user_data['history'].append({'role': 'assistant', 'content': final_msg.strip()})
+            remember(final_msg.strip())
 
         if intent_type == "schedule_reminder":
             description = intent_obj.get("description")
@@ -240,16 +403,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 if isinstance(days, list):
                     days = ",".join(days)
 
-                day_map = {"mon": "Thứ 2", "tue": "Thứ 3", "wed": "Thứ 4", "thu": "Thứ 5", "fri": "Thứ 6", "sat": "Thứ 7", "sun": "Chủ Nhật"}
-                display_days = ", ".join([day_map.get(d, d) for d in days.split(',')])
+                display_days = ", ".join(WEEKDAY_NAMES[d] for d in mask_to_weekdays(days_to_mask(days))) or days
 
-                # Check for duplicates (using ORIGINAL time)
-                if check_duplicate_recurring(update.effective_user.id, description, days, f"{hour:02d}:{minute:02d}"):
+                # Add to DB unless it already exists (ORIGINAL time)
+                schedule_id, created = add_recurring_schedule_if_absent(update.effective_user.id, description, days, f"{hour:02d}:{minute:02d}", end_date,
+                                                                        chat_id=chat_id, remind_before_minutes=remind_before,
+                                                                        reminder_message=reminder_msg)
+                if not created:
                     await send_response(f"⚠️ Dạ lịch '{fmt_desc}' vào {hour:02d}:{minute:02d} các ngày {display_days} đã có rồi ạ.")
                     return
-
-                # Add to DB (ORIGINAL time)
-                add_recurring_schedule(update.effective_user.id, description, days, f"{hour:02d}:{minute:02d}", end_date)
                 
                 # Calculate Reminder Time
                 sched_hour = hour
@@ -277,11 +439,11 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         sched_days = ",".join(new_days)
                     
                     # Schedule Early Reminder
-                    early_msg = f"⏰ Thưa anh, còn {remind_before} phút nữa là đến giờ {fmt_desc} rồi ạ."
-                    scheduler.add_recurring_reminder(chat_id, early_msg, sched_hour, sched_minute, sched_days, end_date)
+                    early_msg = early_reminder_text(description, remind_before)
+                    scheduler.add_recurring_reminder(chat_id, early_msg, sched_hour, sched_minute, sched_days, end_date, schedule_id=schedule_id, slot="early")
 
                 # Schedule Main Reminder (On-time)
-                scheduler.add_recurring_reminder(chat_id, reminder_msg, hour, minute, days, end_date)
+                scheduler.add_recurring_reminder(chat_id, reminder_msg, hour, minute, days, end_date, schedule_id=schedule_id)
                 
                 msg = f"✅ Dạ em đã lên lịch: {fmt_desc} vào {hour:02d}:{minute:02d} các ngày {display_days}"
                 if remind_before > 0:
@@ -327,21 +489,21 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         run_date_str = run_date.isoformat() # Update str for DB
                         is_shifted = True
 
-                    # Check for duplicates (ORIGINAL time - wait, should check NEW time)
-                    if check_duplicate_task(update.effective_user.id, description, run_date_str):
+                    # Insert unless a task with the same (shifted) time and description exists
+                    task_id, created = add_task_if_absent(update.effective_user.id, description, run_date_str, chat_id=chat_id,
+                                                          remind_before_minutes=remind_before, reminder_message=reminder_msg)
+                    if not created:
                         await send_response(f"⚠️ Dạ lịch '{fmt_desc}' vào lúc {run_date.strftime('%H:%M %d/%m/%Y')} đã có rồi ạ.")
                         return
-
+                    
                     # Schedule Reminders
                     if remind_before > 0:
                         reminder_time = run_date - timedelta(minutes=remind_before)
-                        early_msg = f"⏰ Thưa anh, còn {remind_before} phút nữa là đến giờ {fmt_desc} rồi ạ."
-                        scheduler.add_reminder(chat_id, early_msg, reminder_time)
+                        early_msg = early_reminder_text(description, remind_before)
+                        scheduler.add_reminder(chat_id, early_msg, reminder_time, schedule_id=task_id, slot="early")
                     
                     # Always schedule the main on-time reminder
-                    scheduler.add_reminder(chat_id, reminder_msg, run_date)
-                    
-                    add_task(update.effective_user.id, description, run_date_str)
+                    scheduler.add_reminder(chat_id, reminder_msg, run_date, schedule_id=task_id)
                     
                     if is_shifted:
                         msg = f"⚠️ Dạ giờ đó hôm nay đã qua, nên em chuyển sang ngày mai.\n✅ Đã lên lịch: {fmt_desc} vào lúc {run_date.strftime('%H:%M %d/%m/%Y')}"
@@ -356,7 +518,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif intent_type == "log_event":
             description = intent_obj.get("description")
             start_time = intent_obj.get("start_time")
-            add_task(update.effective_user.id, description, start_time)
+            add_task_if_absent(update.effective_user.id, description, start_time)
             fmt_desc = format_description(description)
             await send_response(f"✅ Dạ em đã ghi lại: {fmt_desc}.")
 
@@ -369,36 +531,29 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             time_range = intent_obj.get("time_range")
             keyword = intent_obj.get("keyword")
             user_id = update.effective_user.id
-            
-            def format_time_display(time_str):
-                try:
-                    h, m = map(int, time_str.split(':'))
-                    return f"{h:02d}:{m:02d}"
-                except:
-                    return time_str
 
             if keyword:
-                recurring = get_all_schedules(user_id)
-                found_schedules = []
-                for r in recurring:
-                    if keyword.lower() in r['description'].lower():
-                        found_schedules.append(r)
+                # Ranked FTS search; "hoc toeic" also finds "Học TOEIC"
+                found = search_schedules(user_id, keyword)
+                found_schedules = found["recurring"]
+                now_str = datetime.now().isoformat()
+                found_tasks = sorted((t for t in found["task"] if t['schedule_time'] and t['schedule_time'] >= now_str),
+                                     key=lambda t: t['schedule_time'])
                 
-                if not found_schedules:
+                if not found_schedules and not found_tasks:
                     await send_response(f"❌ Dạ em không tìm thấy lịch nào có tên '{keyword}' ạ.")
                 else:
                     msg = f"📅 Dạ lịch '{keyword}' của anh đây ạ:\n"
-                    day_map = {"mon": "Thứ 2", "tue": "Thứ 3", "wed": "Thứ 4", "thu": "Thứ 5", "fri": "Thứ 6", "sat": "Thứ 7", "sun": "Chủ Nhật"}
-                    
+
                     for r in found_schedules:
-                        r_time = format_time_display(r['time'])
+                        r_time = format_time_display(r['time']) if r['minute_of_day'] is None else format_minute_of_day(r['minute_of_day'])
                         fmt_desc = format_description(r['description'])
-                        days_display = []
-                        if r['days_of_week']:
-                            days_display = [day_map.get(d, d) for d in r['days_of_week'].split(',')]
-                        days_str = ", ".join(days_display)
+                        days_str = ", ".join(WEEKDAY_NAMES[d] for d in mask_to_weekdays(r['days_mask']))
                         end_date_str = f" (đến {r['end_date']})" if r.get('end_date') else ""
                         msg += f"- {fmt_desc}: {r_time} các ngày {days_str}{end_date_str}\n"
+                    for t in found_tasks:
+                        t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M %d/%m/%Y')
+                        msg += f"- {format_description(t['description'])}: {t_time}\n"
                     
                     await send_response(msg)
 
@@ -407,35 +562,14 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 today = datetime.now(tz)
                 response_lines = ["📅 Dạ lịch trình tuần tới của anh đây ạ:\n"]
                 
+                agenda = get_agenda(user_id, today.strftime('%Y-%m-%d'), (today + timedelta(days=7)).strftime('%Y-%m-%d'))
                 has_events = False
-                for i in range(7):
-                    current_day = today + timedelta(days=i)
-                    date_str = current_day.strftime('%Y-%m-%d')
-                    display_date = current_day.strftime('%d/%m')
-                    weekday_map = {0: "Thứ 2", 1: "Thứ 3", 2: "Thứ 4", 3: "Thứ 5", 4: "Thứ 6", 5: "Thứ 7", 6: "Chủ Nhật"}
-                    weekday_name = weekday_map[current_day.weekday()]
-                    
-                    tasks = get_tasks_for_date(user_id, date_str)
-                    recurring = get_all_schedules(user_id)
-                    todays_recurring = []
-                    day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-                    current_day_code = day_code_map[current_day.weekday()]
-                    
-                    for r in recurring:
-                        if current_day_code in r['days_of_week']:
-                            todays_recurring.append(r)
-                    
-                    if tasks or todays_recurring:
+                for day in agenda:
+                    if day['tasks'] or day['recurring']:
                         has_events = True
-                        response_lines.append(f"📌 {weekday_name} ({display_date}):")
-                        for t in tasks:
-                            t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
-                            fmt_desc = format_description(t['description'])
-                            response_lines.append(f" - {t_time}: {fmt_desc}")
-                        for r in todays_recurring:
-                            r_time = format_time_display(r['time'])
-                            fmt_desc = format_description(r['description'])
-                            response_lines.append(f" - {r_time}: {fmt_desc} (Định kỳ)")
+                        display_date = datetime.fromisoformat(day['date']).strftime('%d/%m')
+                        response_lines.append(f"📌 {WEEKDAY_NAMES[day['weekday']]} ({display_date}):")
+                        response_lines.extend(format_agenda_lines(day, bullet=" -"))
                         response_lines.append("")
                 
                 if not has_events:
@@ -452,38 +586,19 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 try:
                     target_date = datetime.fromisoformat(specific_date_str + "T00:00:00")
-                except:
+                except (ValueError, TypeError):
+                    # Not YYYY-MM-DD, or not a string in Gemini's JSON
                     await send_response("Dạ em không hiểu định dạng ngày này ạ. Anh có thể nói rõ hơn không ạ?")
                     continue
                 
-                date_str = specific_date_str
-                tasks = get_tasks_for_date(user_id, date_str)
-                
-                recurring = get_all_schedules(user_id)
-                todays_recurring = []
-                day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-                target_day_code = day_code_map[target_date.weekday()]
-                
-                for r in recurring:
-                    if target_day_code in r['days_of_week']:
-                        todays_recurring.append(r)
+                day = get_agenda(user_id, specific_date_str, (target_date + timedelta(days=1)).strftime('%Y-%m-%d'))[0]
+                day_name = WEEKDAY_NAMES[target_date.weekday()]
                 
-                if not tasks and not todays_recurring:
-                    day_map = {0: "Thứ 2", 1: "Thứ 3", 2: "Thứ 4", 3: "Thứ 5", 4: "Thứ 6", 5: "Thứ 7", 6: "Chủ Nhật"}
-                    day_name = day_map[target_date.weekday()]
+                if not day['tasks'] and not day['recurring']:
                     await send_response(f"Dạ ngày {target_date.strftime('%d/%m/%Y')} ({day_name}) anh chưa có lịch nào ạ.")
                 else:
-                    day_map = {0: "Thứ 2", 1: "Thứ 3", 2: "Thứ 4", 3: "Thứ 5", 4: "Thứ 6", 5: "Thứ 7", 6: "Chủ Nhật"}
-                    day_name = day_map[target_date.weekday()]
                     msg = f"📅 Dạ lịch trình ngày {target_date.strftime('%d/%m/%Y')} ({day_name}) của anh:\n"
-                    for t in tasks:
-                        t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
-                        fmt_desc = format_description(t['description'])
-                        msg += f"- {t_time}: {fmt_desc}\n"
-                    for r in todays_recurring:
-                        r_time = format_time_display(r['time'])
-                        fmt_desc = format_description(r['description'])
-                        msg += f"- {r_time}: {fmt_desc} (Định kỳ)\n"
+                    msg += "\n".join(format_agenda_lines(day)) + "\n"
                     await send_response(msg)
 
             else:
@@ -502,30 +617,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         days_ahead += 7
                     target_date = now + timedelta(days=days_ahead)
                 
-                date_str = target_date.strftime('%Y-%m-%d')
-                tasks = get_tasks_for_date(user_id, date_str)
-                
-                recurring = get_all_schedules(user_id)
-                todays_recurring = []
-                day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-                target_day_code = day_code_map[target_date.weekday()]
-                
-                for r in recurring:
-                    if target_day_code in r['days_of_week']:
-                        todays_recurring.append(r)
+                day = get_agenda(user_id, target_date.strftime('%Y-%m-%d'), (target_date + timedelta(days=1)).strftime('%Y-%m-%d'))[0]
                 
-                if not tasks and not todays_recurring:
+                if not day['tasks'] and not day['recurring']:
                     await send_response(f"Dạ ngày {target_date.strftime('%d/%m')} anh chưa có lịch nào ạ.")
                 else:
                     msg = f"📅 Dạ lịch trình ngày {target_date.strftime('%d/%m')} của anh:\n"
-                    for t in tasks:
-                        t_time = datetime.fromisoformat(t['schedule_time']).strftime('%H:%M')
-                        fmt_desc = format_description(t['description'])
-                        msg += f"- {t_time}: {fmt_desc}\n"
-                    for r in todays_recurring:
-                        r_time = format_time_display(r['time'])
-                        fmt_desc = format_description(r['description'])
-                        msg += f"- {r_time}: {fmt_desc} (Định kỳ)\n"
+                    msg += "\n".join(format_agenda_lines(day)) + "\n"
                     await send_response(msg)
 
         elif intent_type == "set_goal":
@@ -533,18 +631,15 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if goal:
                 update_user_goal(update.effective_user.id, goal)
                 
-                if 'history' not in context.user_data:
-                    context.user_data['history'] = []
-                history = context.user_data['history']
-                
                 advice_prompt = f"Người dùng vừa nói: '{user_input}'. Họ đang muốn đặt mục tiêu: '{goal}'. Hãy đóng vai thư ký Trang. **QUAN TRỌNG: HÃY TRẢ LỜI HOÀN TOÀN BẰNG TIẾNG VIỆT. TUYỆT ĐỐI KHÔNG DÙNG TỪ TIẾNG ANH.** Dựa vào toàn bộ câu nói của người dùng VÀ LỊCH SỬ TRÒ CHUYỆN (để biết chủ đề, ví dụ TOEIC), hãy TỰ NHẬN ĐỊNH xem thông tin đã đủ để lập kế hoạch chưa (Mục tiêu, Thời gian hoàn thành, Thời gian học mỗi ngày). \n- Nếu THIẾU thông tin: CHỈ ĐẶT CÂU HỎI để làm rõ.\n- Nếu ĐỦ thông tin: Hãy xác nhận '🎯 Dạ em đã lưu mục tiêu: {goal}' và NGAY LẬP TỨC hỏi về lịch học: 'Anh muốn sắp xếp lịch học vào những ngày nào và khung giờ nào ạ?' để em lên lịch nhắc nhở.\n\nHãy trả lời tự nhiên, ngắn gọn."
-                response = get_secretary_response(history, advice_prompt, "")
-                
-                # Update history
-                context.user_data['history'].append({'role': 'user', 'content': user_input})
-                context.user_data['history'].append({'role': 'assistant', 'content': response})
+                if STREAM_REPLIES:
+                    response = await stream_reply(context.bot, chat_id,
+                                                  stream_secretary_response_async(history, advice_prompt, ""))
+                else:
+                    response = await get_secretary_response_async(history, advice_prompt, "")
+                    await context.bot.send_message(chat_id=chat_id, text=response)
                 
-                await context.bot.send_message(chat_id=chat_id, text=response)
+                remember(response)
 
         elif intent_type == "delete_schedule":
             delete_all = intent_obj.get("delete_all", False)
@@ -554,23 +649,19 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if delete_all:
                 t_rows = delete_all_tasks(update.effective_user.id)
                 r_rows = delete_all_recurring_schedules(update.effective_user.id)
-                jobs_removed = 0
-                for job in scheduler.get_jobs():
-                    if job.args and job.args[0] == chat_id:
-                        job.remove()
-                        jobs_removed += 1
+                jobs_removed = scheduler.remove_all_for(chat_id)
                 await send_response(f"✅ Dạ em đã xóa toàn bộ lịch trình của anh rồi ạ ({t_rows} việc, {r_rows} lịch định kỳ).")
             
             elif description:
                 deleted_one_off = delete_task(update.effective_user.id, description)
                 deleted_recurring = delete_recurring_schedule(update.effective_user.id, description)
                 jobs_removed = 0
-                for job in scheduler.get_jobs():
-                    if job.args and job.args[0] == chat_id:
-                        msg = job.args[1]
-                        if description.lower() in msg.lower():
-                            job.remove()
-                            jobs_removed += 1
+                for task_id in deleted_one_off:
+                    jobs_removed += scheduler.remove_jobs_for(chat_id, task_id, kind="task")
+                for schedule_id in deleted_recurring:
+                    jobs_removed += scheduler.remove_jobs_for(chat_id, schedule_id, kind="recurring")
+                # Reminders created before jobs had schedule IDs
+                jobs_removed += scheduler.remove_jobs_matching(chat_id, description)
                 
                 fmt_desc = format_description(description)
                 if deleted_one_off or deleted_recurring or jobs_removed > 0:
@@ -594,19 +685,20 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     target_date = now + timedelta(days=days_ahead)
                 
                 target_date_str = target_date.strftime('%Y-%m-%d')
-                deleted_rows = delete_tasks_by_date(update.effective_user.id, target_date_str)
+                deleted_task_ids = delete_tasks_by_date(update.effective_user.id, target_date_str)
+                deleted_rows = len(deleted_task_ids)
+                for task_id in deleted_task_ids:
+                    scheduler.remove_jobs_for(chat_id, task_id, kind="task")
                 
                 recurring = get_all_schedules(update.effective_user.id)
-                day_code_map = {0: "mon", 1: "tue", 2: "wed", 3: "thu", 4: "fri", 5: "sat", 6: "sun"}
-                target_day_code = day_code_map[target_date.weekday()]
+                target_bit = 1 << target_date.weekday()
                 
                 deleted_recurring_count = 0
                 for r in recurring:
-                    if target_day_code in r['days_of_week']:
-                        delete_recurring_schedule(update.effective_user.id, r['description'])
-                        for job in scheduler.get_jobs():
-                            if job.args and job.args[0] == chat_id and r['description'] in job.args[1]:
-                                job.remove()
+                    if r['days_mask'] & target_bit:
+                        delete_recurring_schedule_by_id(update.effective_user.id, r['id'])
+                        scheduler.remove_jobs_for(chat_id, r['id'], kind="recurring")
+                        scheduler.remove_jobs_matching(chat_id, r['description'])
                         deleted_recurring_count += 1
                 
                 msg = f"✅ Dạ em đã xóa các công việc trong ngày {target_date.strftime('%d/%m')} ({deleted_rows} việc)."
@@ -619,21 +711,72 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif intent_type == "clarify_schedule":
             message = intent_obj.get("message", "Dạ anh có thể nói rõ hơn được không ạ?")
             await send_response(message)
-async def post_init(application):
-    scheduler.start()
+
+def run_router():
+    """WORKERS > 1: this process only takes updates from Telegram and forwards them to the workers."""
+    import workers
+    router = workers.Router(WORKERS, os.path.abspath(__file__), WORKER_BASE_PORT, WEBHOOK_PATH)
+
+    async def router_post_init(application):
+        global metrics_server
+        if METRICS_PORT:
+            metrics_server = await metrics.start_server(METRICS_PORT, METRICS_HOST)
+        await router.start()
+
+    builder = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(router_post_init).post_shutdown(router.stop)
+    if UPDATE_MODE == "webhook":
+        builder = builder.updater(None)
+    application = builder.build()
+    # Updates are routed one at a time, so each chat's updates reach its worker in order
+    application.add_handler(TypeHandler(Update, router.route))
+
+    print(f"Router is running ({UPDATE_MODE}, {WORKERS} workers)...")
+    if UPDATE_MODE == "webhook":
+        import webhook
+        asyncio.run(webhook.run(application, application.update_processor, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                                webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET,
+                                max_connections=WEBHOOK_MAX_CONNECTIONS, max_pending=WEBHOOK_MAX_PENDING))
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
+    if startup.PROFILE_ONLY:
+        init_modules()
+        with startup.phase("build application"):
+            ApplicationBuilder().token(TELEGRAM_TOKEN or "0:profile").concurrent_updates(update_processor).build()
+        asyncio.run(profile_startup())
+        print("\n".join(startup.report()))
+        exit(0)
+
     if not TELEGRAM_TOKEN:
         print("Error: TELEGRAM_TOKEN not found in .env")
         exit(1)
 
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).post_init(post_init).build()
+    if WORKERS > 1 and WORKER_INDEX is None:
+        run_router()
+        exit(0)
+
+    init_modules()
+
+    with startup.phase("build application"):
+        builder = (
+            ApplicationBuilder()
+            .token(TELEGRAM_TOKEN)
+            .concurrent_updates(update_processor)
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+        )
+        if UPDATE_MODE == "webhook" or WORKER_INDEX is not None:
+            builder = builder.updater(None)
+        application = builder.build()
     
     # Connect scheduler callback
     async def actual_callback(chat_id, text):
         await application.bot.send_message(chat_id=chat_id, text=text)
     
     scheduler.set_callback(actual_callback)
+    # Reminders due in the same tick go out as one paced batch (RetryAfter is retried)
+    scheduler.set_dispatcher(MessageDispatcher(application.bot, global_rate=REMINDER_SEND_RATE))
     
     start_handler = CommandHandler('start', start)
     msg_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message)
@@ -641,5 +784,18 @@ if __name__ == '__main__':
     application.add_handler(start_handler)
     application.add_handler(msg_handler)
     
-    print("Bot is running...")
-    application.run_polling()
+    if WORKER_INDEX is not None:
+        import workers
+        print(f"Worker {WORKER_INDEX} is running on port {WORKER_PORT}...")
+        asyncio.run(workers.run_worker(application, update_processor, WORKER_PORT, WEBHOOK_PATH,
+                                       WORKER_SECRET, max_pending=WEBHOOK_MAX_PENDING))
+        exit(0)
+
+    print(f"Bot is running ({UPDATE_MODE})...")
+    if UPDATE_MODE == "webhook":
+        import webhook
+        asyncio.run(webhook.run(application, update_processor, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                                webhook_url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET,
+                                max_connections=WEBHOOK_MAX_CONNECTIONS, max_pending=WEBHOOK_MAX_PENDING))
+    else:
+        application.run_polling()
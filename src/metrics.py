@@ -0,0 +1,260 @@
+"""
+In-process metrics in the Prometheus text format, plus optional per-update traces.
+
+Metrics are always collected (an observation is a few dict operations); they are only
+exposed when METRICS_PORT is set, on http://127.0.0.1:<port>/metrics (see start_server).
+
+Traces: main.py opens one trace per update (trace()), and database calls, Gemini calls
+and other span() blocks inside it are recorded with their offset and duration. With
+tracing configured, each finished trace slower than trace_min_ms is logged as one line:
+
+    Trace update 42 chat=123 intent=schedule_reminder 1532 ms: llm.combined+12 1480 ms, db.add_task_if_absent+1495 2.1 ms, ...
+"""
+import re
+import time
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+LATENESS_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+TRACE_MAX_SPANS = 200  # Spans kept per trace (a briefing touches every user)
+
+_registry = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        # Updates can come from worker threads (asyncio.to_thread), as in cache.LRUCache
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self.values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [count per bucket (+Inf last), sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bucket] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self.values.get(tuple(labels.get(name, "") for name in self.labels))
+            return entry[2] if entry else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            # Copy so a scrape sees each series consistently while observations continue
+            values = sorted((key, list(counts), total, count) for key, (counts, total, count) in self.values.items())
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+class Gauge:
+    """Value read from `read()` at scrape time, e.g. a queue depth."""
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        _registry.append(self)
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.debug(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time to handle one update, by intent", ["intent"])
+LLM_SECONDS = Histogram("bot_llm_call_seconds", "Gemini call latency by prompt kind and call mode", ["kind", "mode"])
+LLM_TOKENS = Counter("bot_llm_tokens_total", "Gemini tokens by prompt kind and direction", ["kind", "direction"])
+LLM_ERRORS = Counter("bot_llm_errors_total", "Failed Gemini calls by prompt kind and error type", ["kind", "error"])
+DB_SECONDS = Histogram("bot_db_call_seconds", "Time spent in each database.py function", ["function"], DB_BUCKETS)
+REMINDER_LATENESS = Histogram("bot_reminder_lateness_seconds", "Reminder sent time minus scheduled time",
+                              buckets=LATENESS_BUCKETS)
+REMINDERS = Counter("bot_reminders_total", "Reminder deliveries by result", ["result"])
+BRIEFING_SECONDS = Histogram("bot_briefing_seconds", "Daily briefing run duration", buckets=LATENCY_BUCKETS + (60, 120, 300))
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# --- Traces ---
+
+TRACE_ENABLED = False
+TRACE_MIN_MS = 0.0
+
+_current = contextvars.ContextVar("metrics_trace", default=None)
+
+class Trace:
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.started = time.perf_counter()
+        self.spans = []  # (name, offset, duration) in seconds
+        self.dropped = 0
+
+    def add_span(self, name, start, duration):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append((name, start - self.started, duration))
+        else:
+            self.dropped += 1
+
+    def format(self, duration):
+        attrs = " ".join(f"{key}={value}" for key, value in self.attrs.items())
+        spans = ", ".join(f"{name}+{offset * 1000:.0f} {took * 1000:.1f} ms" for name, offset, took in self.spans)
+        more = f" (+{self.dropped} more)" if self.dropped else ""
+        return f"Trace {self.name} {attrs} {duration * 1000:.0f} ms: {spans or 'no spans'}{more}"
+
+def configure(trace=None, trace_min_ms=None):
+    """trace: log finished traces; trace_min_ms: only those at least this slow."""
+    global TRACE_ENABLED, TRACE_MIN_MS
+    if trace is not None:
+        TRACE_ENABLED = bool(trace)
+    if trace_min_ms:
+        TRACE_MIN_MS = float(trace_min_ms)
+
+@contextmanager
+def trace(name, **attrs):
+    """Opens a trace for the current task (and everything it awaits). Yields the Trace."""
+    current = Trace(name, attrs)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - current.started
+        if TRACE_ENABLED and duration * 1000 >= TRACE_MIN_MS:
+            logger.info(current.format(duration))
+
+def annotate(**attrs):
+    """Adds attributes (e.g. intent=...) to the current trace, if any."""
+    current = _current.get()
+    if current is not None:
+        current.attrs.update(attrs)
+    return current
+
+def current_trace():
+    return _current.get()
+
+def record_span(name, start, duration):
+    current = _current.get()
+    if current is not None and TRACE_ENABLED:
+        current.add_span(name, start, duration)
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, start, time.perf_counter() - start)
+
+# Set while a timed_function runs, so nested timed calls are not counted twice
+_in_timed = contextvars.ContextVar("metrics_in_timed", default=False)
+
+def timed_function(func, histogram, span_prefix):
+    """
+    Wraps a plain function: its duration goes to histogram{function=<name>} and the current trace.
+    Only the outermost call is timed: get_agenda calling get_all_schedules counts as get_agenda.
+    """
+    name = func.__name__
+    span_name = f"{span_prefix}.{name}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _in_timed.get():
+            return func(*args, **kwargs)
+        token = _in_timed.set(True)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            _in_timed.reset(token)
+            histogram.observe(duration, function=name)
+            record_span(span_name, start, duration)
+    return wrapper
+
+# --- HTTP endpoint ---
+
+_REQUEST_LINE = re.compile(rb"^(\w+) (\S+)")
+
+async def _serve(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), timeout=10)
+        while (await asyncio.wait_for(reader.readline(), timeout=10)) not in (b"\r\n", b"\n", b""):
+            pass
+        m = _REQUEST_LINE.match(request)
+        if m and m.group(1) == b"GET" and m.group(2).split(b"?")[0] in (b"/metrics", b"/"):
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_server(port, host="127.0.0.1"):
+    """Serves /metrics on host:port from the running event loop. Returns the asyncio server."""
+    server = await asyncio.start_server(_serve, host, int(port))
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return server
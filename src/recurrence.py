@@ -0,0 +1,105 @@
+"""
+Weekday bitmasks and minutes of the day for recurring schedules, and expansion of
+many schedules over a date range.
+
+recurring_schedules keeps the text the user gave (frequency 'mon,wed', time '8:05')
+next to days_mask (bit 0 = Monday) and minute_of_day (8:05 -> 485), which are filled on
+insert and by migration v11. Matching a day is then one bit test, and sorting by time
+is an integer compare.
+
+expand() returns every (day, schedule) occurrence in one pass. With NumPy installed and
+a large input (the morning briefing over every user's schedules) it builds the day x
+schedule match matrix with array operations. Otherwise it runs a plain loop, which
+is faster for one user's week. NumPy is optional; both give the same result.
+"""
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DAY_CODES = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+NO_TIME = 24 * 60           # Sort key for times that do not parse (listed last)
+NUMPY_MIN_CELLS = 2048      # days x schedules below which the plain loop is faster
+_NO_END = date.max.toordinal()
+
+def days_to_mask(days_of_week):
+    """'mon,wed,fri' or 'mon-fri' -> weekday bitmask (bit 0 = Monday)."""
+    mask = 0
+    for part in days_of_week.replace(" ", "").lower().split(","):
+        if "-" in part:
+            first, last = part.split("-", 1)
+            if first in DAY_CODES and last in DAY_CODES:
+                for i in range(DAY_CODES.index(first), DAY_CODES.index(last) + 1):
+                    mask |= 1 << i
+        elif part in DAY_CODES:
+            mask |= 1 << DAY_CODES.index(part)
+    return mask
+
+def mask_to_weekdays(mask):
+    """0b0000101 -> [0, 2] (Monday, Wednesday)."""
+    return [day for day in range(7) if mask >> day & 1]
+
+def parse_minute_of_day(time_value):
+    """'08:05', '8:5' or '08:05:00' -> 485; None when it is not a valid time."""
+    try:
+        hour, minute = (int(part) for part in str(time_value).split(":")[:2])
+    except ValueError:
+        return None
+    return hour * 60 + minute if 0 <= hour < 24 and 0 <= minute < 60 else None
+
+def format_minute_of_day(minute_of_day):
+    """485 -> '08:05'"""
+    return f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+
+def end_ordinal(end_date):
+    """end_date ('2026-12-31' or an ISO datetime) -> date ordinal; None when unset or unparsable."""
+    if not end_date:
+        return None
+    try:
+        return date.fromisoformat(str(end_date)[:10]).toordinal()
+    except ValueError:
+        return None
+
+def expand(start, days, masks, minutes, end_ordinals):
+    """
+    Occurrences of recurring schedules on the `days` dates from `start` (a date).
+    masks, minutes, end_ordinals: one value per schedule (days_mask, minute_of_day or
+    None, end_ordinal() or None).
+    Returns one list per day with the indexes of the schedules falling on it, sorted
+    by time; schedules at the same time keep their input order.
+    """
+    if days <= 0:
+        return []
+    if np is not None and days * len(masks) >= NUMPY_MIN_CELLS:
+        return _expand_arrays(start, days, masks, minutes, end_ordinals)
+    first = start.toordinal()
+    weekday = start.weekday()
+    keys = [NO_TIME if minute is None else minute for minute in minutes]
+    by_day = []
+    for offset in range(days):
+        bit = 1 << (weekday + offset) % 7
+        ordinal = first + offset
+        hits = [i for i, mask in enumerate(masks)
+                if mask & bit and (end_ordinals[i] is None or end_ordinals[i] >= ordinal)]
+        hits.sort(key=keys.__getitem__)
+        by_day.append(hits)
+    return by_day
+
+def _expand_arrays(start, days, masks, minutes, end_ordinals):
+    offsets = np.arange(days)
+    bits = np.left_shift(1, (start.weekday() + offsets) % 7)
+    ordinals = start.toordinal() + offsets
+    mask = np.fromiter((m or 0 for m in masks), dtype=np.int64, count=len(masks))
+    keys = np.fromiter((NO_TIME if m is None else m for m in minutes), dtype=np.int64, count=len(minutes))
+    ends = np.fromiter((_NO_END if e is None else e for e in end_ordinals), dtype=np.int64, count=len(end_ordinals))
+
+    # days x schedules: falls on that weekday and not past its end date
+    hit = (mask[None, :] & bits[:, None]).astype(bool) & (ends[None, :] >= ordinals[:, None])
+    day_index, schedule_index = np.nonzero(hit)
+    # nonzero() is row-major, so a stable sort on (day, time) keeps input order for ties
+    order = np.lexsort((keys[schedule_index], day_index))
+    day_index, schedule_index = day_index[order], schedule_index[order].tolist()
+    bounds = np.searchsorted(day_index, np.arange(days + 1)).tolist()
+    return [schedule_index[bounds[d]:bounds[d + 1]] for d in range(days)]
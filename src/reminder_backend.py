@@ -0,0 +1,505 @@
+"""
+Reminder backends used by SchedulerManager instead of APScheduler's SQLAlchemyJobStore.
+
+TableReminderBackend ("tables") has no reminder storage of its own: due occurrences are
+read from tasks / recurring_schedules (reminder_message, remind_before_minutes,
+end_date) a few minutes ahead, so the schedule rows are the only copy of the data.
+
+LightReminderBackend ("light") keeps every reminder as one small row in its own
+`reminders` table: chat, the schedule row it belongs to, the next fire time as a Unix
+timestamp and, for recurring reminders, a weekday bitmask + minute of the day.
+Nothing is pickled.
+
+Only the next REMINDER_WINDOW due reminders are held in memory, in a heap of
+(next_fire, id). All rows with next_fire <= `_horizon` are in the heap; when the heap
+runs dry the next window is read from the next_fire index. A recurring reminder gets
+its next fire time computed when it fires, so startup cost does not depend on how
+many reminders exist.
+
+Both hand every tick's due reminders to ReminderTimer._deliver as one batch: each
+occurrence is claimed in reminder_deliveries (so it is sent once, even across
+restarts or overlapping ticks) and sent through a rate-limited MessageDispatcher.
+"""
+import asyncio
+import heapq
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, date, timedelta
+from zoneinfo import ZoneInfo
+
+import database
+import metrics
+from dispatcher import DispatchStats
+from recurrence import DAY_CODES, days_to_mask
+from text_utils import early_reminder_text
+
+logger = logging.getLogger(__name__)
+
+REMINDER_WINDOW = 1000          # Reminders materialised in memory at once
+MISFIRE_GRACE_SECONDS = 60      # Reminders later than this are skipped (same as the APScheduler jobs)
+MAX_SLEEP_SECONDS = 60          # Re-check at least this often (clock changes, other writers)
+REMINDER_LOOKAHEAD_SECONDS = 300  # TableReminderBackend: occurrences loaded ahead of time
+DELIVERY_LOG_DAYS = 7           # Days of reminder_deliveries rows kept
+LATENCY_SAMPLES = 10000         # Recent lateness values kept for percentiles
+RESEND_PENDING_SECONDS = 3600   # Unfinished deliveries older than this are not resent after a restart
+
+def end_of_day(end_date, tz):
+    """'2026-12-31' (or an ISO datetime) -> timestamp of 23:59:59 that day; None stays None."""
+    if not end_date:
+        return None
+    day = date.fromisoformat(str(end_date)[:10])
+    return int(datetime(day.year, day.month, day.day, 23, 59, 59, tzinfo=tz).timestamp())
+
+def next_occurrence(after, days_mask, minute_of_day, tz, end_fire=None):
+    """First fire time strictly after timestamp `after`, or None when past end_fire / no days set."""
+    day = datetime.fromtimestamp(after, tz).date()
+    for offset in range(8):
+        d = day + timedelta(days=offset)
+        if not days_mask >> d.weekday() & 1:
+            continue
+        fire = int(datetime(d.year, d.month, d.day, minute_of_day // 60, minute_of_day % 60, tzinfo=tz).timestamp())
+        if fire > after:
+            return fire if end_fire is None or fire <= end_fire else None
+    return None
+
+class DeliveryStats:
+    """Reminder delivery counters and lateness (send time - due time) percentiles."""
+    def __init__(self):
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.lateness = deque(maxlen=LATENCY_SAMPLES)
+
+    def percentile(self, p):
+        if not self.lateness:
+            return 0.0
+        values = sorted(self.lateness)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def summary(self):
+        return (f"batches={self.batches} sent={self.sent} failed={self.failed} duplicates={self.duplicates} "
+                f"lateness p50={self.percentile(0.5):.1f}s p95={self.percentile(0.95):.1f}s "
+                f"max={max(self.lateness, default=0.0):.1f}s")
+
+class ReminderTimer:
+    """
+    Timer loop shared by the backends: sleeps until next_fire(), then delivers what
+    pop_due() returns as one batch.
+    dispatcher: MessageDispatcher used for batches (paced, retries RetryAfter)
+    callback: async (chat_id, text), used per reminder when no dispatcher is set
+    """
+    def __init__(self, tz=None, grace=MISFIRE_GRACE_SECONDS):
+        self.tz = tz or ZoneInfo("Asia/Ho_Chi_Minh")
+        self.grace = grace
+        self.callback = None
+        self.dispatcher = None
+        self.stats = DeliveryStats()
+        self._wakeup = None
+        self._task = None
+        self._deliveries = set()
+        self._pruned_at = 0
+        self.fired = 0
+        self.misfired = 0
+
+    def next_fire(self):
+        raise NotImplementedError
+
+    def pop_due(self, now=None):
+        raise NotImplementedError
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def refresh(self):
+        """Forgets what was read from the database (it was changed by another process)."""
+        self._wake()
+
+    def _finish(self, message, delivered):
+        chat_id, text, fire, key = message
+        sent_at = time.time()
+        if delivered:
+            self.stats.sent += 1
+            self.stats.lateness.append(sent_at - fire)
+            metrics.REMINDER_LATENESS.observe(sent_at - fire)
+        else:
+            self.stats.failed += 1
+        metrics.REMINDERS.inc(result="sent" if delivered else "failed")
+        try:
+            database.finish_reminder_delivery(key, "sent" if delivered else "failed", sent_at, sent_at - fire)
+        except Exception as e:
+            logger.error(f"Could not record reminder delivery {key}: {e}")
+
+    async def _send(self, message):
+        try:
+            await self.callback(message[0], message[1])
+            self._finish(message, True)
+        except Exception as e:
+            logger.error(f"Reminder to {message[0]} failed: {e}")
+            self._finish(message, False)
+
+    def _claim(self, messages):
+        """Keeps only the reminders nobody has claimed yet (see database.claim_reminder_deliveries)."""
+        claimed = set(database.claim_reminder_deliveries([(key, chat_id, fire, text) for chat_id, text, fire, key in messages]))
+        self.stats.duplicates += len(messages) - len(claimed)
+        if len(messages) > len(claimed):
+            metrics.REMINDERS.inc(len(messages) - len(claimed), result="duplicate")
+        return [message for message in messages if message[3] in claimed]
+
+    async def _deliver(self, messages):
+        """messages: [(chat_id, text, fire_time, key)] already claimed, sent as one paced batch."""
+        if not messages:
+            return
+        self.stats.batches += 1
+        started = time.monotonic()
+        if self.dispatcher is not None:
+            dispatch = await self.dispatcher.send_all(messages, on_sent=self._finish)
+        else:
+            dispatch = DispatchStats()
+            await asyncio.gather(*(self._send(message) for message in messages))
+        worst = max(time.time() - fire for _, _, fire, _ in messages)
+        logger.info(f"Reminders: batch of {len(messages)} done in {time.monotonic() - started:.1f}s "
+                    f"(latest {worst:.1f}s after due, retries={dispatch.retries} rate_limited={dispatch.rate_limited})")
+
+    def _start_delivery(self, messages):
+        task = asyncio.create_task(self._deliver(messages))
+        # Keep a reference so the batch is not garbage-collected mid-send
+        self._deliveries.add(task)
+        task.add_done_callback(self._deliveries.discard)
+
+    def _maintain_delivery_log(self):
+        now = time.time()
+        if now - self._pruned_at > 3600:
+            self._pruned_at = now
+            database.prune_reminder_deliveries(int(now) - DELIVERY_LOG_DAYS * 86400)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                fire = self.next_fire()
+                delay = MAX_SLEEP_SECONDS if fire is None else min(fire - time.time(), MAX_SLEEP_SECONDS)
+                # Claimed in the same step as the pop, before anything can interleave
+                messages = self._claim(self.pop_due()) if delay <= 0 else []
+                self._maintain_delivery_log()
+            except Exception as e:
+                logger.error(f"Reminder backend error: {e}")
+                delay, messages = 1, []
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if messages:
+                self._start_delivery(messages)
+
+    def start(self):
+        """Starts the timer task; must be called from the running event loop."""
+        self._wakeup = asyncio.Event()
+        # After a shutdown() another process may have fired reminders in the meantime
+        self.refresh()
+        fire = self.next_fire()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        # Claimed by a previous run that stopped before finishing the send
+        pending = []
+        for key, chat_id, fire_time, text in database.get_pending_reminder_deliveries():
+            if time.time() - fire_time <= RESEND_PENDING_SECONDS:
+                pending.append((chat_id, text, fire_time, key))
+            else:
+                database.finish_reminder_delivery(key, "failed", None, None)
+        if pending:
+            logger.info(f"Resending {len(pending)} reminders left pending by the previous run")
+            self._start_delivery(pending)
+        first = datetime.fromtimestamp(fire, self.tz).isoformat() if fire else "none"
+        logger.info(f"{type(self).__name__} started, next reminder at {first}")
+
+    def shutdown(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._deliveries):
+            task.cancel()
+
+class LightReminderBackend(ReminderTimer):
+    """Reminder store + timer used by SchedulerManager(reminder_backend="light")."""
+    def __init__(self, tz=None, window=REMINDER_WINDOW, grace=MISFIRE_GRACE_SECONDS):
+        super().__init__(tz, grace)
+        self.window = window
+        self._heap = []
+        self._loaded = {}           # id -> next_fire of every reminder in the heap
+        self._horizon = -1          # Everything with next_fire <= horizon is loaded
+
+    # --- Scheduling ---
+
+    def add_once(self, chat_id, text, run_date, kind="task", schedule_id=None, slot="main"):
+        """run_date: datetime; naive values are in the backend's timezone."""
+        if run_date.tzinfo is None:
+            run_date = run_date.replace(tzinfo=self.tz)
+        fire = math.ceil(run_date.timestamp())  # Never fire early
+        reminder_id = database.save_reminder(chat_id, kind, schedule_id, slot, text, fire)
+        self._track(reminder_id, fire)
+        return reminder_id
+
+    def add_recurring(self, chat_id, text, hour, minute, days_of_week, end_date=None,
+                      kind="recurring", schedule_id=None, slot="main"):
+        """Returns the row id, or None when the schedule has no future occurrence."""
+        days_mask = days_to_mask(days_of_week)
+        minute_of_day = int(hour) * 60 + int(minute)
+        end_fire = end_of_day(end_date, self.tz)
+        fire = next_occurrence(int(time.time()), days_mask, minute_of_day, self.tz, end_fire)
+        if fire is None:
+            return None
+        reminder_id = database.save_reminder(chat_id, kind, schedule_id, slot, text, fire,
+                                             days_mask, minute_of_day, end_fire)
+        self._track(reminder_id, fire)
+        return reminder_id
+
+    def _track(self, reminder_id, fire):
+        # Rows beyond the horizon are picked up by a later refill
+        if fire <= self._horizon and self._loaded.get(reminder_id) != fire:
+            self._loaded[reminder_id] = fire
+            heapq.heappush(self._heap, (fire, reminder_id))
+            if self._heap[0][1] == reminder_id:
+                self._wake()
+
+    def remove(self, chat_id, kind=None, schedule_id=None):
+        """Removes a chat's reminders (all of them, or one schedule row's). Returns the number removed."""
+        return self._forget(database.delete_reminders(chat_id, kind, schedule_id))
+
+    def remove_matching(self, chat_id, keyword):
+        return self._forget(database.delete_reminders_matching(chat_id, keyword))
+
+    def refresh(self):
+        self._heap = []
+        self._loaded = {}
+        self._horizon = -1
+        self._wake()
+
+    def _forget(self, ids):
+        # Heap entries stay until popped; without a _loaded entry they are skipped
+        for reminder_id in ids:
+            self._loaded.pop(reminder_id, None)
+        return len(ids)
+
+    def count(self):
+        return database.count_reminders()
+
+    # --- Firing ---
+
+    def _refill(self):
+        rows = database.get_reminder_slots_after(self._horizon, self.window)
+        for reminder_id, fire in rows:
+            if self._loaded.get(reminder_id) != fire:
+                self._loaded[reminder_id] = fire
+                self._heap.append((fire, reminder_id))
+        heapq.heapify(self._heap)
+        self._horizon = rows[-1][1] if len(rows) >= self.window else float("inf")
+
+    def next_fire(self):
+        """Timestamp of the earliest pending reminder, or None."""
+        while True:
+            while self._heap and self._loaded.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)   # Removed or rescheduled since it was pushed
+            if self._heap or self._horizon == float("inf"):
+                return self._heap[0][0] if self._heap else None
+            self._refill()
+
+    def pop_due(self, now=None):
+        """
+        Takes every reminder due at `now` out of the store: one-off rows are deleted,
+        recurring rows move to their next occurrence. Returns [(chat_id, text, fire_time, key)]
+        for the reminders to send; reminders more than `grace` seconds late are dropped.
+        """
+        now = int(now if now is not None else time.time())
+        due = []
+        while True:
+            fire = self.next_fire()
+            if fire is None or fire > now:
+                break
+            _, reminder_id = heapq.heappop(self._heap)
+            del self._loaded[reminder_id]
+            due.append(reminder_id)
+        if not due:
+            return []
+
+        messages = []
+        reschedule = []
+        finished = []
+        # In fire order, like TableReminderBackend (a chat's reminders are paced in this order)
+        rows = sorted(database.get_reminders(due), key=lambda row: (row[5], row[0]))
+        for reminder_id, chat_id, kind, schedule_id, slot, fire, days_mask, minute_of_day, end_fire, text in rows:
+            if now - fire > self.grace:
+                self.misfired += 1
+                metrics.REMINDERS.inc(result="missed")
+            else:
+                key = f"{kind}:{schedule_id}:{slot}:{fire}" if schedule_id is not None else f"reminder:{reminder_id}:{fire}"
+                messages.append((chat_id, text, fire, key))
+            if days_mask:
+                following = next_occurrence(max(fire, now), days_mask, minute_of_day, self.tz, end_fire)
+                if following is not None:
+                    reschedule.append((following, reminder_id))
+                    continue
+            finished.append(reminder_id)
+        database.finish_fired_reminders(reschedule, finished)
+        for following, reminder_id in reschedule:
+            self._track(reminder_id, following)
+        self.fired += len(messages)
+        return messages
+
+class TableReminderBackend(ReminderTimer):
+    """
+    Reminders derived from the schedule tables, used by SchedulerManager(reminder_backend="tables").
+    Occurrences firing in the next `lookahead` seconds are loaded into a heap. A new
+    schedule only triggers a reload when it fires inside the loaded window; removed
+    schedules are skipped until the next reload. Everything up to the persisted
+    cursor (scheduler_state 'reminders_done_until') has been handled, so a restart
+    neither repeats reminders nor, within the grace time, loses them.
+    """
+    CURSOR = "reminders_done_until"
+
+    def __init__(self, tz=None, lookahead=REMINDER_LOOKAHEAD_SECONDS, grace=MISFIRE_GRACE_SECONDS):
+        super().__init__(tz, grace)
+        self.lookahead = lookahead
+        self._heap = []
+        self._cursor = None         # Occurrences with fire <= cursor are done
+        self._loaded_until = None   # Occurrences in (cursor, loaded_until] are in the heap
+        self._removed = set()       # (kind, schedule_id) or ("chat", chat_id) deleted since the last load
+
+    # The schedule rows are written by database.py; these only keep the loaded window current.
+
+    def _changed_at(self, fire):
+        if self._loaded_until is not None and fire <= self._loaded_until:
+            self.refresh()
+
+    def add_once(self, chat_id, text, run_date, kind="task", schedule_id=None, slot="main"):
+        if run_date.tzinfo is None:
+            run_date = run_date.replace(tzinfo=self.tz)
+        self._changed_at(run_date.timestamp())
+
+    def add_recurring(self, chat_id, text, hour, minute, days_of_week, end_date=None,
+                      kind="recurring", schedule_id=None, slot="main"):
+        fire = next_occurrence(int(time.time()), days_to_mask(days_of_week), int(hour) * 60 + int(minute), self.tz)
+        if fire is not None:
+            self._changed_at(fire)
+
+    def remove(self, chat_id, kind=None, schedule_id=None):
+        """
+        Call after deleting the schedule row(s). Returns the number of schedules whose reminders
+        were dropped: 1 for one row, or the chat's schedules in the loaded window.
+        """
+        if kind is not None:
+            self._removed.add((kind, schedule_id))
+            return 1
+        self._removed.add(("chat", chat_id))
+        return len({(entry[1], entry[2]) for entry in self._heap if entry[4] == chat_id})
+
+    def _is_removed(self, entry):
+        _, kind, schedule_id, _, chat_id, _ = entry
+        return (kind, schedule_id) in self._removed or ("chat", chat_id) in self._removed
+
+    def remove_matching(self, chat_id, keyword):
+        return 0  # Only APScheduler has reminders without a schedule row
+
+    def refresh(self):
+        """Reloads the cursor and the upcoming occurrences from the database."""
+        self._cursor = None
+        self._loaded_until = None
+        self._wake()
+
+    def occurrences(self, start, end):
+        """[(fire, kind, schedule_id, slot, chat_id, text)] for reminders firing in (start, end]."""
+        found = []
+        start_local = datetime.fromtimestamp(start, self.tz).replace(tzinfo=None)
+        end_local = datetime.fromtimestamp(end, self.tz).replace(tzinfo=None)
+        for slot, schedule_id, chat_id, description, schedule_time, before, message in \
+                database.get_task_reminders_between(start_local.isoformat(), end_local.isoformat()):
+            fire = datetime.fromisoformat(schedule_time)
+            if slot == "early":
+                fire -= timedelta(minutes=before)
+                message = early_reminder_text(description, before)
+            found.append((math.ceil(fire.replace(tzinfo=self.tz).timestamp()), "task", schedule_id, slot, chat_id, message))
+
+        # Recurring rows match on minute of the day, one query pair per local day in the range
+        day = start_local.date()
+        while day <= end_local.date():
+            midnight = datetime(day.year, day.month, day.day, tzinfo=self.tz).timestamp()
+            first = max(0, math.floor((start - midnight) / 60) + 1)
+            last = min(24 * 60 - 1, math.floor((end - midnight) / 60))
+            if first <= last:
+                rows = database.get_recurring_reminders_between(first, last)
+                found += self._recurring_occurrences(day, rows)
+            day += timedelta(days=1)
+        return found
+
+    def _recurring_occurrences(self, day, rows):
+        found = []
+        midnight = datetime(day.year, day.month, day.day, tzinfo=self.tz)
+        for slot, schedule_id, chat_id, description, minute_of_day, before, message, days_mask, end_date in rows:
+            if minute_of_day is None:
+                continue
+            if slot == "early":
+                # remind_minute is on `day`; the schedule itself can fall on a later day (00:05 - 10 min)
+                reminder_at = midnight + timedelta(minutes=(minute_of_day - before) % (24 * 60))
+                event = reminder_at + timedelta(minutes=before)
+                message = early_reminder_text(description, before)
+            else:
+                reminder_at = event = midnight + timedelta(minutes=minute_of_day)
+            if not (days_mask or 0) >> event.weekday() & 1:
+                continue
+            if end_date and event.date().isoformat() > str(end_date)[:10]:
+                continue
+            found.append((int(reminder_at.timestamp()), "recurring", schedule_id, slot, chat_id, message))
+        return found
+
+    def _ensure_loaded(self, until):
+        if self._cursor is None:
+            stored = database.get_scheduler_state(self.CURSOR)
+            # After a long downtime only reminders still inside the grace time are sent
+            self._cursor = max(int(stored) if stored else 0, int(time.time()) - self.grace)
+        if self._loaded_until is None:
+            self._heap = []
+            self._removed.clear()
+            self._loaded_until = self._cursor
+        if self._loaded_until < until:
+            if self._removed:
+                # Occurrences read from now on come from the current rows: a tombstone
+                # must not hide a schedule the chat adds after the removal
+                self._heap = [entry for entry in self._heap if not self._is_removed(entry)]
+                heapq.heapify(self._heap)
+                self._removed.clear()
+            end = max(until, self._loaded_until + self.lookahead)
+            for occurrence in self.occurrences(self._loaded_until, end):
+                heapq.heappush(self._heap, occurrence)
+            self._loaded_until = end
+
+    def next_fire(self):
+        self._ensure_loaded(int(time.time()) + MAX_SLEEP_SECONDS)
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now=None):
+        """
+        Returns [(chat_id, text, fire_time, key)] for occurrences due at `now` and moves the
+        cursor to `now`; reminders more than `grace` seconds late are dropped.
+        """
+        now = int(now if now is not None else time.time())
+        self._ensure_loaded(now)
+        messages = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_removed(entry):
+                continue
+            fire, kind, schedule_id, slot, chat_id, text = entry
+            if now - fire > self.grace:
+                self.misfired += 1
+                metrics.REMINDERS.inc(result="missed")
+            else:
+                messages.append((chat_id, text, fire, f"{kind}:{schedule_id}:{slot}:{fire}"))
+        if now > self._cursor:
+            self._cursor = now
+            database.set_scheduler_state(self.CURSOR, now)
+        self.fired += len(messages)
+        return messages
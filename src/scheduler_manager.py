@@ -1,37 +1,242 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.jobstores.base import JobLookupError
+from apscheduler.events import EVENT_JOB_REMOVED
 from datetime import datetime, timedelta
+import asyncio
 import logging
 
 import os
 
 from zoneinfo import ZoneInfo
 
+import database
+from reminder_backend import LightReminderBackend, TableReminderBackend
+
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CHANGES_STATE = "reminders_changed"  # scheduler_state counter bumped on every reminder change (shared=True)
+CHANGE_POLL_SECONDS = 2              # How often the leader checks it
+
+def make_job_id(chat_id, kind, schedule_id, slot="main"):
+    """
+    Deterministic job ID for a reminder, e.g. '123:recurring:7:early'.
+    kind: 'task' or 'recurring' (the table schedule_id refers to)
+    slot: 'main' (on time) or 'early' (remind_before_minutes)
+    """
+    return f"{chat_id}:{kind}:{schedule_id}:{slot}"
+
+def parse_job_id(job_id):
+    """Returns (chat_id, kind, schedule_id, slot) for IDs from make_job_id, else None."""
+    parts = job_id.split(":")
+    if len(parts) != 4:
+        return None
+    try:
+        return int(parts[0]), parts[1], int(parts[2]), parts[3]
+    except ValueError:
+        return None
+
 class SchedulerManager:
-    def __init__(self, db_url=None):
+    """
+    reminder_backend: "apscheduler" stores every reminder as a pickled job in the
+    SQLAlchemy job store; "light" keeps reminders as compact rows served by
+    LightReminderBackend; "tables" derives them from tasks / recurring_schedules
+    (TableReminderBackend), so add_reminder / add_recurring_reminder only need the
+    schedule row to be written first and the text/time arguments are not stored.
+    System jobs (briefing, compaction) always use APScheduler, and jobs already in the
+    APScheduler store keep firing and can still be removed.
+    The SQLAlchemy job store is only created in start() / start_async(); system jobs
+    added before that wait in APScheduler's pending list and removals are replayed once
+    the store is loaded.
+    shared: several processes use the same database (WORKERS > 1). Each one starts
+    paused, and only the one given lead() fires anything; every reminder change bumps a
+    counter in scheduler_state that the leader polls, so changes made by the other
+    processes reach its reminder window and job store.
+    """
+    def __init__(self, db_url=None, reminder_backend="apscheduler", shared=False):
         if db_url is None:
             BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             db_path = os.path.join(BASE_DIR, "data", "bot_data.db")
             db_url = f'sqlite:///{db_path}'
-            
-        jobstores = {
-            'default': SQLAlchemyJobStore(url=db_url)
-        }
+        self.db_url = db_url
+        self.shared = shared
+
         # Explicitly set timezone
         tz = ZoneInfo("Asia/Ho_Chi_Minh")
-        self.scheduler = AsyncIOScheduler(jobstores=jobstores, timezone=tz)
+        self.scheduler = AsyncIOScheduler(timezone=tz)
+        backends = {"light": LightReminderBackend, "tables": TableReminderBackend}
+        self.reminders = backends[reminder_backend](tz) if reminder_backend in backends else None
+
+        # Per-chat job index: chat_id -> {job_id: text}. text is only kept for jobs
+        # without a deterministic ID (created before IDs were tied to schedule rows),
+        # so those can still be matched by description.
+        self._jobs_by_chat = {}
+        self._chat_of_job = {}
+        self.scheduler.add_listener(self._on_job_removed, EVENT_JOB_REMOVED)
+        self.ready = False
+        self._deferred_removals = []  # (chat_id, select) from before the job store was loaded
+        self._watcher = None
 
-    def start(self):
-        self.scheduler.start()
+    def create_jobstore(self):
+        """The SQLAlchemy job store for db_url; start() loads it. Importing SQLAlchemy is most of APScheduler's startup cost."""
+        from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+        return SQLAlchemyJobStore(url=self.db_url)
 
-    def add_reminder(self, chat_id, text, run_date):
+    def start(self, paused=False):
+        """paused: load the job store but fire nothing until lead() (shared mode)."""
+        if self.reminders is not None and not paused:
+            self.reminders.start()
+        self._start_scheduler(self.create_jobstore(), paused)
+
+    async def start_async(self, paused=False):
+        """
+        Like start(), but the reminder backend starts right away and SQLAlchemy is
+        imported in a thread, so it can run in the background while the bot polls.
+        With the "apscheduler" backend every reminder is a job, so the store is loaded first.
+        """
+        if self.reminders is None:
+            self.start(paused)
+            return
+        if not paused:
+            self.reminders.start()
+        self._start_scheduler(await asyncio.to_thread(self.create_jobstore), paused)
+
+    def lead(self):
+        """Starts firing reminders and system jobs after start(paused=True), e.g. once elected leader."""
+        seen = database.get_scheduler_state(CHANGES_STATE) if self.shared else None
+        if self.reminders is not None:
+            self.reminders.start()
+        self.scheduler.resume()
+        if self.shared:
+            self._watcher = asyncio.get_running_loop().create_task(self._watch_changes(seen))
+
+    def follow(self):
+        """Stops firing (another process leads); jobs can still be added and removed."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self.reminders is not None:
+            self.reminders.shutdown()
+        if self.scheduler.running:
+            self.scheduler.pause()
+
+    def _changed(self):
+        if self.shared:
+            try:
+                database.bump_scheduler_state(CHANGES_STATE)
+            except Exception as e:
+                logger.error(f"Could not announce reminder change: {e}")
+
+    async def _watch_changes(self, seen):
+        while True:
+            await asyncio.sleep(CHANGE_POLL_SECONDS)
+            try:
+                version = database.get_scheduler_state(CHANGES_STATE)
+            except Exception as e:
+                logger.error(f"Could not check for reminder changes: {e}")
+                continue
+            if version != seen:
+                seen = version
+                if self.reminders is not None:
+                    self.reminders.refresh()
+                # Jobs added by other processes may be due before the scheduler's next wakeup
+                self.scheduler.wakeup()
+
+    def _start_scheduler(self, jobstore, paused=False):
+        self.scheduler.add_jobstore(jobstore, 'default')
+        self.scheduler.start(paused=paused)
+        self._build_index()
+        self.ready = True
+        for chat_id, select in self._deferred_removals:
+            self._remove_jobs(chat_id, select)
+        self._deferred_removals.clear()
+
+    def _build_index(self):
+        """One full scan of the job store at startup; afterwards the index is kept up to date by events."""
+        for job in self.scheduler.get_jobs():
+            self._index_job(job.id, job.args)
+        logger.info(f"Indexed {len(self._chat_of_job)} reminder jobs for {len(self._jobs_by_chat)} chats")
+
+    def _index_job(self, job_id, args=None):
+        parsed = parse_job_id(job_id)
+        if parsed:
+            chat_id, text = parsed[0], None
+        elif args and len(args) >= 2:
+            chat_id, text = args[0], args[1]
+        else:
+            return  # System job (e.g. daily briefing)
+        self._jobs_by_chat.setdefault(chat_id, {})[job_id] = text
+        self._chat_of_job[job_id] = chat_id
+
+    def _unindex_job(self, job_id):
+        chat_id = self._chat_of_job.pop(job_id, None)
+        if chat_id is None:
+            return
+        jobs = self._jobs_by_chat.get(chat_id)
+        if jobs is not None:
+            jobs.pop(job_id, None)
+            if not jobs:
+                del self._jobs_by_chat[chat_id]
+
+    def _on_job_removed(self, event):
+        # Fired date jobs are removed by APScheduler itself
+        self._unindex_job(event.job_id)
+
+    def _remove_job_ids(self, job_ids):
+        removed = 0
+        for job_id in list(job_ids):
+            try:
+                self.scheduler.remove_job(job_id)
+                removed += 1
+            except JobLookupError:
+                pass  # Already fired or removed
+            self._unindex_job(job_id)
+        return removed
+
+    def _remove_jobs(self, chat_id, select):
+        """Removes the chat's APScheduler jobs for which select(job_id, text) is true."""
+        if not self.ready:
+            self._deferred_removals.append((chat_id, select))
+            return 0
+        jobs = self._jobs_by_chat.get(chat_id, {})
+        return self._remove_job_ids([job_id for job_id, text in jobs.items() if select(job_id, text)])
+
+    def remove_jobs_for(self, chat_id, schedule_id, kind="task"):
+        """Removes the reminders (on-time and early) of one tasks/recurring_schedules row. Returns the number removed."""
+        prefix = f"{chat_id}:{kind}:{schedule_id}:"
+        removed = self._remove_jobs(chat_id, lambda job_id, text: job_id.startswith(prefix))
+        if self.reminders is not None:
+            removed += self.reminders.remove(chat_id, kind, schedule_id)
+        self._changed()
+        return removed
+
+    def remove_all_for(self, chat_id):
+        """Removes every reminder of a chat. Returns the number removed."""
+        removed = self._remove_jobs(chat_id, lambda job_id, text: True)
+        if self.reminders is not None:
+            removed += self.reminders.remove(chat_id)
+        self._changed()
+        return removed
+
+    def remove_jobs_matching(self, chat_id, keyword):
+        """
+        Removes a chat's legacy reminders (no schedule ID) whose text contains keyword.
+        Returns the number removed.
+        """
+        keyword = keyword.lower()
+        removed = self._remove_jobs(chat_id, lambda job_id, text: text and keyword in text.lower())
+        if self.reminders is not None:
+            removed += self.reminders.remove_matching(chat_id, keyword)
+        if removed:
+            self._changed()
+        return removed
+
+    def add_reminder(self, chat_id, text, run_date, schedule_id=None, slot="main"):
         """
         Schedules a one-off reminder.
         run_date: datetime object
+        schedule_id: tasks.id this reminder belongs to (gives the job a deterministic ID)
         """
         # Calculate 15 minutes before if needed, but for now let's assume the logic 
         # for "15 mins before" is handled before calling this, or we handle it here.
@@ -40,35 +245,55 @@ class SchedulerManager:
         
         # We will assume the caller passes the ACTUAL time they want the notification.
         try:
-            self.scheduler.add_job(
+            if self.reminders is not None:
+                self.reminders.add_once(chat_id, text, run_date, schedule_id=schedule_id, slot=slot)
+                logger.info(f"Scheduled reminder for {chat_id} at {run_date}")
+                self._changed()
+                return True
+            job = self.scheduler.add_job(
                 self.send_message_callback, 
                 'date', 
                 run_date=run_date, 
                 args=[chat_id, text],
-                misfire_grace_time=60
+                misfire_grace_time=60,
+                id=make_job_id(chat_id, "task", schedule_id, slot) if schedule_id is not None else None,
+                replace_existing=schedule_id is not None
             )
+            self._index_job(job.id, job.args)
             logger.info(f"Scheduled reminder for {chat_id} at {run_date}")
+            self._changed()
             return True
         except Exception as e:
             logger.error(f"Error scheduling reminder: {e}")
             return False
 
-    def add_recurring_reminder(self, chat_id, text, hour, minute, days_of_week, end_date=None):
+    def add_recurring_reminder(self, chat_id, text, hour, minute, days_of_week, end_date=None, schedule_id=None, slot="main"):
         """
         Schedules a recurring reminder.
         days_of_week: string like 'mon,tue,wed,thu,fri'
+        schedule_id: recurring_schedules.id this reminder belongs to (gives the job a deterministic ID)
         """
         try:
-            self.scheduler.add_job(
+            if self.reminders is not None:
+                self.reminders.add_recurring(chat_id, text, hour, minute, days_of_week, end_date,
+                                             schedule_id=schedule_id, slot=slot)
+                logger.info(f"Scheduled recurring reminder for {chat_id} at {hour}:{minute} on {days_of_week}")
+                self._changed()
+                return True
+            job = self.scheduler.add_job(
                 self.send_message_callback, 
                 'cron', 
                 day_of_week=days_of_week,
                 hour=hour, 
                 minute=minute,
                 end_date=end_date,
-                args=[chat_id, text]
+                args=[chat_id, text],
+                id=make_job_id(chat_id, "recurring", schedule_id, slot) if schedule_id is not None else None,
+                replace_existing=schedule_id is not None
             )
+            self._index_job(job.id, job.args)
             logger.info(f"Scheduled recurring reminder for {chat_id} at {hour}:{minute} on {days_of_week}")
+            self._changed()
             return True
         except Exception as e:
             logger.error(f"Error scheduling recurring reminder: {e}")
@@ -83,17 +308,33 @@ class SchedulerManager:
 
     def set_callback(self, callback_func):
         self.send_message_callback = callback_func
+        if self.reminders is not None:
+            self.reminders.callback = callback_func
+
+    def set_dispatcher(self, dispatcher):
+        """Sends each tick's reminders as one paced batch through `dispatcher` (MessageDispatcher)."""
+        if self.reminders is not None:
+            self.reminders.dispatcher = dispatcher
+
+    def delivery_stats(self):
+        return self.reminders.stats if self.reminders is not None else None
 
     def get_jobs(self):
         return self.scheduler.get_jobs()
 
-    def add_daily_job(self, callback, hour, minute):
-        """Schedules a daily system job (e.g., briefing)."""
+    def add_daily_job(self, callback, hour, minute, job_id=None):
+        """
+        Schedules a daily system job (e.g., briefing).
+        job_id: stable ID so restarts replace the stored job instead of adding another copy.
+        callback must be a module-level function (the job store pickles a reference to it).
+        """
         self.scheduler.add_job(
             callback,
             'cron',
             hour=hour,
             minute=minute,
-            misfire_grace_time=60
+            misfire_grace_time=60,
+            id=job_id,
+            replace_existing=job_id is not None
         )
         logger.info(f"Scheduled daily job at {hour}:{minute}")
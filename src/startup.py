@@ -0,0 +1,46 @@
+"""
+Startup profiling.
+
+STARTUP_PROFILE=1 logs how long each startup phase took (imports, database, scheduler,
+background warm-up) once the bot is up. `python src/main.py --profile-startup` runs the
+same startup without connecting to Telegram, prints the report and exits, which is
+handy on slow devices (Termux). For per-module import times use
+`python -X importtime src/main.py --profile-startup`.
+"""
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+STARTED = time.perf_counter()
+PROFILE_ONLY = "--profile-startup" in sys.argv
+ENABLED = PROFILE_ONLY or os.getenv("STARTUP_PROFILE", "0").lower() in ("1", "true", "yes")
+
+_phases = []  # (name, start offset, duration) in seconds
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, start - STARTED, time.perf_counter() - start))
+
+def mark(name):
+    """Records a point in time (zero-length phase), e.g. 'polling'."""
+    _phases.append((name, time.perf_counter() - STARTED, 0.0))
+
+def report():
+    """Startup phases as text lines, in the order they started."""
+    lines = [f"{'phase':<34}{'at ms':>9}{'took ms':>10}"]
+    for name, offset, duration in sorted(_phases, key=lambda p: p[1]):
+        took = f"{duration * 1000:>10.1f}" if duration else f"{'-':>10}"
+        lines.append(f"{name:<34}{offset * 1000:>9.1f}{took}")
+    return lines
+
+def log_report():
+    if ENABLED:
+        logger.info("Startup profile:\n" + "\n".join(report()))
@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import time
+
+from telegram.constants import ChatAction, MessageLimit
+from telegram.error import RetryAfter, BadRequest, TelegramError
+
+from dispatcher import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# Edits count against the same flood limits as new messages (~1/s per chat),
+# so a growing reply is pushed at most once per EDIT_INTERVAL.
+EDIT_INTERVAL = 1.5        # Seconds between two edits of the same message
+MIN_EDIT_CHARS = 20        # Skip edits that would only add a few characters
+PENDING_SUFFIX = " …"      # Shown while the reply is still being generated
+
+async def send_typing(bot, chat_id):
+    """Shows 'typing...' in the chat. Best effort: failures are only logged."""
+    try:
+        await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+    except TelegramError as e:
+        logger.debug(f"Could not send typing action to {chat_id}: {e}")
+
+class StreamingReply:
+    """
+    Shows a reply while it is still being generated. The first text is sent as a new
+    message, later text replaces it through edit_message_text, throttled to one edit
+    every `edit_interval` seconds. finish() writes the final text.
+    """
+    def __init__(self, bot, chat_id, edit_interval=EDIT_INTERVAL, min_edit_chars=MIN_EDIT_CHARS):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.min_edit_chars = min_edit_chars
+        self.message = None
+        self.text = ""
+        self.shown = ""
+        self.edits = 0
+        self._next_edit = 0.0
+
+    @property
+    def started(self):
+        return self.message is not None
+
+    async def update(self, text):
+        """Called with the whole text generated so far."""
+        self.text = text
+        if not text.strip():
+            return
+        if self.message is None:
+            await self._send(text + PENDING_SUFFIX)
+        elif time.monotonic() >= self._next_edit and len(text) - len(self.shown) >= self.min_edit_chars:
+            await self._edit(text + PENDING_SUFFIX)
+
+    async def finish(self, text):
+        """Shows the complete reply (waiting for the next edit slot if needed) and returns it."""
+        first, rest = text[:MessageLimit.MAX_TEXT_LENGTH], text[MessageLimit.MAX_TEXT_LENGTH:]
+        if self.message is None:
+            await self._send(first)
+        else:
+            # The final edit must land, so wait out the throttle / RetryAfter instead of skipping
+            for _ in range(3):
+                if self.shown == first:
+                    break
+                delay = self._next_edit - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self._edit(first)
+        while rest:
+            await self.bot.send_message(chat_id=self.chat_id, text=rest[:MessageLimit.MAX_TEXT_LENGTH])
+            rest = rest[MessageLimit.MAX_TEXT_LENGTH:]
+        return text
+
+    async def _send(self, text):
+        text = text[:MessageLimit.MAX_TEXT_LENGTH]
+        self.message = await self.bot.send_message(chat_id=self.chat_id, text=text)
+        self.shown = text
+        self._next_edit = time.monotonic() + self.edit_interval
+
+    async def _edit(self, text):
+        text = text[:MessageLimit.MAX_TEXT_LENGTH]
+        try:
+            await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self.message.message_id, text=text)
+            self.shown = text
+            self.edits += 1
+            self._next_edit = time.monotonic() + self.edit_interval
+        except RetryAfter as e:
+            # Flood control: skip this edit, the next update/finish will catch up
+            self._next_edit = time.monotonic() + retry_after_seconds(e)
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                raise
+            self.shown = text
+
+async def stream_reply(bot, chat_id, chunks):
+    """
+    Consumes an async iterator of text chunks (e.g. stream_secretary_response_async),
+    shows the reply progressively in one message and returns the full text.
+    """
+    reply = StreamingReply(bot, chat_id)
+    text = ""
+    async for chunk in chunks:
+        text += chunk
+        await reply.update(text)
+    return await reply.finish(text.strip() or "Dạ anh, em chưa nghĩ ra câu trả lời, anh nói lại giúp em nhé.")
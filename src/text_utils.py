@@ -0,0 +1,32 @@
+import re
+import unicodedata
+
+_PUNCTUATION = re.compile(r"[^\w\s:/.,-]")
+_SPACES = re.compile(r"\s+")
+
+def fold_diacritics(text):
+    """'Học TOEIC đi' -> 'hoc toeic di'. Lowercases and strips Vietnamese accents (including đ)."""
+    text = text.lower().replace("đ", "d")
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+def normalize_text(text, lower=True):
+    """Lowercase, NFC, drop emoji/odd punctuation and collapse whitespace. Keeps accents."""
+    text = unicodedata.normalize("NFC", text)
+    if lower:
+        text = text.lower()
+    text = _PUNCTUATION.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+def format_description(text):
+    """Capitalizes the first letter of the description."""
+    if not text: return ""
+    # Remove "lịch" prefix if it exists to be concise
+    cleaned = text.strip()
+    if cleaned.lower().startswith("lịch "):
+        cleaned = cleaned[5:].strip()
+    return cleaned[0].upper() + cleaned[1:] if cleaned else ""
+
+def early_reminder_text(description, minutes):
+    """Message of the reminder sent `minutes` before a schedule."""
+    return f"⏰ Thưa anh, còn {minutes} phút nữa là đến giờ {format_description(description)} rồi ạ."
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+UPDATE_CONCURRENCY = 32        # Updates processed at the same time across all chats
+MAX_PENDING_UPDATES = 4096     # Updates admitted (running + waiting) before PTB holds new ones back
+QUEUE_WARN_DEPTH = 200         # Log a warning when this many updates are waiting
+
+def _chat_key(update):
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return ("user", user.id) if user is not None else None
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs updates from different chats in parallel and updates from the same chat one
+    after another, in arrival order. A chat waiting for its previous message does not
+    take one of the `max_concurrent_updates` slots, so a busy chat can't starve the others.
+    Install with ApplicationBuilder().concurrent_updates(ChatOrderedUpdateProcessor(...)).
+    """
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY, max_pending_updates=MAX_PENDING_UPDATES):
+        # The base class semaphore only bounds admitted updates; the real cap is self._slots
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.concurrency = max_concurrent_updates
+        self._slots = None
+        self._chats = {}  # chat key -> [asyncio.Lock, updates admitted for that chat]
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.max_waiting = 0
+
+    @property
+    def queue_depth(self):
+        """Updates admitted but not started yet (waiting for their chat or a free slot)."""
+        return self.waiting
+
+    def stats(self):
+        return {
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "running": self.running,
+            "active_chats": len(self._chats),
+            "processed": self.processed,
+            "concurrency": self.concurrency,
+        }
+
+    async def initialize(self):
+        self._slots = asyncio.Semaphore(self.concurrency)
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    async def do_process_update(self, update, coroutine):
+        if self._slots is None:
+            await self.initialize()
+        key = _chat_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chats.get(key)
+            if entry is None:
+                entry = self._chats[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        if self.waiting == QUEUE_WARN_DEPTH:
+            logger.warning(f"Update queue depth reached {self.waiting} ({len(self._chats)} chats, {self.running} running)")
+        started = False
+        try:
+            # asyncio.Lock wakes waiters first-in first-out, which keeps each chat in order
+            if entry is not None:
+                await entry[0].acquire()
+            try:
+                async with self._slots:
+                    self.waiting -= 1
+                    started = True
+                    self.running += 1
+                    try:
+                        await coroutine
+                    finally:
+                        self.running -= 1
+                        self.processed += 1
+            finally:
+                if entry is not None:
+                    entry[0].release()
+        finally:
+            if not started:
+                self.waiting -= 1
+                # The coroutine never ran (cancelled while waiting); close it to avoid a warning
+                if hasattr(coroutine, "close"):
+                    coroutine.close()
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._chats[key]
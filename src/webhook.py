@@ -0,0 +1,185 @@
+"""
+Webhook ingestion (UPDATE_MODE=webhook), an alternative to run_polling.
+
+A small asyncio HTTP server receives the updates Telegram POSTs to WEBHOOK_PATH, checks
+the X-Telegram-Bot-Api-Secret-Token header and hands each update straight to the update
+processor (per-chat order, UPDATE_CONCURRENCY) without going through getUpdates. At most
+`max_pending` updates are accepted but not finished; beyond that the server answers 503
+and Telegram retries the update later, so a burst cannot grow memory without bound.
+
+Local test without Telegram (WEBHOOK_URL unset, so no setWebhook call):
+
+    curl -X POST -H "Content-Type: application/json" \\
+         -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" \\
+         --data @update.json http://127.0.0.1:8443/telegram
+"""
+import json
+import hmac
+import asyncio
+import logging
+import secrets
+import signal
+
+from telegram import Update
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING_UPDATES = 1000    # Updates accepted but not finished before answering 503
+MAX_BODY_BYTES = 1 << 20      # Larger requests are refused (Telegram updates are a few KB)
+MAX_CONNECTIONS = 40          # Passed to setWebhook: parallel connections Telegram may open
+READ_TIMEOUT = 30             # Seconds an idle keep-alive connection stays open
+
+WEBHOOK_REQUESTS = metrics.Counter("bot_webhook_requests_total", "Webhook requests by result", ["result"])
+
+_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 503: "Service Unavailable"}
+
+class WebhookServer:
+    """
+    application: initialized telegram.ext.Application (its handlers process the updates)
+    update_processor: the application's BaseUpdateProcessor (e.g. ChatOrderedUpdateProcessor)
+    secret_token: expected X-Telegram-Bot-Api-Secret-Token, or None to accept any request
+    """
+    def __init__(self, application, update_processor, path="/telegram", secret_token=None,
+                 max_pending=MAX_PENDING_UPDATES):
+        self.application = application
+        self.update_processor = update_processor
+        self.path = path
+        self.secret_token = secret_token
+        self.max_pending = max_pending
+        self.pending = 0
+        self._tasks = set()
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._serve, host, int(port))
+        logger.info(f"Webhook listening on http://{host}:{self.port}{self.path}")
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1] if self.server else None
+
+    async def stop(self, timeout=10):
+        """Stops accepting requests and waits up to `timeout` seconds for accepted updates."""
+        if self.server is not None:
+            self.server.close()
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), timeout=READ_TIMEOUT)
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=READ_TIMEOUT)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, close=True)
+                    break
+                body = await asyncio.wait_for(reader.readexactly(length), timeout=READ_TIMEOUT)
+                parts = request_line.decode("latin-1").split()
+                status = self.handle(parts[0] if parts else "", parts[1] if len(parts) > 1 else "", headers, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, close)
+                if close:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, close=False):
+        body = b"" if status == 200 else _REASONS.get(status, "Error").encode()
+        writer.write(f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    def handle(self, method, path, headers, body):
+        """Validates one request and schedules its update. Returns the HTTP status."""
+        if path.split("?")[0] != self.path:
+            result, status = "not_found", 404
+        elif method != "POST":
+            result, status = "bad_method", 405
+        elif self.secret_token and not hmac.compare_digest(
+                headers.get("x-telegram-bot-api-secret-token", "").encode(), self.secret_token.encode()):
+            result, status = "bad_secret", 403
+        elif self.pending >= self.max_pending:
+            result, status = "full", 503
+        else:
+            try:
+                update = Update.de_json(json.loads(body), self.application.bot)
+            except (ValueError, TypeError, KeyError) as e:
+                logger.warning(f"Webhook: invalid update: {e}")
+                result, status = "invalid", 400
+            else:
+                self._submit(update)
+                result, status = "accepted", 200
+        WEBHOOK_REQUESTS.inc(result=result)
+        if status == 503 and self.pending == self.max_pending:
+            logger.warning(f"Webhook: {self.pending} updates pending, answering 503 until some finish")
+        return status
+
+    def _submit(self, update):
+        self.pending += 1
+        task = asyncio.create_task(
+            self.update_processor.process_update(update, self.application.process_update(update)))
+        self._tasks.add(task)
+        task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._tasks.discard(task)
+        self.pending -= 1
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Webhook: update failed: {task.exception()}")
+
+async def run(application, update_processor, listen="127.0.0.1", port=8443, path="/telegram",
+              webhook_url=None, secret_token=None, max_connections=MAX_CONNECTIONS,
+              max_pending=MAX_PENDING_UPDATES):
+    """
+    Runs the application in webhook mode until SIGINT/SIGTERM, like run_polling does for polling.
+    webhook_url: public HTTPS URL that reaches listen:port/path (e.g. through a reverse proxy
+    or tunnel). When set, setWebhook is called with it; otherwise the server only takes
+    local POSTs.
+    """
+    if webhook_url and not secret_token:
+        # Telegram echoes whatever was registered, so a fresh secret per start works
+        secret_token = secrets.token_urlsafe(32)
+    server = WebhookServer(application, update_processor, path, secret_token, max_pending)
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    await server.start(listen, port)
+    if webhook_url:
+        await application.bot.set_webhook(url=webhook_url, secret_token=secret_token, max_connections=max_connections,
+                                          allowed_updates=Update.ALL_TYPES)
+        logger.info(f"Webhook registered at {webhook_url} (max_connections={max_connections})")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,160 @@
+"""
+Multi-worker mode (WORKERS > 1): one router process plus WORKERS worker processes.
+
+The router is the only process that receives updates from Telegram (getUpdates or the
+webhook, as in UPDATE_MODE). It forwards every update to worker chat_id % WORKERS,
+which runs the usual handlers behind the WebhookServer of webhook.py on
+127.0.0.1:WORKER_BASE_PORT + index. All messages of a chat therefore go to one worker,
+in order, and that worker's per-user caches stay coherent; replies are sent by the
+workers themselves.
+
+The workers share the SQLite database. Only the holder of the "scheduler" lease
+(leader.py) fires reminders and the daily jobs; the others only handle updates.
+A worker that exits is restarted, and while it is down its updates wait in the
+router's queue (FORWARD_QUEUE_SIZE per worker, then the router stops taking updates).
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import signal
+import secrets
+import subprocess
+
+import httpx
+
+import metrics
+import webhook
+
+logger = logging.getLogger(__name__)
+
+FORWARD_QUEUE_SIZE = 1000   # Updates waiting per worker before the router stops taking more
+FORWARD_TIMEOUT = 10        # Seconds for one forward request
+RETRY_MAX_SECONDS = 5       # Longest wait between forward attempts while a worker is down
+RESTART_MAX_SECONDS = 60    # Longest wait before restarting a worker that keeps exiting
+STOP_TIMEOUT = 15           # Seconds workers get to finish after SIGTERM
+
+FORWARDED = metrics.Counter("bot_router_updates_total", "Updates forwarded by the router, by worker and result",
+                            ["worker", "result"])
+RESTARTS = metrics.Counter("bot_router_worker_restarts_total", "Worker processes restarted by the router", ["worker"])
+
+def shard_of(update, workers):
+    """Worker index for an update: by chat, or by user for updates without a chat (inline queries)."""
+    owner = update.effective_chat or update.effective_user
+    return (owner.id if owner else 0) % workers
+
+class Router:
+    """
+    workers: number of worker processes
+    script: path of main.py, started once per worker with WORKER_INDEX / WORKER_PORT / WORKER_SECRET set
+    """
+    def __init__(self, workers, script, base_port=8700, path="/telegram", queue_size=FORWARD_QUEUE_SIZE):
+        self.workers = workers
+        self.script = script
+        self.base_port = base_port
+        self.path = path
+        self.queue_size = queue_size
+        self.secret = secrets.token_urlsafe(32)  # Workers only accept updates carrying it
+        self.processes = [None] * workers
+        self.queues = []
+        self._tasks = []
+        metrics.Gauge("bot_router_queue_depth", "Updates waiting to be forwarded to a worker",
+                      lambda: sum(queue.qsize() for queue in self.queues))
+
+    def _spawn(self, index):
+        env = dict(os.environ, WORKER_INDEX=str(index), WORKER_PORT=str(self.base_port + index),
+                   WORKER_SECRET=self.secret)
+        self.processes[index] = subprocess.Popen([sys.executable, self.script], env=env)
+        logger.info(f"Worker {index} started (pid {self.processes[index].pid}, port {self.base_port + index})")
+
+    async def start(self, application=None):
+        """Starts the workers and the forwarding tasks. Usable as the router application's post_init."""
+        self.queues = [asyncio.Queue(self.queue_size) for _ in range(self.workers)]
+        for index in range(self.workers):
+            self._spawn(index)
+            self._tasks.append(asyncio.create_task(self._forward(index)))
+        self._tasks.append(asyncio.create_task(self._supervise()))
+
+    async def route(self, update, context=None):
+        """Handler for every update (TypeHandler(Update, router.route)); waits while the worker's queue is full."""
+        await self.queues[shard_of(update, self.workers)].put(update.to_json())
+
+    async def _forward(self, index):
+        """Sends the worker's updates one at a time, so they reach it in the order they arrived."""
+        url = f"http://127.0.0.1:{self.base_port + index}{self.path}"
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret, "Content-Type": "application/json"}
+        queue = self.queues[index]
+        async with httpx.AsyncClient(timeout=FORWARD_TIMEOUT) as client:
+            while True:
+                body = await queue.get()
+                delay = 0.1
+                while True:
+                    try:
+                        status = (await client.post(url, content=body, headers=headers)).status_code
+                    except httpx.HTTPError:
+                        status = None  # Worker starting or restarting
+                    if status == 200 or (status is not None and status != 503 and status < 500):
+                        break
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, RETRY_MAX_SECONDS)
+                if status != 200:
+                    logger.error(f"Worker {index} refused an update (HTTP {status}), dropped")
+                FORWARDED.inc(worker=index, result="ok" if status == 200 else "dropped")
+                queue.task_done()
+
+    async def _supervise(self):
+        started = [time.monotonic()] * self.workers
+        delays = [1] * self.workers
+        while True:
+            await asyncio.sleep(1)
+            for index, process in enumerate(self.processes):
+                if process.poll() is None:
+                    continue
+                # Back off when a worker dies right after starting (bad config, port taken)
+                delays[index] = delays[index] * 2 if time.monotonic() - started[index] < 30 else 1
+                delay = min(delays[index], RESTART_MAX_SECONDS)
+                logger.error(f"Worker {index} exited with code {process.returncode}, restarting in {delay}s")
+                await asyncio.sleep(delay)
+                self._spawn(index)
+                started[index] = time.monotonic()
+                RESTARTS.inc(worker=index)
+
+    async def stop(self, application=None):
+        """Forwards what is queued, then stops the workers. Usable as post_shutdown."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Router: {sum(q.qsize() for q in self.queues)} updates not forwarded before stopping")
+        for task in self._tasks:
+            task.cancel()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                await asyncio.to_thread(process.wait, max(0.1, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+async def run_worker(application, update_processor, port, path="/telegram", secret_token=None,
+                     max_pending=webhook.MAX_PENDING_UPDATES):
+    """Worker side: handles the updates the router POSTs to 127.0.0.1:port, until SIGTERM or the router exits."""
+    router_pid = os.getppid()
+
+    async def watch_router():
+        # An orphaned worker would keep its port (and maybe the scheduler lease)
+        while os.getppid() == router_pid:
+            await asyncio.sleep(2)
+        logger.error("Router exited, stopping worker")
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    watcher = asyncio.create_task(watch_router())
+    try:
+        await webhook.run(application, update_processor, "127.0.0.1", port, path,
+                          secret_token=secret_token, max_pending=max_pending)
+    finally:
+        watcher.cancel()
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The bot runs as `python src/main.py`, so its modules import each other by bare name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import database
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """An empty database file for the test; database.py connects to it on next use."""
+    path = str(tmp_path / "bot_data.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    database._agenda_cache.clear()
+    yield path
+    database.close_connection()
+    database._agenda_cache.clear()
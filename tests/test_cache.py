@@ -0,0 +1,33 @@
+import time
+
+from cache import LRUCache
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = LRUCache(ttl=10)
+    cache.set("a", 1)
+    now[0] += 9
+    assert cache.get("a") == 1
+    now[0] += 2
+    assert cache.get("a", "gone") == "gone"
+    assert len(cache) == 0
+
+def test_pop_and_hit_rate():
+    cache = LRUCache()
+    cache.set("a", 1)
+    assert cache.pop("a") == 1 and cache.pop("a") is None
+    cache.get("a")
+    cache.set("a", 2)
+    cache.get("a")
+    assert cache.stats()["hit_rate"] == 0.5
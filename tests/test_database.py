@@ -0,0 +1,171 @@
+import sqlite3
+
+import database
+
+# Schema as created by init_db before the migrations existed (schema version 0)
+V0_SCHEMA = """
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, goals TEXT, joined_at TEXT);
+CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, description TEXT,
+                    schedule_time TEXT, status TEXT, created_at TEXT);
+CREATE TABLE recurring_schedules (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, description TEXT,
+                                  frequency TEXT, time TEXT, end_date TEXT, created_at TEXT);
+INSERT INTO users VALUES (1, 'an', NULL, '2025-01-01T00:00:00');
+INSERT INTO tasks (user_id, description, schedule_time, status, created_at)
+    VALUES (1, 'Nộp báo cáo', '2025-11-25T09:00:00', 'pending', '2025-11-24T10:00:00');
+INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, created_at)
+    VALUES (1, 'Học Toeic', 'mon,wed,fri', '20:00', NULL, '2025-11-24T10:00:00'),
+           (1, 'Chạy bộ', 'mon-fri', '6:05', NULL, '2025-11-24T10:00:00'),
+           (1, 'Đọc sách', 'sun', 'tối', NULL, '2025-11-24T10:00:00');
+"""
+
+def test_migrates_v0_database(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(V0_SCHEMA)
+    conn.close()
+
+    database.init_db()
+    assert database.get_schema_version() == len(database.MIGRATIONS)
+
+    rows = {s["description"]: s for s in database.get_all_schedules(1)}
+    assert rows["Học Toeic"]["days_mask"] == 0b0010101
+    assert (rows["Chạy bộ"]["days_mask"], rows["Chạy bộ"]["minute_of_day"]) == (0b0011111, 6 * 60 + 5)
+    assert rows["Đọc sách"]["minute_of_day"] is None
+    day = database.get_agenda(1, "2025-11-25", "2025-11-26")[0]
+    assert [t["description"] for t in day["tasks"]] == ["Nộp báo cáo"]
+
+def _with_reminder(schedule_id, before):
+    conn = database.get_connection()
+    with conn:
+        conn.execute("UPDATE recurring_schedules SET chat_id = 7, remind_before_minutes = ?, reminder_message = 'nhắc' WHERE id = ?",
+                     (before, schedule_id))
+
+def _slots(first, last):
+    return sorted((row[0], row[1]) for row in database.get_recurring_reminders_between(first, last))
+
+def test_early_reminder_of_unpadded_time(db_path):
+    database.init_db()
+    schedule_id, _ = database.add_recurring_schedule_if_absent(1, "Chạy bộ", "mon-fri", "8:05", chat_id=7,
+                                                               remind_before_minutes=10, reminder_message="nhắc")
+    assert _slots(475, 475) == [("early", schedule_id)]
+    assert _slots(485, 485) == [("main", schedule_id)]
+
+def test_early_reminder_before_midnight(db_path):
+    database.init_db()
+    schedule_id, _ = database.add_recurring_schedule_if_absent(1, "Uống thuốc", "mon", "0:05")
+    _with_reminder(schedule_id, 10)
+    assert _slots(1435, 1435) == [("early", schedule_id)]
+    assert _slots(5, 5) == [("main", schedule_id)]
+
+def _search(user_id, keyword, accent_insensitive=None):
+    found = database.search_schedules(user_id, keyword, accent_insensitive=accent_insensitive)
+    return [s["description"] for s in found["recurring"]] + [t["description"] for t in found["task"]]
+
+def _indexed_rows():
+    return database.get_connection().execute("SELECT COUNT(*) FROM schedule_search").fetchone()[0]
+
+def test_search_ranking_and_accents(db_path):
+    database.init_db()
+    database.add_recurring_schedule_if_absent(1, "Học TOEIC", "mon", "20:00")
+    database.add_recurring_schedule_if_absent(1, "Ôn bài và học từ vựng TOEIC part 5 trước khi đi ngủ", "tue", "21:00")
+    database.add_recurring_schedule_if_absent(1, "Hóc búa", "wed", "21:00")
+    database.add_task_if_absent(1, "hoc nhom", "2025-11-25T09:00:00")
+
+    assert _search(1, "toe")[0] == "Học TOEIC"  # Shorter description ranks first
+    assert set(_search(1, "hoc")) == {"Học TOEIC", "Ôn bài và học từ vựng TOEIC part 5 trước khi đi ngủ", "Hóc búa", "hoc nhom"}
+    assert set(_search(1, "học")) == {"Học TOEIC", "Ôn bài và học từ vựng TOEIC part 5 trước khi đi ngủ"}
+    assert _search(1, "hoc", accent_insensitive=False) == ["hoc nhom"]
+
+def test_search_is_per_owner(db_path):
+    database.init_db()
+    database.add_recurring_schedule_if_absent(7, "Học TOEIC", "mon", "20:00")
+    database.add_recurring_schedule_if_absent(17, "Học TOEIC", "mon", "20:00")
+    database.add_recurring_schedule_if_absent(-7, "Học TOEIC", "mon", "20:00")
+    for user_id in (7, 17, -7):
+        assert [s["id"] for s in database.search_schedules(user_id, "toeic")["recurring"]] == \
+               [s["id"] for s in database.get_all_schedules(user_id)]
+    assert _search(70, "toeic") == []
+
+def test_delete_matches_the_whole_phrase_with_accents(db_path):
+    database.init_db()
+    toeic, _ = database.add_recurring_schedule_if_absent(1, "Học TOEIC", "mon", "20:00")
+    database.add_recurring_schedule_if_absent(1, "Hóc búa", "wed", "21:00")
+    database.add_task_if_absent(1, "Học nhóm", "2025-11-25T09:00:00")
+    database.add_recurring_schedule_if_absent(2, "Học TOEIC", "mon", "20:00")
+    indexed = _indexed_rows()
+
+    assert database.delete_recurring_schedule(1, "hoc") == []
+    assert database.delete_task(1, "học") != []
+    assert database.delete_recurring_schedule(1, "toe") == []
+    assert database.delete_recurring_schedule(1, "học toeic") == [toeic]
+    assert [s["description"] for s in database.get_all_schedules(1)] == ["Hóc búa"]
+    assert len(database.get_all_schedules(2)) == 1
+    # Deleted rows are gone from the search index too
+    assert _indexed_rows() == indexed - 2
+    assert _search(1, "học") == []
+
+def test_v5_keeps_removed_duplicates(db_path, caplog):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(V0_SCHEMA + """
+    INSERT INTO recurring_schedules (user_id, description, frequency, time, end_date, created_at)
+        VALUES (1, 'lịch học TOEIC!', 'mon,wed,fri', '20:00', NULL, '2025-11-25T10:00:00');
+    """)
+    conn.close()
+
+    database.init_db()
+    assert [s["description"] for s in database.get_all_schedules(1) if "toeic" in s["description"].lower()] == ["Học Toeic"]
+    removed = database.get_connection().execute(
+        "SELECT description, kept_id FROM recurring_schedules_removed_duplicates").fetchall()
+    assert removed == [("lịch học TOEIC!", 1)]
+    assert "duplicates row 1" in caplog.text
+
+def test_description_key():
+    assert database.description_key("Lịch  Học TOEIC!") == database.description_key("học toeic")
+    assert database.description_key("học toeic") != database.description_key("học toeic part 5")
+    assert database.description_key("lịch") == "lịch"
+
+def test_add_if_absent_returns_existing_id(db_path):
+    database.init_db()
+    task_id, created = database.add_task_if_absent(1, "Học TOEIC", "2025-11-25T20:00:00")
+    assert created
+    assert database.add_task_if_absent(1, "lịch học toeic.", "2025-11-25T20:00:00") == (task_id, False)
+    assert database.add_task_if_absent(1, "Học TOEIC part 5", "2025-11-25T20:00:00")[1]
+    assert database.add_task_if_absent(1, "Học TOEIC", "2025-11-25T21:00:00")[1]
+    assert database.add_task_if_absent(2, "Học TOEIC", "2025-11-25T20:00:00")[1]
+
+    schedule_id, created = database.add_recurring_schedule_if_absent(1, "Chạy bộ", "mon,wed", "06:00")
+    assert created
+    assert database.add_recurring_schedule_if_absent(1, "chạy bộ", "mon,wed", "06:00") == (schedule_id, False)
+    assert database.add_recurring_schedule_if_absent(1, "Chạy bộ", "tue", "06:00")[1]
+    assert len(database.get_all_schedules(1)) == 2
+
+def test_agenda_merges_tasks_and_recurring_by_day(db_path):
+    database.init_db()
+    database.add_task(1, "Nộp báo cáo", "2025-11-25T09:00:00")
+    database.add_task(1, "Họp nhóm", "2025-11-25T08:00:00")
+    database.add_task(1, "Khám răng", "2025-12-05T10:00:00")  # After the range
+    database.add_task(2, "Việc của người khác", "2025-11-25T07:00:00")
+    database.add_recurring_schedule(1, "Học Toeic", "mon,wed,fri", "20:00")
+    database.add_recurring_schedule(1, "Chạy bộ", "mon,tue,wed,thu,fri", "6:05")
+    database.add_recurring_schedule(1, "Bơi", "tue,thu", "18:00", end_date="2025-11-26")
+
+    def names(days):
+        return [([t['description'] for t in d['tasks']], [r['description'] for r in d['recurring']]) for d in days]
+
+    # 2025-11-24 is a Monday
+    days = database.get_agenda(1, "2025-11-24", "2025-12-01")
+    assert [d['date'] for d in days] == [f"2025-11-{n}" for n in range(24, 31)]
+    assert [d['weekday'] for d in days] == list(range(7))
+    assert names(days) == [
+        ([], ["Chạy bộ", "Học Toeic"]),
+        (["Họp nhóm", "Nộp báo cáo"], ["Chạy bộ", "Bơi"]),
+        ([], ["Chạy bộ", "Học Toeic"]),
+        ([], ["Chạy bộ"]),  # Bơi ended on the 26th
+        ([], ["Chạy bộ", "Học Toeic"]),
+        ([], []),
+        ([], []),
+    ]
+    # Served from the cache, and refreshed after a change
+    assert database.get_agenda(1, "2025-11-25", "2025-11-26") == days[1:2]
+    database.add_task(1, "Gọi điện", "2025-11-25T06:00:00")
+    assert names(database.get_agenda(1, "2025-11-25", "2025-11-26")) == [
+        (["Gọi điện", "Họp nhóm", "Nộp báo cáo"], ["Chạy bộ", "Bơi"])]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+import database
+import history
+from cache import LRUCache
+
+@pytest.fixture
+def hist(db_path, monkeypatch):
+    database.init_db()
+    monkeypatch.setattr(history, "_buffers", LRUCache(maxsize=2))
+    return history
+
+def _chat(user_id, count, start=0):
+    for i in range(start, start + count):
+        history.add_turns(user_id, [("user", f"tin nhắn {i}"), ("assistant", f"trả lời {i}")])
+
+def test_ring_buffer_keeps_the_newest_turns(hist):
+    _chat(1, 20)
+    turns = hist.get_recent(1)
+    assert len(turns) == hist.HISTORY_RING_SIZE
+    assert turns[-1] == {'role': 'assistant', 'content': "trả lời 19"}
+    assert turns[0]['content'] == f"tin nhắn {20 - hist.HISTORY_RING_SIZE // 2}"
+    assert hist.get_recent(1, limit=2) == turns[-2:]
+    # Empty replies are not stored
+    hist.add_turns(1, [("assistant", "")])
+    assert hist.get_recent(1) == turns
+
+def test_evicted_users_are_reloaded_from_sqlite(hist):
+    _chat(1, 3)
+    before = hist.get_recent(1)
+    _chat(2, 1)
+    _chat(3, 1)  # Cache holds two users: 1 is the least recently used
+    assert hist._buffers.get(1) is None
+    assert hist.get_recent(1) == before
+    assert hist.get_recent(2)[-1]['content'] == "trả lời 0"
+
+def test_context_fits_the_token_budget(hist):
+    _chat(1, 12)
+    context = hist.get_context(1, token_budget=40)
+    assert sum(hist.estimate_tokens(t['content']) for t in context) <= 40
+    assert context == hist.get_recent(1)[-len(context):]
+    assert 0 < len(context) < hist.HISTORY_RING_SIZE
+    assert hist.get_context(1, token_budget=3) == []
+
+def test_summary_leads_the_context_only_when_it_fits(hist):
+    _chat(1, 2)
+    database.compact_conversation(1, 0, "Anh đang ôn thi TOEIC")
+    hist._buffers.clear()
+    context = hist.get_context(1, token_budget=60)
+    assert context[0] == {'role': hist.SUMMARY_ROLE, 'content': "Anh đang ôn thi TOEIC"}
+    assert context[-1]['content'] == "trả lời 1"
+    # Over a third of the budget: left out
+    assert all(t['role'] != hist.SUMMARY_ROLE for t in hist.get_context(1, token_budget=20))
+
+def test_compaction_summarises_old_turns(hist):
+    _chat(1, 10)
+    _chat(2, 2)
+    seen = []
+
+    async def summarize(previous, turns):
+        seen.append((previous, len(turns)))
+        return f"tóm tắt {len(turns)} lượt"
+
+    assert asyncio.run(hist.compact_async(summarize, keep=6)) == (1, 14)
+    assert seen == [(None, 14)]
+    assert database.get_recent_turns(1, 100)[0]['content'] == "tin nhắn 7"
+    assert len(database.get_recent_turns(1, 100)) == 6
+    assert hist.get_context(1)[0]['content'] == "tóm tắt 14 lượt"
+
+def test_failed_summary_keeps_the_turns(hist):
+    _chat(1, 5)
+
+    async def summarize(previous, turns):
+        raise RuntimeError("quota")
+
+    assert asyncio.run(hist.compact_async(summarize, keep=4)) == (1, 0)
+    assert len(database.get_recent_turns(1, 100)) == 10
+    assert database.get_conversation_summary(1) is None
+
+def test_a_thousand_turns_stay_bounded(hist):
+    """Same check as when history.py was written: 1000 turns for one user."""
+    for i in range(500):
+        hist.add_turns(1, [("user", f"Nhắc em việc số {i} lúc 8h sáng mai nhé"),
+                           ("assistant", f"Dạ vâng anh, em đã ghi nhớ việc số {i} ạ.")])
+    assert len(hist.get_recent(1)) == hist.HISTORY_RING_SIZE
+    context = hist.get_context(1)
+    assert sum(hist.estimate_tokens(t['content']) for t in context) <= hist.HISTORY_TOKEN_BUDGET
+
+    async def summarize(previous, turns):
+        return "Anh nhờ em nhắc rất nhiều việc buổi sáng"
+
+    assert asyncio.run(hist.compact_async(summarize)) == (1, 1000 - hist.HISTORY_KEEP_ROWS)
+    assert len(database.get_recent_turns(1, 2000)) == hist.HISTORY_KEEP_ROWS
+    hist._buffers.clear()
+    assert hist.get_context(1)[0] == {'role': hist.SUMMARY_ROLE, 'content': "Anh nhờ em nhắc rất nhiều việc buổi sáng"}
@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import intent_cache
+import llm_engine
+
+MONDAY = datetime(2025, 11, 24, 19, 5)
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    intent_cache.configure(persistent=False)
+    intent_cache.clear()
+    yield
+    intent_cache.clear()
+
+def _reminder(run_date):
+    return {"intents": [{"intent": "schedule_reminder", "type": "one_off", "run_date": run_date, "description": "học"}]}
+
+def test_relative_dates_are_reanchored():
+    intent_cache.put("tối mai học", None, _reminder("2025-11-25T21:00:00"), now=MONDAY)
+    next_monday = datetime(2025, 12, 1, 19, 40)
+    cached = intent_cache.get("tối mai học", None, now=next_monday)
+    assert cached["intents"][0]["run_date"] == "2025-12-02T21:00:00"
+
+def test_explicit_dates_stay_absolute():
+    intent_cache.put("24/12 học", None, _reminder("2025-12-24T21:00:00"), now=MONDAY)
+    cached = intent_cache.get("24/12 học", None, now=datetime(2025, 12, 1, 19, 0))
+    assert cached["intents"][0]["run_date"] == "2025-12-24T21:00:00"
+
+def test_key_depends_on_hour_and_history():
+    intent_cache.put("tối mai học", None, _reminder("2025-11-25T21:00:00"), now=MONDAY)
+    assert intent_cache.get("tối mai học", None, now=MONDAY.replace(hour=20)) is None
+    assert intent_cache.get("tối mai học", [{"role": "user", "content": "toeic"}], now=MONDAY) is None
+
+def _fake_gemini(monkeypatch, text):
+    calls = []
+
+    async def generate(kind, prompt, timeout=None):
+        calls.append(kind)
+        return SimpleNamespace(text=text)
+    monkeypatch.setattr(llm_engine, "_generate_content_async", generate)
+    monkeypatch.setattr(llm_engine, "FAST_PATH_MIN_CONFIDENCE", 1.01)
+    return calls
+
+def test_combined_mode_caches_intents(monkeypatch):
+    calls = _fake_gemini(monkeypatch, '{"intents": [{"intent": "check_schedule", "time_range": "today"}], "reply": ""}')
+    first = asyncio.run(llm_engine.analyze_message_async("hôm nay có gì"))
+    second = asyncio.run(llm_engine.analyze_message_async("hôm nay có gì"))
+    assert calls == ["combined"]
+    assert second == {"intents": first["intents"], "reply": ""}
+
+def test_combined_mode_does_not_cache_chat_replies(monkeypatch):
+    calls = _fake_gemini(monkeypatch, '{"intents": [{"intent": "chat"}], "reply": "Dạ em chào anh ạ."}')
+    asyncio.run(llm_engine.analyze_message_async("chào em"))
+    asyncio.run(llm_engine.analyze_message_async("chào em"))
+    assert calls == ["combined", "combined"]
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+import pytest
+
+from intent_parser import parse_intent
+
+NOW = datetime(2025, 11, 24, 19, 0)  # A Monday evening
+FAST_PATH = 0.85
+
+def _fast(text):
+    result = parse_intent(text, NOW)
+    if result is None or result[1] < FAST_PATH:
+        return None
+    return result[0]["intents"][0]
+
+def test_one_off_reminder():
+    intent = _fast("8h tối mai học toeic")
+    assert intent["intent"] == "schedule_reminder"
+    assert intent["run_date"] == "2025-11-25T20:00:00"
+    assert intent["description"] == "học toeic"
+
+def test_recurring_reminder():
+    intent = _fast("mỗi ngày 6h sáng chạy bộ")
+    assert intent["type"] == "recurring"
+    assert intent["days_of_week"] == ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+    assert (intent["hour"], intent["minute"]) == (6, 0)
+
+def test_check_and_delete():
+    assert _fast("lịch tuần tới") == {"intent": "check_schedule", "time_range": "week"}
+    assert _fast("xóa lịch ngày mai")["time_range"] == "tomorrow"
+    assert _fast("xóa lịch học toeic")["description"] == "học toeic"
+    assert _fast("xóa hết lịch")["delete_all"] is True
+
+@pytest.mark.parametrize("text", [
+    "đừng nhắc tôi 8h tối nữa",
+    "dung nhac toi 8h toi nua",
+    "thôi khỏi nhắc 7h sáng mai",
+    "hôm nay tôi mệt quá, 8h tối nhắc tôi ngủ",
+    "buồn quá 9h tối nhắc em gọi mẹ",
+])
+def test_negations_and_emotions_go_to_llm(text):
+    assert _fast(text) is None
+
+@pytest.mark.parametrize("text", ["xóa lịch ngày 24/12", "xóa lịch học tuần sau"])
+def test_delete_by_date_or_week_goes_to_llm(text):
+    assert _fast(text) is None
+
+def test_unaccented_pronoun_is_not_evening():
+    intent = _fast("nhac toi 8h sang mai di hoc")
+    assert intent["hour"] == 8
+
+@pytest.mark.parametrize("text", ["8h tối gặp chị Mai", "8h tối đi ăn với Nay", "xóa lịch Mai", "lịch Nay"])
+def test_names_mai_and_nay_go_to_llm(text):
+    assert _fast(text) is None
+    # Not silently turned into a date
+    result = parse_intent(text, NOW)
+    assert result is None or "Mai" in str(result[0]) or "Nay" in str(result[0])
+
+def test_mai_next_to_a_time_is_tomorrow():
+    assert _fast("Mai 8h tối học toeic")["run_date"] == "2025-11-25T20:00:00"
+    assert _fast("8h tối mai học toeic")["run_date"] == "2025-11-25T20:00:00"
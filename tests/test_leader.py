@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+from apscheduler.schedulers.base import STATE_PAUSED, STATE_RUNNING
+
+import database
+import leader
+from scheduler_manager import SchedulerManager
+
+NOW = 1_764_000_000.0
+TTL = 30
+
+@pytest.fixture
+def db(db_path):
+    database.init_db()
+    return db_path
+
+def test_second_holder_waits_for_expiry(db):
+    assert database.acquire_lease("scheduler", "a", TTL, NOW)
+    assert not database.acquire_lease("scheduler", "b", TTL, NOW + 1)
+    # Renewals by the holder push the expiry forward
+    assert database.acquire_lease("scheduler", "a", TTL, NOW + 10)
+    assert not database.acquire_lease("scheduler", "b", TTL, NOW + TTL + 5)
+    assert database.get_lease("scheduler") == ("a", NOW + 10 + TTL)
+    # a stopped renewing: b takes over once the lease has run out, and a is refused
+    assert database.acquire_lease("scheduler", "b", TTL, NOW + 10 + TTL + 1)
+    assert not database.acquire_lease("scheduler", "a", TTL, NOW + 10 + TTL + 2)
+    assert database.get_lease("scheduler")[0] == "b"
+
+def test_released_lease_is_free_at_once(db):
+    assert database.acquire_lease("scheduler", "a", TTL, NOW)
+    database.release_lease("scheduler", "b")  # Not the holder: no effect
+    assert not database.acquire_lease("scheduler", "b", TTL, NOW + 1)
+    database.release_lease("scheduler", "a")
+    assert database.get_lease("scheduler") is None
+    assert database.acquire_lease("scheduler", "b", TTL, NOW + 1)
+
+def test_lease_from_before_a_clock_jump_back_is_taken_over(db):
+    assert database.acquire_lease("scheduler", "a", TTL, NOW)
+    # The clock went back an hour; a's lease would otherwise block b for that long
+    assert database.acquire_lease("scheduler", "b", TTL, NOW - 3600)
+    assert database.get_lease("scheduler") == ("b", NOW - 3600 + TTL)
+
+def test_leader_keeps_leading_through_a_short_outage(db, monkeypatch):
+    clock = {"wall": NOW, "mono": 100.0}
+    monkeypatch.setattr(leader.time, "time", lambda: clock["wall"])
+    monkeypatch.setattr(leader.time, "monotonic", lambda: clock["mono"])
+    lease = leader.LeaderLease("scheduler", ttl=TTL, holder="a")
+    assert lease.try_acquire()
+    lease.is_leader = True
+
+    def broken(*args):
+        raise database.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(database, "acquire_lease", broken)
+    # A forward wall clock jump does not cut the remaining validity short...
+    clock.update(wall=NOW + 3600, mono=110.0)
+    assert lease.try_acquire()
+    # ...but time without a renewal does, whatever the wall clock says
+    clock.update(wall=NOW, mono=100.0 + TTL * 2 / 3 + 1)
+    assert not lease.try_acquire()
+
+def test_run_elects_then_demotes_and_releases_on_stop(db):
+    events = []
+    lease = leader.LeaderLease("scheduler", ttl=0.03, holder="a")
+
+    async def main():
+        task = asyncio.get_running_loop().create_task(
+            lease.run(lambda: events.append("elected"), lambda: events.append("demoted")))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert events == ["elected", "demoted"]
+    assert lease.elections == 1 and not lease.is_leader
+    assert database.get_lease("scheduler") is None
+
+def test_run_demotes_when_another_holder_takes_over(db):
+    events = []
+    lease = leader.LeaderLease("scheduler", ttl=0.3, holder="a")
+
+    async def main():
+        task = asyncio.get_running_loop().create_task(
+            lease.run(lambda: events.append("elected"), lambda: events.append("demoted")))
+        await asyncio.sleep(0.05)
+        # a's renewals were lost (frozen process): the lease runs out and b takes it
+        with database.get_connection() as conn:
+            conn.execute("UPDATE leases SET expires_at = 0")
+        assert database.acquire_lease("scheduler", "b", 0.3)
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert events == ["elected", "demoted"]
+    # Stopping after the demotion leaves b's lease alone
+    assert database.get_lease("scheduler")[0] == "b"
+
+def test_scheduler_fires_only_while_leading(db, tmp_path):
+    manager = SchedulerManager(db_url=f"sqlite:///{tmp_path / 'jobs.db'}", reminder_backend="tables", shared=True)
+
+    async def main():
+        await manager.start_async(paused=True)
+        states = [(manager.scheduler.state, manager.reminders._task is not None, manager._watcher is not None)]
+        manager.lead()
+        states.append((manager.scheduler.state, manager.reminders._task is not None, manager._watcher is not None))
+        await asyncio.sleep(0)
+        manager.follow()
+        states.append((manager.scheduler.state, manager.reminders._task is not None, manager._watcher is not None))
+        manager.scheduler.shutdown(wait=False)
+        return states
+
+    assert asyncio.run(main()) == [(STATE_PAUSED, False, False),
+                                   (STATE_RUNNING, True, True),
+                                   (STATE_PAUSED, False, False)]
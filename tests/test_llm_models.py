@@ -0,0 +1,93 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import llm_engine
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    monkeypatch.setattr(llm_engine, "_models", {})
+    monkeypatch.setattr(llm_engine, "_model_tasks", {})
+    created = []
+
+    def get_model(kind):
+        # Stands in for the SDK import / CachedContent.create network call
+        time.sleep(0.05)
+        created.append(threading.get_ident())
+        model = f"{kind}-{len(created)}"
+        llm_engine._models[kind] = (model, time.time() + 3600)
+        return model
+    monkeypatch.setattr(llm_engine, "_get_model", get_model)
+    return created
+
+def test_model_is_created_once_off_the_event_loop(fake_models):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+        task = asyncio.create_task(ticker())
+        models = await asyncio.gather(*(llm_engine._get_model_async("combined") for _ in range(5)))
+        task.cancel()
+        return models, ticks
+
+    models, ticks = asyncio.run(main())
+    assert models == ["combined-1"] * 5
+    assert len(fake_models) == 1 and fake_models[0] != threading.get_ident()
+    assert ticks > 3  # The loop kept running while the model was created
+
+def test_expired_model_is_renewed_in_the_background(fake_models):
+    llm_engine._models["combined"] = ("old", time.time() - 1)
+
+    async def main():
+        first = await llm_engine._get_model_async("combined")
+        await llm_engine._model_tasks["combined"]
+        return first, await llm_engine._get_model_async("combined")
+
+    assert asyncio.run(main()) == ("old", "combined-1")
+
+class _StreamingModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def generate_content_async(self, prompt, stream=False):
+        async def response():
+            for text in self.chunks:
+                await asyncio.sleep(0)
+                yield SimpleNamespace(text=text, usage_metadata=None)
+        return response()
+
+def test_stream_frees_the_llm_slot_before_the_reader_is_done(monkeypatch):
+    monkeypatch.setattr(llm_engine, "_models", {"secretary": (_StreamingModel(["Dạ ", "anh"]), None)})
+    monkeypatch.setattr(llm_engine, "_llm_semaphore", asyncio.Semaphore(1))
+
+    async def main():
+        chunks = llm_engine._stream_content_async("secretary", "prompt")
+        first = await chunks.__anext__()
+        # The caller is busy (a throttled Telegram edit); Gemini has finished meanwhile
+        await asyncio.sleep(0.01)
+        free = not llm_engine._get_semaphore().locked()
+        return [first] + [chunk async for chunk in chunks], free
+
+    assert asyncio.run(main()) == (["Dạ ", "anh"], True)
+
+def test_stream_errors_reach_the_reader(monkeypatch):
+    class Failing:
+        async def generate_content_async(self, prompt, stream=False):
+            raise RuntimeError("quota")
+    monkeypatch.setattr(llm_engine, "_models", {"secretary": (Failing(), None)})
+    monkeypatch.setattr(llm_engine, "_llm_semaphore", asyncio.Semaphore(1))
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            async for _ in llm_engine._stream_content_async("secretary", "prompt"):
+                pass
+        return llm_engine._get_semaphore().locked()
+
+    assert asyncio.run(main()) is False
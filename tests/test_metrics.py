@@ -0,0 +1,45 @@
+import sys
+import threading
+
+import metrics
+
+def test_nested_timed_calls_are_counted_once():
+    histogram = metrics.Histogram("test_nested_seconds", "test", ["function"])
+
+    def inner():
+        return 1
+
+    timed_inner = metrics.timed_function(inner, histogram, "test")
+
+    def outer():
+        return timed_inner() + 1
+
+    timed_outer = metrics.timed_function(outer, histogram, "test")
+    assert timed_outer() == 2
+    assert histogram.count(function="outer") == 1
+    assert histogram.count(function="inner") == 0
+    timed_inner()
+    assert histogram.count(function="inner") == 1
+
+def test_counts_are_not_lost_across_threads():
+    counter = metrics.Counter("test_threads_total", "test", ["kind"])
+    histogram = metrics.Histogram("test_threads_seconds", "test", ["kind"])
+    switch = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # Switch threads as often as possible
+
+    def work():
+        for _ in range(20000):
+            counter.inc(kind="a")
+            histogram.observe(0.01, kind="a")
+
+    try:
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch)
+    assert counter.values[("a",)] == 80000
+    assert histogram.count(kind="a") == 80000
+    assert 'test_threads_seconds_count{kind="a"} 80000' in histogram.render()
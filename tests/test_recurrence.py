@@ -0,0 +1,42 @@
+from datetime import date
+
+import pytest
+
+import recurrence
+
+MONDAY = date(2025, 11, 24)
+
+def test_days_to_mask():
+    assert recurrence.days_to_mask("mon,wed,fri") == 0b0010101
+    assert recurrence.days_to_mask("Mon - Fri") == 0b0011111
+    assert recurrence.days_to_mask("sat,sun") == 0b1100000
+    assert recurrence.days_to_mask("") == 0
+    assert recurrence.mask_to_weekdays(0b1000001) == [0, 6]
+
+def test_minute_of_day():
+    assert recurrence.parse_minute_of_day("08:05") == 485
+    assert recurrence.parse_minute_of_day("8:5") == 485
+    assert recurrence.parse_minute_of_day("23:59:00") == 1439
+    assert recurrence.parse_minute_of_day("24:00") is None
+    assert recurrence.parse_minute_of_day("tối") is None
+    assert recurrence.format_minute_of_day(485) == "08:05"
+
+def _schedules():
+    masks = [recurrence.days_to_mask(d) for d in ("mon-sun", "mon,wed", "sun", "mon-sun", "tue")]
+    minutes = [20 * 60, 6 * 60, 9 * 60, None, 20 * 60]
+    ends = [None, None, None, None, recurrence.end_ordinal("2025-11-25")]
+    return masks, minutes, ends
+
+@pytest.mark.parametrize("use_numpy", [False, True])
+def test_expand(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip("numpy")
+        monkeypatch.setattr(recurrence, "NUMPY_MIN_CELLS", 0)
+    else:
+        monkeypatch.setattr(recurrence, "np", None)
+    by_day = recurrence.expand(MONDAY, 9, *_schedules())
+    assert by_day[0] == [1, 0, 3]           # Mon: 06:00, 20:00, then the schedule without a time
+    assert by_day[1] == [0, 4, 3]           # Tue: ties keep input order; last day before end_date
+    assert by_day[6] == [2, 0, 3]           # Sun
+    assert by_day[8] == [0, 3]              # Next Tue: schedule 4 has ended
+    assert recurrence.expand(MONDAY, 0, *_schedules()) == []
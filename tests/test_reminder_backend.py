@@ -0,0 +1,114 @@
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import database
+from reminder_backend import TableReminderBackend
+
+TZ = ZoneInfo("Asia/Ho_Chi_Minh")
+CHAT = 42
+
+@pytest.fixture
+def base(db_path):
+    """A whole minute a little in the future, as a timestamp."""
+    database.init_db()
+    return (int(time.time()) // 60 + 2) * 60
+
+def _local(timestamp):
+    return datetime.fromtimestamp(timestamp, TZ).replace(tzinfo=None).isoformat()
+
+def _task(when, description):
+    task_id, _ = database.add_task_if_absent(CHAT, description, _local(when), chat_id=CHAT,
+                                             reminder_message=f"nhắc {description}")
+    return task_id
+
+def _texts(messages):
+    return [text for _, text, _, _ in messages]
+
+def test_tables_fire_across_the_window_and_a_restart(base):
+    _task(base, "a")
+    _task(base + 600, "b")  # Beyond the first 300 s window
+    _task(base + 1200, "c")
+
+    backend = TableReminderBackend(tz=TZ, lookahead=300)
+    assert backend.pop_due(base - 1) == []
+    assert _texts(backend.pop_due(base)) == ["nhắc a"]
+    assert _texts(backend.pop_due(base + 600)) == ["nhắc b"]
+    assert database.get_scheduler_state(TableReminderBackend.CURSOR) == str(base + 600)
+
+    # A new process continues from the persisted cursor: nothing repeated, nothing lost
+    restarted = TableReminderBackend(tz=TZ, lookahead=300)
+    assert restarted.pop_due(base + 600) == []
+    assert _texts(restarted.pop_due(base + 1200)) == ["nhắc c"]
+
+def test_tables_skip_removed_schedules(base):
+    first = _task(base, "a")
+    _task(base + 60, "b")
+    backend = TableReminderBackend(tz=TZ, lookahead=300)
+    backend.pop_due(base - 1)  # Both occurrences are now loaded
+
+    database.delete_task(CHAT, "a")
+    assert backend.remove(CHAT, "task", first) == 1
+    assert backend.pop_due(base) == []
+    assert _texts(backend.pop_due(base + 60)) == ["nhắc b"]
+
+def test_tables_chat_removal_does_not_hide_later_schedules(base):
+    _task(base, "a")
+    backend = TableReminderBackend(tz=TZ, lookahead=300)
+    backend.pop_due(base - 1)
+    database.delete_all_tasks(CHAT)
+    assert backend.remove(CHAT) == 1
+
+    _task(base + 900, "new")  # Outside the loaded window, picked up when it is extended
+    assert backend.pop_due(base) == []
+    assert _texts(backend.pop_due(base + 900)) == ["nhắc new"]
+
+# --- LightReminderBackend ---
+
+from reminder_backend import LightReminderBackend
+
+def _at(timestamp):
+    return datetime.fromtimestamp(timestamp, TZ)
+
+def test_light_fires_in_order_and_skips_removed(base):
+    backend = LightReminderBackend(tz=TZ)
+    backend.add_once(CHAT, "b", _at(base + 60), schedule_id=2)
+    backend.add_once(CHAT, "a", _at(base), schedule_id=1)
+    backend.add_once(CHAT, "removed", _at(base + 30), schedule_id=3)
+    assert backend.remove(CHAT, "task", 3) == 1
+
+    assert backend.next_fire() == base
+    assert _texts(backend.pop_due(base + 60)) == ["a", "b"]
+    assert backend.count() == 0
+
+def test_light_refills_the_window(base):
+    backend = LightReminderBackend(tz=TZ, window=2)
+    for i in range(5):
+        backend.add_once(CHAT, f"r{i}", _at(base + i * 10), schedule_id=i)
+    fired = []
+    for i in range(5):
+        fired += _texts(backend.pop_due(base + i * 10))
+    assert fired == ["r0", "r1", "r2", "r3", "r4"]
+    assert backend.next_fire() is None
+
+def _recurring_minute(base):
+    local = _at(base)
+    return local.hour, local.minute, local.date().isoformat()
+
+def test_light_recurring_moves_to_the_next_day(base):
+    hour, minute, _ = _recurring_minute(base)
+    backend = LightReminderBackend(tz=TZ)
+    backend.add_recurring(CHAT, "daily", hour, minute, "mon-sun", schedule_id=1)
+    assert _texts(backend.pop_due(base)) == ["daily"]
+    assert backend.next_fire() == base + 86400
+    assert backend.count() == 1
+
+def test_light_recurring_stops_at_end_date(base):
+    hour, minute, today = _recurring_minute(base)
+    backend = LightReminderBackend(tz=TZ)
+    backend.add_recurring(CHAT, "daily", hour, minute, "mon-sun", end_date=today, schedule_id=1)
+    assert _texts(backend.pop_due(base)) == ["daily"]
+    assert backend.next_fire() is None
+    assert backend.count() == 0
@@ -0,0 +1,68 @@
+import time
+import asyncio
+
+import pytest
+
+import database
+import dispatcher
+from reminder_backend import TableReminderBackend, RESEND_PENDING_SECONDS
+
+@pytest.fixture
+def backend(db_path):
+    database.init_db()
+    return TableReminderBackend()
+
+def _delivery(key):
+    return database.get_connection().execute(
+        "SELECT status, lateness, text FROM reminder_deliveries WHERE reminder_key = ?", (key,)).fetchone()
+
+def test_an_occurrence_is_claimed_once(backend):
+    now = int(time.time())
+    messages = [(1, "nhắc", now, f"task:1:main:{now}")]
+    assert backend._claim(messages) == messages
+    # Overlapping tick, or another process, sees the same occurrence
+    assert backend._claim(messages) == []
+    assert backend.stats.duplicates == 1
+
+def test_pending_rows_are_resent_only_when_recent(backend):
+    now = int(time.time())
+    database.claim_reminder_deliveries([("task:1:main:fresh", 1, now - 60, "fresh"),
+                                        ("task:2:main:stale", 2, now - RESEND_PENDING_SECONDS - 60, "stale")])
+    sent = []
+
+    async def callback(chat_id, text):
+        sent.append(text)
+
+    async def main():
+        backend.callback = callback
+        backend.start()
+        await asyncio.sleep(0.05)
+        backend.shutdown()
+
+    asyncio.run(main())
+    assert sent == ["fresh"]
+    status, lateness, text = _delivery("task:1:main:fresh")
+    assert status == "sent" and lateness == pytest.approx(60, abs=5) and text is None
+    assert _delivery("task:2:main:stale")[0] == "failed"
+    assert database.get_pending_reminder_deliveries() == []
+
+class _Bot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append((chat_id, text))
+
+def test_dispatcher_forgets_past_chat_slots(monkeypatch):
+    monkeypatch.setattr(dispatcher, "CHAT_SLOT_PRUNE_SECONDS", 0)
+    bot = _Bot()
+    sender = dispatcher.MessageDispatcher(bot, global_rate=1000, per_chat_interval=0.001)
+
+    async def main():
+        await sender.send_all([(chat_id, "x") for chat_id in range(3)])
+        await asyncio.sleep(0.01)
+        await sender.send_all([(99, "y")])
+
+    asyncio.run(main())
+    assert len(bot.sent) == 4
+    assert set(sender._next_chat_slot) == {99}
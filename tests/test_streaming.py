@@ -0,0 +1,78 @@
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from telegram.constants import MessageLimit
+from telegram.error import RetryAfter
+
+import streaming
+from streaming import StreamingReply, PENDING_SUFFIX
+
+class _Bot:
+    def __init__(self):
+        self.calls = []
+        self.fail_edits = 0
+
+    async def send_message(self, chat_id, text):
+        self.calls.append(("send", text))
+        return SimpleNamespace(message_id=len(self.calls))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        if self.fail_edits:
+            self.fail_edits -= 1
+            raise RetryAfter(timedelta(seconds=5))
+        self.calls.append(("edit", text))
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 100.0, "slept": []}
+    monkeypatch.setattr(streaming.time, "monotonic", lambda: now["t"])
+
+    async def sleep(delay):
+        now["slept"].append(delay)
+        now["t"] += delay
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    return now
+
+def test_edits_are_throttled(clock):
+    bot = _Bot()
+    reply = StreamingReply(bot, 1, edit_interval=1.5, min_edit_chars=10)
+
+    async def main():
+        await reply.update("Dạ anh")
+        await reply.update("Dạ anh, hôm nay")       # Within the interval
+        clock["t"] += 1.6
+        await reply.update("Dạ anh, hôm nay ")      # Too little new text
+        await reply.update("Dạ anh, hôm nay anh có")
+        await reply.update("Dạ anh, hôm nay anh có ba việc")  # Next slot not reached
+
+    asyncio.run(main())
+    assert bot.calls == [("send", "Dạ anh" + PENDING_SUFFIX), ("edit", "Dạ anh, hôm nay anh có" + PENDING_SUFFIX)]
+    assert reply.edits == 1
+
+def test_finish_waits_for_the_slot_and_splits_long_replies(clock):
+    bot = _Bot()
+    reply = StreamingReply(bot, 1, edit_interval=1.5)
+    text = "a" * MessageLimit.MAX_TEXT_LENGTH + "b" * 10
+
+    async def main():
+        await reply.update("a" * 50)
+        return await reply.finish(text)
+
+    assert asyncio.run(main()) == text
+    assert clock["slept"] == [pytest.approx(1.5)]
+    assert bot.calls[1:] == [("edit", "a" * MessageLimit.MAX_TEXT_LENGTH), ("send", "b" * 10)]
+
+def test_finish_retries_after_flood_control(clock):
+    bot = _Bot()
+    reply = StreamingReply(bot, 1, edit_interval=1.5)
+
+    async def main():
+        await reply.update("Dạ anh")
+        bot.fail_edits = 1
+        await reply.finish("Dạ anh, xong rồi ạ")
+
+    asyncio.run(main())
+    assert clock["slept"] == [pytest.approx(1.5), pytest.approx(5)]
+    assert bot.calls[-1] == ("edit", "Dạ anh, xong rồi ạ")
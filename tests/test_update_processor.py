@@ -0,0 +1,67 @@
+import random
+import asyncio
+from types import SimpleNamespace
+
+from update_processor import ChatOrderedUpdateProcessor
+
+def _update(chat_id):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None)
+
+def test_chats_run_in_order_within_the_concurrency_cap():
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=3)
+    rng = random.Random(3)
+    handled = {chat: [] for chat in range(6)}
+    running = 0
+    peak = 0
+
+    async def handle(chat, n, delay):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        handled[chat].append(n)
+        running -= 1
+
+    async def main():
+        await processor.initialize()
+        tasks = []
+        # Each chat's updates arrive back to back and later ones are quicker, so only the
+        # per-chat lock keeps them in order
+        for chat in handled:
+            for n in range(5):
+                delay = rng.uniform(0.005, 0.01) / (n + 1)
+                tasks.append(asyncio.create_task(processor.process_update(_update(chat), handle(chat, n, delay))))
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert handled == {chat: [0, 1, 2, 3, 4] for chat in range(6)}
+    assert peak == 3
+    assert processor.stats() == {"queue_depth": 0, "max_queue_depth": processor.max_waiting, "running": 0,
+                                 "active_chats": 0, "processed": 30, "concurrency": 3}
+    assert processor.max_waiting > 3
+
+def test_a_waiting_update_can_be_cancelled():
+    processor = ChatOrderedUpdateProcessor(max_concurrent_updates=1)
+    handled = []
+
+    async def handle(n, gate=None):
+        if gate is not None:
+            await gate.wait()
+        handled.append(n)
+
+    async def main():
+        gate = asyncio.Event()
+        await processor.initialize()
+        first = asyncio.create_task(processor.process_update(_update(1), handle(1, gate)))
+        second = asyncio.create_task(processor.process_update(_update(1), handle(2)))
+        await asyncio.sleep(0.01)
+        assert processor.waiting == 1 and processor.running == 1
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        gate.set()
+        await first
+
+    asyncio.run(main())
+    assert handled == [1]
+    assert processor.stats()["active_chats"] == 0 and processor.waiting == 0 and processor.processed == 1
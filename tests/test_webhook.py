@@ -0,0 +1,69 @@
+import json
+import asyncio
+
+import httpx
+
+from webhook import WebhookServer
+
+SECRET = "s3cret"
+UPDATE = {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"},
+                                      "text": "lịch hôm nay"}}
+
+class _Application:
+    bot = None
+
+    def __init__(self):
+        self.updates = []
+        self.release = asyncio.Event()
+
+    async def process_update(self, update):
+        await self.release.wait()
+        self.updates.append(update)
+
+class _Processor:
+    async def process_update(self, update, coroutine):
+        await coroutine
+
+def _run(check, max_pending=10):
+    async def main():
+        application = _Application()
+        server = WebhookServer(application, _Processor(), secret_token=SECRET, max_pending=max_pending)
+        await server.start("127.0.0.1", 0)
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{server.port}") as client:
+                return await check(client, application, server)
+        finally:
+            application.release.set()
+            await server.stop()
+    return asyncio.run(main())
+
+def _post(client, body, secret=SECRET):
+    return client.post("/telegram", content=body, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+
+def test_good_secret_dispatches_the_update():
+    async def check(client, application, server):
+        response = await _post(client, json.dumps(UPDATE))
+        application.release.set()
+        await asyncio.sleep(0.01)
+        return response.status_code, [u.message.text for u in application.updates]
+    assert _run(check) == (200, ["lịch hôm nay"])
+
+def test_wrong_secret_is_refused():
+    async def check(client, application, server):
+        return [(await _post(client, json.dumps(UPDATE), secret)).status_code for secret in ("wrong", "")], server.pending
+    assert _run(check) == ([403, 403], 0)
+
+def test_bad_json_is_refused():
+    async def check(client, application, server):
+        return (await _post(client, b"{not json")).status_code
+    assert _run(check) == 400
+
+def test_full_server_answers_503():
+    async def check(client, application, server):
+        first = await _post(client, json.dumps(UPDATE))
+        second = await _post(client, json.dumps(dict(UPDATE, update_id=2)))
+        application.release.set()
+        await asyncio.sleep(0.01)
+        third = await _post(client, json.dumps(dict(UPDATE, update_id=3)))
+        return first.status_code, second.status_code, third.status_code
+    assert _run(check, max_pending=1) == (200, 503, 200)